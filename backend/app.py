@@ -1,8 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from data_fetcher import DataFetcher
-from models import Fund, FundHolding, Transaction, Watchlist, FundRealtimeData, HoldingProfitHistory, Platform, create_tables, get_db
+from cache import get_cache_stats
+from singleflight import get_flight_stats
+from db_writer import get_writer_stats, retry_db_operation
+from refresh_pipeline import build_realtime_row, refresh_funds, refresh_writer
+from trading_scheduler import trading_hours_only, after_close_only, after_trading_day
+from nav_poller import nav_poller, is_late_publisher, expected_nav_date
+from fetch_engine import fetch_engine
+from portfolio import value_portfolio
+from portfolio_snapshot import portfolio_snapshot
+from valuation_stream import valuation_broker, format_sse, iter_events, VALUATION_FIELDS
+from conditional import conditional_get, touch, history_scope, get_conditional_stats, SCOPE_REALTIME, SCOPE_PORTFOLIO
+from nav_history import save_nav_history, load_nav_history, latest_nav_date, to_columnar
+from compression import init_compression
+from logging_setup import setup_logging, init_request_logging, log_payload
+from metrics import metrics_registry, track_job, job_failed, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from models import Fund, FundHolding, Transaction, Watchlist, FundRealtimeData, HoldingProfitHistory, Platform, create_tables, get_db, db_now
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import decimal
@@ -13,11 +28,8 @@ import os
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 import threading
-from sqlalchemy.exc import OperationalError, IntegrityError
-import random
-from config import DATABASE_URL
-import concurrent.futures
-import traceback
+from sqlalchemy.exc import IntegrityError
+from config import DATABASE_URL, REFRESH_FLUSH_INTERVAL, CONDITIONAL_REALTIME_TTL, CONDITIONAL_HISTORY_TTL, SSE_HEARTBEAT_INTERVAL, SSE_REFRESH_INTERVAL, COMPACT_MIMETYPE
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
@@ -31,40 +43,14 @@ app.config['SQLALCHEMY_POOL_TIMEOUT'] = 30  # 连接超时时间（秒）
 app.config['SQLALCHEMY_POOL_RECYCLE'] = 1800  # 连接回收时间（秒）
 db = SQLAlchemy(app)
 CORS(app)
+# 压缩较大的 JSON 响应（gzip，安装 brotli 后优先使用 brotli）
+init_compression(app)
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('holding_profit.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 配置日志（级别、格式见 config.py），日志由后台线程写入，每个请求带关联ID
+setup_logging()
+init_request_logging(app)
 logger = logging.getLogger(__name__)
 
-# 数据库操作重试装饰器
-def retry_db_operation(max_retries=3, base_delay=0.1):
-    """
-    数据库操作重试装饰器，用于处理数据库锁定和死锁问题
-    """
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except OperationalError as e:
-                    error_msg = str(e)
-                    if ('database is locked' in error_msg or 'deadlock detected' in error_msg) and attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt) + random.uniform(0, 0.1)
-                        logger.warning(f"数据库锁定或死锁，第{attempt + 1}次重试，等待{delay:.2f}秒...")
-                        time.sleep(delay)
-                    else:
-                        logger.error(f"数据库操作失败: {e}")
-                        raise
-        return wrapper
-    return decorator
-
 # 初始化默认平台
 def init_default_platform():
     """
@@ -108,69 +94,88 @@ except Exception as e:
 scheduler = BackgroundScheduler()
 scheduler.start()
 
+# 辅助函数：获取需要定时更新的基金
+def tracked_fund_ids(db: Session) -> dict:
+    """
+    获取所有自选基金和持仓基金
+    :param db: 数据库会话
+    :return: {fund_code: fund_id}
+    """
+    fund_ids = {}
+    for item in db.query(Watchlist).all():
+        if item.fund:
+            fund_ids[item.fund.fund_code] = item.fund.id
+    for holding in db.query(FundHolding).all():
+        if holding.fund:
+            fund_ids[holding.fund.fund_code] = holding.fund.id
+    return fund_ids
+
 # 定时任务：更新所有基金数据
+@track_job
 @retry_db_operation()
 def update_all_funds_data():
     """
     定时任务：更新所有自选基金和持仓基金的实时数据
     """
-    logger.info(f"[{datetime.now()}] 开始更新基金数据...")
+    logger.info("开始更新基金数据...")
     db = next(get_db())
     try:
         # 获取所有需要更新的基金（自选基金 + 持仓基金）
-        watchlist_funds = db.query(Watchlist).all()
-        holding_funds = db.query(FundHolding).all()
+        fund_ids = tracked_fund_ids(db)
 
-        fund_codes = set()
-        for item in watchlist_funds:
-            if item.fund:
-                fund_codes.add(item.fund.fund_code)
-        for holding in holding_funds:
-            if holding.fund:
-                fund_codes.add(holding.fund.fund_code)
+        logger.info("需要更新 %d 个基金的数据", len(fund_ids))
 
-        logger.info(f"需要更新 {len(fund_codes)} 个基金的数据")
+        # 并发获取所有基金数据，抓取线程不共享数据库会话，结果按批次写入
+        stats = refresh_funds(fund_ids)
+        logger.info("基金数据刷新统计: %s", stats)
 
-        # 分批处理基金数据，每批5个
-        fund_codes_list = list(fund_codes)
-        batch_size = 5
-        for i in range(0, len(fund_codes_list), batch_size):
-            batch_codes = fund_codes_list[i:i+batch_size]
-            logger.info(f"处理第 {i//batch_size + 1} 批基金数据，共 {len(batch_codes)} 个基金")
+        logger.info("基金数据更新完成")
+    except Exception as e:
+        logger.exception("定时任务执行失败: %s", e)
+        job_failed()
+    finally:
+        db.close()
 
-            # 使用线程池并发更新
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                # 为每个基金代码创建一个任务
-                future_to_fund = {executor.submit(get_fund_realtime_data, db, fund_code, force_refresh=True, skip_db_write=False): fund_code for fund_code in batch_codes}
+# 添加定时任务：交易时段内每10分钟更新一次（节假日和休市时段不执行）
+scheduler.add_job(trading_hours_only(update_all_funds_data), 'cron', day_of_week='mon-fri', hour='9-15', minute='*/10', id='update_funds_data')
 
-                # 处理完成的任务
-                for future in concurrent.futures.as_completed(future_to_fund, timeout=30):
-                    fund_code = future_to_fund[future]
-                    try:
-                        future.result()
-                        logger.info(f"成功更新基金 {fund_code} 的数据")
-                    except Exception as e:
-                        logger.error(f"更新基金 {fund_code} 数据失败: {e}")
-
-        logger.info(f"[{datetime.now()}] 基金数据更新完成")
-    except Exception as e:
-        logger.error(f"定时任务执行失败: {e}")
-        import traceback
-        traceback.print_exc()
+@track_job
+def refresh_subscribed_valuations():
+    """
+    定时任务：有客户端订阅估值推送时，刷新被订阅基金的实时数据
+    写入后由刷新队列通知推送中心，所有订阅方共享这一次刷新
+    """
+    subscribe_all, codes = valuation_broker.subscribed_codes()
+    if not subscribe_all and not codes:
+        return
+    db = next(get_db())
+    try:
+        if subscribe_all:
+            fund_ids = tracked_fund_ids(db)
+        else:
+            fund_ids = dict(db.query(Fund.fund_code, Fund.id).filter(Fund.fund_code.in_(list(codes))).all())
     finally:
         db.close()
 
-# 添加定时任务：每10分钟更新一次
-scheduler.add_job(update_all_funds_data, 'interval', minutes=10, id='update_funds_data')
+    try:
+        stats = refresh_funds(fund_ids)
+        logger.info("订阅基金估值刷新统计: %s", stats)
+    except Exception as e:
+        logger.error("刷新订阅基金估值失败: %s", e)
+        job_failed()
+
+# 添加定时任务：交易时段内有订阅方时定期刷新被订阅基金的估值
+scheduler.add_job(trading_hours_only(refresh_subscribed_valuations), 'interval', seconds=SSE_REFRESH_INTERVAL, id='refresh_subscribed_valuations', max_instances=1, coalesce=True)
 
 # 定时任务：预加载所有基金的历史净值数据
+@track_job
 @retry_db_operation()
 def preload_all_funds_history():
     """
     定时任务：预加载所有自选基金和持仓基金的历史净值数据到数据库
     每天执行一次，确保历史净值数据已缓存
     """
-    print(f"[{datetime.now()}] 开始预加载基金历史净值数据...")
+    logger.info("开始预加载基金历史净值数据...")
     db = next(get_db())
     try:
         # 获取所有需要预加载的基金（自选基金 + 持仓基金）
@@ -185,7 +190,7 @@ def preload_all_funds_history():
             if holding.fund:
                 fund_codes.add(holding.fund.fund_code)
 
-        print(f"需要预加载 {len(fund_codes)} 个基金的历史净值数据")
+        logger.info("需要预加载 %d 个基金的历史净值数据", len(fund_codes))
 
         # 预加载每个基金的历史净值数据
         for fund_code in fund_codes:
@@ -195,74 +200,173 @@ def preload_all_funds_history():
                     continue
 
                 # 检查是否已有未过期的数据
-                if fund.realtime_data and fund.realtime_data.net_values:
+                if fund.realtime_data and latest_nav_date(db, fund.id):
                     updated_at = fund.realtime_data.updated_at
                     if updated_at:
-                        # 使用当前时间，忽略时区差异
-                        now = datetime.now()
+                        now = db_now()
                         if (now - updated_at.replace(tzinfo=None)) < timedelta(days=1):
-                            print(f"基金 {fund_code} 的历史净值数据已是最新，跳过")
+                            logger.debug("基金 %s 的历史净值数据已是最新，跳过", fund_code)
                             continue
 
-                # 从第三方接口获取历史净值数据
-                history_data = DataFetcher.get_fund_history(fund_code)
-
-                # 保存到数据库
-                if not fund.realtime_data:
-                    fund.realtime_data = FundRealtimeData(fund_id=fund.id)
-                fund.realtime_data.net_values = json.dumps(history_data.get('net_values', []))
-                fund.realtime_data.one_month_rate = history_data.get('one_month_rate', 0)
-                fund.realtime_data.three_month_rate = history_data.get('three_month_rate', 0)
-                fund.realtime_data.one_year_rate = history_data.get('one_year_rate', 0)
-                fund.realtime_data.daily_change_rate = history_data.get('daily_change_rate', 0)
-                fund.realtime_data.fsrq = history_data.get('fsrq', '')
-                fund.realtime_data.unit_net_value = history_data.get('unit_net_value', 0)
-                fund.realtime_data.updated_at = datetime.now()
+                # 从第三方接口增量获取历史净值数据并保存到数据库
+                new_count = sync_fund_history(db, fund)
                 db.commit()
 
-                print(f"成功预加载基金 {fund_code} 的历史净值数据")
+                logger.debug("成功预加载基金 %s 的历史净值数据，新增 %d 条", fund_code, new_count)
             except Exception as e:
-                print(f"预加载基金 {fund_code} 历史净值数据失败: {e}")
+                logger.warning("预加载基金 %s 历史净值数据失败: %s", fund_code, e)
                 db.rollback()
 
-        print(f"[{datetime.now()}] 基金历史净值数据预加载完成")
+        logger.info("基金历史净值数据预加载完成")
     except Exception as e:
-        print(f"预加载任务执行失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("预加载任务执行失败: %s", e)
+        job_failed()
     finally:
         db.close()
 
-# 添加定时任务：每天凌晨2点预加载历史净值数据
-scheduler.add_job(preload_all_funds_history, 'cron', hour=2, minute=0, id='preload_funds_history')
+# 添加定时任务：交易日后的凌晨2点预加载历史净值数据
+scheduler.add_job(after_trading_day(preload_all_funds_history), 'cron', day_of_week='tue-sat', hour=2, minute=0, id='preload_funds_history')
+
+# 辅助函数：保存历史净值数据
+def save_fund_history(db: Session, fund: Fund, history_data: dict):
+    """
+    将历史净值写入 fund_nav_history 表（不提交事务），实时数据表中的涨跌幅和净值交给刷新队列写入
+    :param db: 数据库会话
+    :param fund: 基金对象
+    :param history_data: DataFetcher.get_fund_history 返回的数据
+    """
+    save_nav_history(db, fund.id, history_data.get('net_values', []))
+    touch(db, history_scope(fund.fund_code))
+    refresh_writer.submit({
+        'fund_id': fund.id,
+        'one_month_rate': history_data.get('one_month_rate', 0),
+        'three_month_rate': history_data.get('three_month_rate', 0),
+        'one_year_rate': history_data.get('one_year_rate', 0),
+        'daily_change_rate': history_data.get('daily_change_rate', 0),
+        'fsrq': history_data.get('fsrq', ''),
+        'unit_net_value': history_data.get('unit_net_value', 0)
+    })
+
+def wait_realtime_written():
+    """
+    等待刷新队列写入刚提交的实时数据（最多等待两个凑批周期），之后从数据库读取的涨跌幅是最新的
+    """
+    refresh_writer.flush(timeout=REFRESH_FLUSH_INTERVAL * 2)
+
+# 辅助函数：增量同步历史净值数据
+def sync_fund_history(db: Session, fund: Fund) -> int:
+    """
+    只从第三方接口获取晚于已存储最新日期的历史净值，合并写入数据库（不提交事务）
+    数据库中没有历史净值时获取完整数据
+    :param db: 数据库会话
+    :param fund: 基金对象
+    :return: 新增的净值条数
+    """
+    since_date = latest_nav_date(db, fund.id)
+    history_data = DataFetcher.get_fund_history_since(fund.fund_code, since_date)
+    # 接口获取失败时不覆盖已有的涨跌幅数据
+    if not history_data.get('fsrq') and not history_data.get('net_values'):
+        raise Exception(f"获取基金 {fund.fund_code} 历史净值失败")
+    save_fund_history(db, fund, history_data)
+    return len(history_data.get('net_values', []))
 
-# 辅助函数：判断是否为交易日
-def is_trading_day(fsrq: str) -> bool:
+# 辅助函数：回填完整历史净值数据
+def backfill_fund_history(db: Session, fund: Fund) -> int:
+    """
+    从第三方接口获取基金成立以来的完整历史净值，合并写入数据库（不提交事务）
+    :param db: 数据库会话
+    :param fund: 基金对象
+    :return: 获取到的净值条数
     """
-    判断是否为交易日（通过净值日期判断）
-    :param fsrq: 净值日期，格式为YYYY-MM-DD
-    :return: 是否为交易日
+    history_data = DataFetcher.get_fund_history_full(fund.fund_code)
+    if not history_data.get('net_values'):
+        raise Exception(f"获取基金 {fund.fund_code} 完整历史净值失败")
+    save_fund_history(db, fund, history_data)
+    return len(history_data['net_values'])
+
+# 辅助函数：从数据库组装历史净值数据
+def load_fund_history(db: Session, fund: Fund, start_date: str = None, end_date: str = None) -> dict:
     """
-    if not fsrq:
+    从 fund_nav_history 表读取历史净值，并附加实时数据表中的涨跌幅字段
+    :param db: 数据库会话
+    :param fund: 基金对象
+    :param start_date: 开始日期（包含），格式YYYY-MM-DD
+    :param end_date: 结束日期（包含），格式YYYY-MM-DD
+    :return: 与 DataFetcher.get_fund_history 相同格式的数据
+    """
+    realtime_data = fund.realtime_data
+    return {
+        'fund_code': fund.fund_code,
+        'net_values': load_nav_history(db, fund.id, start_date, end_date),
+        'one_month_rate': realtime_data.one_month_rate or 0 if realtime_data else 0,
+        'three_month_rate': realtime_data.three_month_rate or 0 if realtime_data else 0,
+        'one_year_rate': realtime_data.one_year_rate or 0 if realtime_data else 0,
+        'daily_change_rate': realtime_data.daily_change_rate or 0 if realtime_data else 0,
+        'fsrq': realtime_data.fsrq or '' if realtime_data else '',
+        'unit_net_value': realtime_data.unit_net_value or 0 if realtime_data else 0
+    }
+
+# 辅助函数：按请求的格式输出历史净值数据
+def format_history(history_data: dict) -> dict:
+    """
+    请求紧凑格式时（format=compact 查询参数或 Accept 为 COMPACT_MIMETYPE），
+    将 net_values 转换为按列存储的数值数组；dates=delta 时日期使用差分编码
+    :param history_data: 历史净值数据
+    :return: 输出的历史净值数据
+    """
+    compact = request.args.get('format') == 'compact' or COMPACT_MIMETYPE in request.headers.get('Accept', '')
+    if not compact or not history_data or 'net_values' not in history_data:
+        return history_data
+    delta_dates = request.args.get('dates') == 'delta'
+    return dict(
+        history_data,
+        net_values=to_columnar(history_data['net_values'], delta_dates=delta_dates),
+        net_values_format='columnar'
+    )
+
+# 辅助函数：历史净值响应（按 Accept 协商格式）
+def history_response(history_data: dict):
+    response = jsonify(format_history(history_data))
+    response.vary.add('Accept')
+    return response
+
+# 辅助函数：判断数据库中的历史净值是否未过期（超过1天视为过期）
+def is_history_fresh(db: Session, fund: Fund) -> bool:
+    from datetime import timedelta
+    if not fund or not fund.realtime_data or not latest_nav_date(db, fund.id):
         return False
-    today = datetime.now().strftime('%Y-%m-%d')
-    return fsrq == today
+    updated_at = fund.realtime_data.updated_at
+    return bool(updated_at and (db_now() - updated_at.replace(tzinfo=None)) < timedelta(days=1))
+
+# 辅助函数：获取实时数据的最后更新时间（用于 Last-Modified）
+def realtime_last_modified(fund_code: str = None):
+    """
+    :param fund_code: 基金代码，为空时取所有基金中最新的更新时间
+    :return: 最后更新时间
+    """
+    db = next(get_db())
+    try:
+        query = db.query(func.max(FundRealtimeData.updated_at))
+        if fund_code:
+            query = query.join(Fund, Fund.id == FundRealtimeData.fund_id).filter(Fund.fund_code == fund_code)
+        return query.scalar()
+    finally:
+        db.close()
+
+# 辅助函数：历史净值相关接口的数据范围
+def fund_detail_scopes(fund_code: str):
+    return [SCOPE_REALTIME, SCOPE_PORTFOLIO, history_scope(fund_code)]
 
 # 定时任务：更新持仓收益
+@track_job
 @retry_db_operation()
 def update_holding_profit():
     """
-    定时任务：在交易日晚上7点开始，每10分钟检测一次最新涨幅是否已更新，
-    更新所有持仓基金的持有收益到数据库
+    定时任务：在交易日晚上7点开始检测持仓基金的净值是否已公布，
+    更新所有持仓基金的持有收益到数据库（执行时段由调度器按交易日历控制）
+    已公布的基金当天不再请求，QDII、FOF 等延迟公布的基金按退避间隔轮询，全部公布后不再请求
     """
-    current_time = datetime.now()
-    current_hour = current_time.hour
-
-    # 只在晚上7点到11点之间执行
-    if current_hour < 19 or current_hour >= 23:
-        return
-
-    logger.info(f"开始检查持仓收益更新...")
+    logger.info("开始检查持仓收益更新...")
     db = next(get_db())
     try:
         # 获取所有持仓基金
@@ -271,35 +375,64 @@ def update_holding_profit():
             logger.info("没有持仓基金，跳过更新")
             return
 
-        updated_count = 0
-        skipped_count = 0
-
+        # 按基金分组（同一基金可能在多个平台持有），并确定每个基金当晚应公布的净值日期
+        holdings_by_code = {}
+        late_funds = {}
         for holding in holdings:
-            fund_code = holding.fund.fund_code
+            fund = holding.fund
+            holdings_by_code.setdefault(fund.fund_code, []).append(holding)
+            late_funds[fund.fund_code] = is_late_publisher(fund.fund_name, fund.fund_type)
+        fund_codes = list(holdings_by_code)
+        expected_dates = {code: expected_nav_date(late_funds[code]) for code in fund_codes}
+
+        # 已写入过该净值日期收益记录的基金视为已公布（服务重启后恢复状态）
+        recorded = db.query(HoldingProfitHistory.fund_code, HoldingProfitHistory.fsrq).filter(
+            HoldingProfitHistory.fund_code.in_(fund_codes),
+            HoldingProfitHistory.fsrq.in_(set(expected_dates.values()))
+        ).distinct().all()
+        for fund_code, fsrq in recorded:
+            if fsrq == expected_dates[fund_code]:
+                nav_poller.mark_settled(fund_code, fsrq)
+
+        if nav_poller.all_settled(fund_codes):
+            logger.info("所有持仓基金的净值均已公布，跳过")
+            return
 
-            # 记录更新前的数据
-            old_current_value = holding.current_value
-            old_profit_loss = holding.profit_loss
-            old_profit_loss_rate = holding.profit_loss_rate
+        due_codes = nav_poller.due(fund_codes)
+        if not due_codes:
+            logger.info("未公布净值的基金尚未到轮询时间，跳过")
+            return
 
-            # 获取基金实时数据
-            fund_data = get_fund_realtime_data(db, fund_code, force_refresh=True)
+        # 并发获取最新净值和涨跌幅（跳过缓存）
+        rates = fetch_engine.map(DataFetcher.refresh_fund_history_simple, due_codes)
+
+        updated_count = 0
+        skipped_count = 0
+        # 净值已公布的基金：事务提交成功后才标记为已公布并同步实时数据表，提交失败时下次继续轮询
+        settled = []
+
+        for fund_code in due_codes:
+            late = late_funds[fund_code]
+            fund_data = rates.get(fund_code)
             if not fund_data:
-                logger.warning(f"基金 {fund_code} 数据获取失败，跳过")
+                logger.warning("基金 %s 数据获取失败，跳过", fund_code)
+                nav_poller.mark_pending(fund_code, late)
                 skipped_count += 1
                 continue
 
-            # 检查是否为交易日（fsrq是否为当日）
+            # 检查净值是否已公布（fsrq是否达到应公布的日期）
             fsrq = fund_data.get('fsrq', '')
-            if not is_trading_day(fsrq):
-                logger.info(f"基金 {fund_code} 净值日期 {fsrq} 不是今日，跳过")
+            if not fsrq or fsrq < expected_dates[fund_code]:
+                logger.debug("基金 %s 净值日期 %s 早于 %s，尚未公布，跳过", fund_code, fsrq, expected_dates[fund_code])
+                nav_poller.mark_pending(fund_code, late)
                 skipped_count += 1
                 continue
 
             # 检查最新涨幅是否已更新
             daily_change_rate = fund_data.get('daily_change_rate', '-')
             if daily_change_rate == '-' or daily_change_rate == 0:
-                logger.info(f"基金 {fund_code} 最新涨幅未更新（当前值: {daily_change_rate}），跳过")
+                logger.debug("基金 %s 最新涨幅未更新（当前值: %s），跳过", fund_code, daily_change_rate)
+                nav_poller.mark_pending(fund_code, late)
                 skipped_count += 1
                 continue
 
@@ -307,57 +440,70 @@ def update_holding_profit():
             # 使用份额 × 单位净值来计算当前价值
             unit_net_value = fund_data.get('unit_net_value')
             if not unit_net_value:
-                logger.warning(f"基金 {fund_code} 单位净值未获取到，跳过")
+                logger.warning("基金 %s 单位净值未获取到，跳过", fund_code)
+                nav_poller.mark_pending(fund_code, late)
                 skipped_count += 1
                 continue
 
-            # 新的当前价值 = 份额 × 单位净值
-            new_current_value = holding.shares * float(unit_net_value)
-            new_profit_loss = new_current_value - holding.cost
-
-            # 更新收益率
-            new_profit_loss_rate = 0
-            if holding.cost > 0:
-                new_profit_loss_rate = (new_profit_loss / holding.cost) * 100
-
-            # 更新数据库（添加重试机制）
-            @retry_db_operation(max_retries=5, base_delay=0.2)
-            def update_holding_data():
-                holding.current_value = new_current_value
-                holding.profit_loss = new_profit_loss
-                holding.profit_loss_rate = new_profit_loss_rate
-
-                # 保存历史记录
-                history_record = HoldingProfitHistory(
-                    holding_id=holding.id,
-                    fund_code=fund_code,
-                    cost=holding.cost,
-                    shares=holding.shares,
-                    avg_cost=holding.avg_cost,
-                    current_value=new_current_value,
-                    profit_loss=new_profit_loss,
-                    profit_loss_rate=new_profit_loss_rate,
-                    unit_net_value=float(unit_net_value),
-                    fsrq=fsrq,
-                    daily_change_rate=float(daily_change_rate) if daily_change_rate != '-' else 0
-                )
-                db.add(history_record)
-                db.flush()
+            for holding in holdings_by_code[fund_code]:
+                # 记录更新前的数据
+                old_current_value = holding.current_value or 0
+                old_profit_loss = holding.profit_loss or 0
+                old_profit_loss_rate = holding.profit_loss_rate or 0
 
-            update_holding_data()
+                # 新的当前价值 = 份额 × 单位净值
+                new_current_value = holding.shares * float(unit_net_value)
+                new_profit_loss = new_current_value - holding.cost
 
-            updated_count += 1
+                # 更新收益率
+                new_profit_loss_rate = 0
+                if holding.cost > 0:
+                    new_profit_loss_rate = (new_profit_loss / holding.cost) * 100
 
-            # 记录详细的更新日志
-            logger.info(f"基金 {fund_code} 持有收益已更新:")
-            logger.info(f"  净值日期: {fsrq}")
-            logger.info(f"  单位净值: {unit_net_value}")
-            logger.info(f"  份额: {holding.shares}")
-            logger.info(f"  持仓成本: {holding.cost:.2f}")
-            logger.info(f"  当前价值: {old_current_value:.2f} → {new_current_value:.2f}")
-            logger.info(f"  盈亏金额: {old_profit_loss:.2f} → {new_profit_loss:.2f}")
-            logger.info(f"  盈亏比例: {old_profit_loss_rate:.2f}% → {new_profit_loss_rate:.2f}%")
-            logger.info(f"  日涨跌幅: {daily_change_rate}%")
+                # 更新数据库（添加重试机制）
+                @retry_db_operation(max_retries=5, base_delay=0.2)
+                def update_holding_data():
+                    holding.current_value = new_current_value
+                    holding.profit_loss = new_profit_loss
+                    holding.profit_loss_rate = new_profit_loss_rate
+
+                    # 保存历史记录
+                    history_record = HoldingProfitHistory(
+                        holding_id=holding.id,
+                        fund_code=fund_code,
+                        cost=holding.cost,
+                        shares=holding.shares,
+                        avg_cost=holding.avg_cost,
+                        current_value=new_current_value,
+                        profit_loss=new_profit_loss,
+                        profit_loss_rate=new_profit_loss_rate,
+                        unit_net_value=float(unit_net_value),
+                        fsrq=fsrq,
+                        daily_change_rate=float(daily_change_rate)
+                    )
+                    db.add(history_record)
+                    db.flush()
+
+                update_holding_data()
+
+                updated_count += 1
+
+                # 记录详细的更新日志
+                logger.debug("基金 %s 持有收益已更新: 净值日期 %s, 单位净值 %s, 份额 %s, 持仓成本 %.2f, "
+                             "当前价值 %.2f → %.2f, 盈亏金额 %.2f → %.2f, 盈亏比例 %.2f%% → %.2f%%, 日涨跌幅 %s%%",
+                             fund_code, fsrq, unit_net_value, holding.shares, holding.cost,
+                             old_current_value, new_current_value, old_profit_loss, new_profit_loss,
+                             old_profit_loss_rate, new_profit_loss_rate, daily_change_rate)
+
+            settled.append((fund_code, fsrq, {
+                'fund_id': holdings_by_code[fund_code][0].fund_id,
+                'unit_net_value': float(unit_net_value),
+                'daily_change_rate': fund_data.get('daily_change_rate', 0),
+                'one_month_rate': fund_data.get('one_month_rate', 0),
+                'three_month_rate': fund_data.get('three_month_rate', 0),
+                'one_year_rate': fund_data.get('one_year_rate', 0),
+                'fsrq': fsrq
+            }))
 
         # 提交事务（添加重试机制）
         @retry_db_operation(max_retries=5, base_delay=0.3)
@@ -365,23 +511,27 @@ def update_holding_profit():
             db.commit()
 
         commit_transaction()
-        logger.info(f"持仓收益更新完成: 更新{updated_count}个，跳过{skipped_count}个")
+
+        for fund_code, fsrq, realtime_row in settled:
+            nav_poller.mark_settled(fund_code, fsrq)
+            # 同步更新实时数据表中的净值和涨跌幅
+            refresh_writer.submit(realtime_row)
+        logger.info("持仓收益更新完成: 更新%s个持仓，跳过%s个基金，轮询状态: %s", updated_count, skipped_count, nav_poller.stats())
     except Exception as e:
         db.rollback()
-        logger.error(f"定时任务执行失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("定时任务执行失败: %s", e)
+        job_failed()
     finally:
         db.close()
 
 # 定时任务：更新所有基金的历史净值数据
+@track_job
 @retry_db_operation()
 def update_all_funds_history():
     """
     定时任务：每天更新所有自选基金和持仓基金的历史净值数据
     """
-    import time
-    print(f"[{datetime.now()}] 开始更新基金历史净值数据...")
+    logger.info("开始更新基金历史净值数据...")
     db = next(get_db())
     try:
         # 获取所有需要更新的基金（自选基金 + 持仓基金）
@@ -396,54 +546,40 @@ def update_all_funds_history():
             if holding.fund:
                 fund_codes.add(holding.fund.fund_code)
 
-        print(f"需要更新 {len(fund_codes)} 个基金的历史净值数据")
+        logger.info("需要更新 %d 个基金的历史净值数据", len(fund_codes))
 
         # 更新每个基金的历史净值数据
         for fund_code in fund_codes:
             try:
-                # 强制刷新历史净值数据
-                # 使用天级时间戳确保获取最新数据
-                timestamp = int(time.time() / 86400)
-                history_data = DataFetcher.get_fund_history(fund_code, timestamp)
-
                 # 获取基金对象
                 fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
                 if fund:
-                    # 更新或创建实时数据记录
-                    realtime_data = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id == fund.id).first()
-                    if realtime_data:
-                        realtime_data.net_values = json.dumps(history_data.get('net_values', []))
-                        realtime_data.one_month_rate = history_data.get('one_month_rate', 0)
-                        realtime_data.three_month_rate = history_data.get('three_month_rate', 0)
-                        realtime_data.one_year_rate = history_data.get('one_year_rate', 0)
-                        realtime_data.daily_change_rate = history_data.get('daily_change_rate', 0)
-                        realtime_data.fsrq = history_data.get('fsrq', '')
+                    # 只获取晚于已存储最新日期的历史净值，合并写入
+                    new_count = sync_fund_history(db, fund)
                     db.flush()
-
-                print(f"成功更新基金 {fund_code} 的历史净值数据")
+                    logger.debug("成功更新基金 %s 的历史净值数据，新增 %d 条", fund_code, new_count)
             except Exception as e:
-                print(f"更新基金 {fund_code} 历史净值数据失败: {e}")
+                logger.warning("更新基金 %s 历史净值数据失败: %s", fund_code, e)
 
         # 提交事务
         db.commit()
-        print(f"[{datetime.now()}] 基金历史净值数据更新完成")
+        logger.info("基金历史净值数据更新完成")
     except Exception as e:
         db.rollback()
-        print(f"定时任务执行失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("定时任务执行失败: %s", e)
+        job_failed()
     finally:
         db.close()
 
-# 添加定时任务：每10分钟执行一次持仓收益更新检查
-scheduler.add_job(update_holding_profit, 'interval', minutes=10, id='update_holding_profit')
+# 添加定时任务：交易日收盘后19:00-23:00每2分钟检查一次持仓收益更新（各基金的实际轮询间隔由 nav_poller 控制）
+scheduler.add_job(after_close_only(update_holding_profit), 'cron', day_of_week='mon-fri', hour='19-22', minute='*/2', id='update_holding_profit')
 
-# 添加定时任务：每天凌晨1点更新基金历史净值数据
-scheduler.add_job(update_all_funds_history, 'cron', hour=1, minute=0, id='update_funds_history')
+# 添加定时任务：交易日后的凌晨1点更新基金历史净值数据
+scheduler.add_job(after_trading_day(update_all_funds_history), 'cron', day_of_week='tue-sat', hour=1, minute=0, id='update_funds_history')
 
-print("定时任务已启动：每10分钟更新一次基金数据")
-print("定时任务已启动：每10分钟检查一次持仓收益更新（交易日19:00-23:00）")
-print("定时任务已启动：每天凌晨1点更新基金历史净值数据")
+print("定时任务已启动：交易时段内每10分钟更新一次基金数据")
+print("定时任务已启动：交易日19:00-23:00检查持仓收益更新，净值公布后停止轮询")
+print("定时任务已启动：交易日后的凌晨1点更新基金历史净值数据")
 
 # 应用启动时异步预加载历史净值数据
 def start_preload_history():
@@ -451,14 +587,12 @@ def start_preload_history():
     应用启动时异步预加载所有基金的历史净值数据
     """
     print(f"[{datetime.now()}] 应用启动，开始异步预加载基金历史净值数据...")
-    import traceback
     try:
         print(f"[{datetime.now()}] 调用 preload_all_funds_history...")
         preload_all_funds_history()
         print(f"[{datetime.now()}] 历史净值数据预加载完成")
     except Exception as e:
-        print(f"[{datetime.now()}] 历史净值数据预加载失败: {e}")
-        traceback.print_exc()
+        logger.exception("历史净值数据预加载失败: %s", e)
 
 # 在后台线程中执行预加载，避免阻塞应用启动
 # 添加延迟以确保数据库表已完全创建
@@ -512,32 +646,49 @@ def get_or_create_fund(db: Session, fund_code: str):
                 db.refresh(fund)
     return fund
 
-def get_fund_realtime_rates_batch(db: Session, fund_codes: list, force_refresh=False):
-    """
-    批量并发获取基金实时涨跌幅数据（不获取历史净值数组，用于自选列表）
+def realtime_rates_from_db(fund: Fund, realtime_data: FundRealtimeData) -> dict:
+    """
+    将数据库中的实时数据转换为自选列表使用的涨跌幅数据
+    """
+    return {
+        'fund_code': fund.fund_code,
+        'fund_name': fund.fund_name,
+        'net_value': realtime_data.net_value_date,
+        'unit_net_value': realtime_data.unit_net_value,
+        'estimate_net_value': realtime_data.estimate_net_value,
+        'estimate_change_rate': realtime_data.estimate_change_rate,
+        'estimate_time': realtime_data.estimate_time,
+        'one_month_rate': realtime_data.one_month_rate,
+        'three_month_rate': realtime_data.three_month_rate,
+        'one_year_rate': realtime_data.one_year_rate,
+        'daily_change_rate': realtime_data.daily_change_rate,
+        'fsrq': realtime_data.fsrq,
+        'net_values': []
+    }
+
+def split_realtime_rates(db: Session, fund_codes: list, force_refresh=False):
+    """
+    一次查询加载基金及其实时数据，区分可以直接使用数据库数据的基金和需要刷新的基金
     :param db: 数据库会话
     :param fund_codes: 基金代码列表
     :param force_refresh: 是否强制刷新
-    :return: 基金实时涨跌幅数据字典 {fund_code: data}
+    :return: (fund_rows {fund_code: (fund, realtime_data)}, 需要刷新的基金代码列表, 数据库中的数据 {fund_code: data})
     """
-    import time
-    from datetime import datetime, timedelta
-    if not fund_codes:
-        return {}
-
-    results = {}
-
+    from datetime import timedelta
     # 分离需要刷新的基金和不需要刷新的基金
     funds_to_refresh = []
     funds_from_db = {}
 
+    # 一次查询加载所有基金及其实时数据
+    rows = db.query(Fund, FundRealtimeData).outerjoin(
+        FundRealtimeData, FundRealtimeData.fund_id == Fund.id
+    ).filter(Fund.fund_code.in_(list(set(fund_codes)))).all()
+    fund_rows = {fund.fund_code: (fund, realtime_data) for fund, realtime_data in rows}
+
     for fund_code in fund_codes:
-        fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
-        if not fund:
+        if fund_code not in fund_rows:
             continue
-
-        # 检查数据库中是否有实时数据
-        realtime_data = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id == fund.id).first()
+        fund, realtime_data = fund_rows[fund_code]
 
         # 如果强制刷新或数据不存在或数据过期（超过10分钟）或涨跌幅数据为0，则需要刷新
         need_refresh = force_refresh
@@ -552,7 +703,7 @@ def get_fund_realtime_rates_batch(db: Session, fund_codes: list, force_refresh=F
             # 检查是否过期
             is_expired = False
             if realtime_data.updated_at:
-                now = datetime.now()
+                now = db_now()
                 time_diff = now - realtime_data.updated_at.replace(tzinfo=None)
                 if time_diff > timedelta(minutes=5):
                     is_expired = True
@@ -564,159 +715,144 @@ def get_fund_realtime_rates_batch(db: Session, fund_codes: list, force_refresh=F
             funds_to_refresh.append(fund_code)
         elif realtime_data:
             # 从数据库读取数据
-            funds_from_db[fund_code] = {
-                'fund_code': fund_code,
-                'fund_name': fund.fund_name,
-                'net_value': realtime_data.net_value_date,
-                'unit_net_value': realtime_data.unit_net_value,
-                'estimate_net_value': realtime_data.estimate_net_value,
-                'estimate_change_rate': realtime_data.estimate_change_rate,
-                'estimate_time': realtime_data.estimate_time,
-                'one_month_rate': realtime_data.one_month_rate,
-                'three_month_rate': realtime_data.three_month_rate,
-                'one_year_rate': realtime_data.one_year_rate,
-                'daily_change_rate': realtime_data.daily_change_rate,
-                'fsrq': realtime_data.fsrq,
-                'net_values': []
-            }
+            funds_from_db[fund_code] = realtime_rates_from_db(fund, realtime_data)
         else:
             # 数据库中没有数据，也需要刷新
             funds_to_refresh.append(fund_code)
 
-    # 并发获取需要刷新的基金数据
-    if funds_to_refresh:
-        # 使用分钟级时间戳作为缓存键，每5分钟更新一次
-        cache_key = int(time.time() / (5 * 60))
+    return fund_rows, funds_to_refresh, funds_from_db
 
-        # 并发获取估值数据
-        valuation_data_dict = DataFetcher.get_fund_valuation_batch(funds_to_refresh, cache_key)
-        # 并发获取涨跌幅数据
-        rates_data_dict = DataFetcher.get_fund_rates_batch(funds_to_refresh, cache_key)
-
-        # 处理数据并更新数据库
-        for fund_code in funds_to_refresh:
-            fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
-            if not fund:
-                continue
-
-            fund_data = valuation_data_dict.get(fund_code)
-            rates_data = rates_data_dict.get(fund_code)
-
-            if rates_data:
-                # 准备数据
-                net_value_date = ''
-                if fund_data:
-                    net_value_date = fund_data.get('net_value', '')
-                elif rates_data:
-                    net_value_date = rates_data.get('fsrq', '')
-
-                unit_net_value = None
-                if fund_data and fund_data.get('unit_net_value'):
-                    unit_net_value = float(fund_data.get('unit_net_value'))
-
-                estimate_net_value = None
-                if fund_data and fund_data.get('estimate_net_value'):
-                    estimate_net_value = float(fund_data.get('estimate_net_value'))
-
-                estimate_change_rate = None
-                if fund_data and fund_data.get('estimate_change_rate'):
-                    estimate_change_rate = float(fund_data.get('estimate_change_rate'))
+def build_refreshed_rates(fund: Fund, fund_data: dict, rates_data: dict):
+    """
+    根据第三方接口返回的估值和涨跌幅数据组装自选列表数据和待写入数据库的记录
+    :param fund: 基金对象
+    :param fund_data: 估值数据
+    :param rates_data: 涨跌幅数据
+    :return: (涨跌幅数据, 待写入的实时数据记录，获取失败时为None)
+    """
+    fund_code = fund.fund_code
+    if not rates_data:
+        # API调用失败，返回基本信息
+        return {
+            'fund_code': fund_code,
+            'fund_name': fund.fund_name,
+            'net_value': '',
+            'unit_net_value': None,
+            'estimate_net_value': None,
+            'estimate_change_rate': '-',
+            'estimate_time': '',
+            'one_month_rate': 0,
+            'three_month_rate': 0,
+            'one_year_rate': 0,
+            'daily_change_rate': 0,
+            'fsrq': '',
+            'net_values': []
+        }, None
+
+    # 准备数据
+    net_value_date = ''
+    if fund_data:
+        net_value_date = fund_data.get('net_value', '')
+    elif rates_data:
+        net_value_date = rates_data.get('fsrq', '')
+
+    unit_net_value = None
+    if fund_data and fund_data.get('unit_net_value'):
+        unit_net_value = float(fund_data.get('unit_net_value'))
+
+    estimate_net_value = None
+    if fund_data and fund_data.get('estimate_net_value'):
+        estimate_net_value = float(fund_data.get('estimate_net_value'))
+
+    estimate_change_rate = None
+    if fund_data and fund_data.get('estimate_change_rate'):
+        estimate_change_rate = float(fund_data.get('estimate_change_rate'))
+
+    estimate_time = ''
+    if fund_data:
+        estimate_time = fund_data.get('estimate_time', '')
+
+    data = {
+        'fund_code': fund_code,
+        'fund_name': fund.fund_name,
+        'net_value_date': net_value_date,
+        'unit_net_value': unit_net_value,
+        'estimate_net_value': estimate_net_value,
+        'estimate_change_rate': estimate_change_rate,
+        'estimate_time': estimate_time,
+        'one_month_rate': rates_data.get('one_month_rate', 0),
+        'three_month_rate': rates_data.get('three_month_rate', 0),
+        'one_year_rate': rates_data.get('one_year_rate', 0),
+        'daily_change_rate': rates_data.get('daily_change_rate', 0),
+        'fsrq': rates_data.get('fsrq', '')
+    }
+
+    row = {key: value for key, value in data.items() if key not in ('fund_code', 'fund_name')}
+    row['fund_id'] = fund.id
+
+    result = {
+        'fund_code': fund_code,
+        'fund_name': fund.fund_name,
+        'net_value': data.get('net_value_date', ''),
+        'unit_net_value': data.get('unit_net_value', None),
+        'estimate_net_value': data.get('estimate_net_value', None),
+        'estimate_change_rate': str(data.get('estimate_change_rate', 0)) if data.get('estimate_change_rate') is not None else '-',
+        'estimate_time': data.get('estimate_time', ''),
+        'one_month_rate': data.get('one_month_rate', 0),
+        'three_month_rate': data.get('three_month_rate', 0),
+        'one_year_rate': data.get('one_year_rate', 0),
+        'daily_change_rate': data.get('daily_change_rate', 0),
+        'fsrq': data.get('fsrq', ''),
+        'net_values': []
+    }
+    return result, row
+
+def fetch_realtime_rates(fund_code: str):
+    """
+    获取单个基金的估值和涨跌幅数据（失败处理与批量接口一致）
+    :param fund_code: 基金代码
+    :return: (估值数据, 涨跌幅数据)
+    """
+    return (
+        DataFetcher.get_fund_valuation_batch([fund_code]).get(fund_code),
+        DataFetcher.get_fund_rates_batch([fund_code]).get(fund_code)
+    )
 
-                estimate_time = ''
-                if fund_data:
-                    estimate_time = fund_data.get('estimate_time', '')
+def get_fund_realtime_rates_batch(db: Session, fund_codes: list, force_refresh=False):
+    """
+    批量并发获取基金实时涨跌幅数据（不获取历史净值数组，用于自选列表）
+    :param db: 数据库会话
+    :param fund_codes: 基金代码列表
+    :param force_refresh: 是否强制刷新
+    :return: 基金实时涨跌幅数据字典 {fund_code: data}
+    """
+    if not fund_codes:
+        return {}
 
-                data = {
-                    'fund_code': fund_code,
-                    'fund_name': fund.fund_name,
-                    'net_value_date': net_value_date,
-                    'unit_net_value': unit_net_value,
-                    'estimate_net_value': estimate_net_value,
-                    'estimate_change_rate': estimate_change_rate,
-                    'estimate_time': estimate_time,
-                    'one_month_rate': rates_data.get('one_month_rate', 0),
-                    'three_month_rate': rates_data.get('three_month_rate', 0),
-                    'one_year_rate': rates_data.get('one_year_rate', 0),
-                    'daily_change_rate': rates_data.get('daily_change_rate', 0),
-                    'fsrq': rates_data.get('fsrq', ''),
-                    'net_values': '[]'
-                }
+    results = {}
+    fund_rows, funds_to_refresh, funds_from_db = split_realtime_rates(db, fund_codes, force_refresh)
 
-                # 检查或创建实时数据记录
-                realtime_data = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id == fund.id).first()
+    # 并发获取需要刷新的基金数据
+    if funds_to_refresh:
+        # 并发获取估值数据（DataFetcher内部按交易时段缓存）
+        valuation_data_dict = DataFetcher.get_fund_valuation_batch(funds_to_refresh)
+        # 并发获取涨跌幅数据
+        rates_data_dict = DataFetcher.get_fund_rates_batch(funds_to_refresh)
 
-                if realtime_data:
-                    for key, value in data.items():
-                        if key != 'fund_code' and key != 'fund_name':
-                            setattr(realtime_data, key, value)
-                else:
-                    realtime_data = FundRealtimeData(
-                        fund_id=fund.id,
-                        net_value_date=data['net_value_date'],
-                        unit_net_value=data['unit_net_value'],
-                        estimate_net_value=data['estimate_net_value'],
-                        estimate_change_rate=data['estimate_change_rate'],
-                        estimate_time=data['estimate_time'],
-                        one_month_rate=data['one_month_rate'],
-                        three_month_rate=data['three_month_rate'],
-                        one_year_rate=data['one_year_rate'],
-                        daily_change_rate=data['daily_change_rate'],
-                        fsrq=data['fsrq'],
-                        net_values=data['net_values']
-                    )
-                    db.add(realtime_data)
+        # 待写回数据库的记录
+        rows_to_write = []
 
-                # 添加死锁处理和重试机制
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        db.flush()
-                        db.refresh(realtime_data)
-                        break
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            print(f"数据库更新失败，第{attempt + 1}次重试... 错误: {e}")
-                            db.rollback()
-                            import time
-                            time.sleep(0.1 * (attempt + 1))
-                        else:
-                            print(f"数据库更新失败，已达到最大重试次数{max_retries}次。错误: {e}")
-                            db.rollback()
-                            raise
+        # 处理数据
+        for fund_code in funds_to_refresh:
+            fund, realtime_data = fund_rows[fund_code]
+            result, row = build_refreshed_rates(fund, valuation_data_dict.get(fund_code), rates_data_dict.get(fund_code))
+            results[fund_code] = result
+            if row:
+                rows_to_write.append(row)
 
-                # 添加到结果
-                results[fund_code] = {
-                    'fund_code': fund_code,
-                    'fund_name': fund.fund_name,
-                    'net_value': data.get('net_value_date', ''),
-                    'unit_net_value': data.get('unit_net_value', None),
-                    'estimate_net_value': data.get('estimate_net_value', None),
-                    'estimate_change_rate': str(data.get('estimate_change_rate', 0)) if data.get('estimate_change_rate') is not None else '-',
-                    'estimate_time': data.get('estimate_time', ''),
-                    'one_month_rate': data.get('one_month_rate', 0),
-                    'three_month_rate': data.get('three_month_rate', 0),
-                    'one_year_rate': data.get('one_year_rate', 0),
-                    'daily_change_rate': data.get('daily_change_rate', 0),
-                    'fsrq': data.get('fsrq', ''),
-                    'net_values': []
-                }
-            else:
-                # API调用失败，返回基本信息
-                results[fund_code] = {
-                    'fund_code': fund_code,
-                    'fund_name': fund.fund_name,
-                    'net_value': '',
-                    'unit_net_value': None,
-                    'estimate_net_value': None,
-                    'estimate_change_rate': '-',
-                    'estimate_time': '',
-                    'one_month_rate': 0,
-                    'three_month_rate': 0,
-                    'one_year_rate': 0,
-                    'daily_change_rate': 0,
-                    'fsrq': '',
-                    'net_values': []
-                }
+        # 刷新的记录交给写入队列批量写入（写入失败不影响返回API数据）
+        if rows_to_write:
+            refresh_writer.submit_many(rows_to_write)
 
     # 合并数据库中的数据
     results.update(funds_from_db)
@@ -731,7 +867,6 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
     :param force_refresh: 是否强制刷新
     :return: 基金实时涨跌幅数据字典
     """
-    from datetime import datetime, timedelta
     fund = None
     realtime_data = None
 
@@ -741,7 +876,7 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
         if fund:
             realtime_data = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id == fund.id).first()
     except Exception as e:
-        print(f"数据库查询失败: {e}")
+        logger.warning("数据库查询失败: %s", e)
 
     # 如果强制刷新或数据不存在或数据过期（超过10分钟），则从API获取
     need_refresh = force_refresh
@@ -750,12 +885,10 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
 
     # 无论是否有数据库数据，都尝试从API获取数据
     # 因为数据库可能连接失败，或者数据过期
-    cache_key = int(time.time() / (5 * 60))
-    print(f"获取基金 {fund_code} 数据，缓存键: {cache_key}")
-    fund_data = DataFetcher.get_fund_valuation(fund_code, cache_key)
-    print(f"基金 {fund_code} 估值数据: {fund_data}")
-    rates_data = DataFetcher.get_fund_rates(fund_code, cache_key)
-    print(f"基金 {fund_code} 涨跌幅数据: {rates_data}")
+    fund_data = DataFetcher.get_fund_valuation(fund_code)
+    log_payload(logger, f"基金 {fund_code} 估值数据", fund_data)
+    rates_data = DataFetcher.get_fund_rates(fund_code)
+    log_payload(logger, f"基金 {fund_code} 涨跌幅数据", rates_data)
 
     # 只要有数据，就处理
     if fund_data or rates_data:
@@ -773,60 +906,15 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
             'three_month_rate': rates_data.get('three_month_rate', 0) if rates_data else 0,
             'one_year_rate': rates_data.get('one_year_rate', 0) if rates_data else 0,
             'daily_change_rate': rates_data.get('daily_change_rate', 0) if rates_data else 0,
-            'fsrq': rates_data.get('fsrq', '') if rates_data else '',
-            'net_values': '[]'  # 不存储历史净值数组
+            'fsrq': rates_data.get('fsrq', '') if rates_data else ''
         }
-        print(f"准备更新基金 {fund_code} 数据: {data}")
+        log_payload(logger, f"准备更新基金 {fund_code} 数据", data)
 
-        # 尝试更新或创建数据库记录（添加重试机制）
-        try:
-            if fund:
-                @retry_db_operation(max_retries=5, base_delay=0.2)
-                def update_realtime_data():
-                    import time
-                    if realtime_data:
-                        for key, value in data.items():
-                            if key != 'fund_code' and key != 'fund_name':
-                                setattr(realtime_data, key, value)
-                    else:
-                        new_realtime_data = FundRealtimeData(
-                            fund_id=fund.id,
-                            net_value_date=data['net_value_date'],
-                            unit_net_value=data['unit_net_value'],
-                            estimate_net_value=data['estimate_net_value'],
-                            estimate_change_rate=data['estimate_change_rate'],
-                            estimate_time=data['estimate_time'],
-                            one_month_rate=data['one_month_rate'],
-                            three_month_rate=data['three_month_rate'],
-                            one_year_rate=data['one_year_rate'],
-                            daily_change_rate=data['daily_change_rate'],
-                            fsrq=data['fsrq'],
-                            net_values=data['net_values']
-                        )
-                        db.add(new_realtime_data)
-                        return new_realtime_data
-                    # 添加死锁处理和重试机制
-                    max_retries = 3
-                    for attempt in range(max_retries):
-                        try:
-                            db.flush()
-                            db.refresh(realtime_data)
-                            break
-                        except Exception as e:
-                            if attempt < max_retries - 1:
-                                print(f"数据库更新失败，第{attempt + 1}次重试... 错误: {e}")
-                                db.rollback()
-                                time.sleep(0.1 * (attempt + 1))
-                            else:
-                                print(f"数据库更新失败，已达到最大重试次数{max_retries}次。错误: {e}")
-                                db.rollback()
-                                raise
-                    return realtime_data
-
-                realtime_data = update_realtime_data()
-        except Exception as e:
-            print(f"数据库操作失败，继续返回API数据: {e}")
-            # 数据库操作失败，仍然返回API数据
+        # 交给写入队列更新或创建数据库记录（写入失败仍然返回API数据）
+        if fund:
+            row = {key: value for key, value in data.items() if key not in ('fund_code', 'fund_name')}
+            row['fund_id'] = fund.id
+            refresh_writer.submit(row)
 
         # 返回API数据
         result = {
@@ -844,13 +932,13 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
             'fsrq': data.get('fsrq', ''),
             'net_values': []
         }
-        print(f"基金 {fund_code} 返回API数据: {result}")
+        log_payload(logger, f"基金 {fund_code} 返回API数据", result)
         return result
     else:
         # API调用失败，尝试返回数据库中的旧数据（如果有）
         if fund and realtime_data:
             # 返回数据库中的旧数据
-            print(f"基金 {fund_code} API调用失败，返回数据库旧数据")
+            logger.warning("基金 %s API调用失败，返回数据库旧数据", fund_code)
             return {
                 'fund_code': fund_code,
                 'fund_name': fund.fund_name,
@@ -868,7 +956,7 @@ def get_fund_realtime_rates(db: Session, fund_code: str, force_refresh=False):
             }
         else:
             # 如果数据库中也没有数据，返回基本信息
-            print(f"基金 {fund_code} API调用失败，返回默认数据")
+            logger.warning("基金 %s API调用失败，返回默认数据", fund_code)
             return {
                 'fund_code': fund_code,
                 'fund_name': fund.fund_name if fund else fund_code,
@@ -896,7 +984,7 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
     :param skip_db_write: 是否跳过数据库写入操作（默认False）
     :return: 基金实时数据字典
     """
-    from datetime import datetime, timedelta
+    from datetime import timedelta
     fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
     if not fund:
         return None
@@ -911,16 +999,14 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
     if not need_refresh and realtime_data:
         # 检查数据是否过期（10分钟）
         if realtime_data.updated_at:
-            # 使用带有时区信息的当前时间
-            now = datetime.now()
-            # 直接比较，忽略时区差异
+            now = db_now()
             time_diff = now - realtime_data.updated_at.replace(tzinfo=None)
             if time_diff > timedelta(minutes=5):
                 need_refresh = True
 
     if need_refresh:
         # 从API获取数据
-        fund_data = DataFetcher.get_fund_valuation(fund_code, int(time.time()))
+        fund_data = DataFetcher.get_fund_valuation(fund_code)
 
         # 只在需要时获取历史数据
         if need_history_data:
@@ -934,73 +1020,22 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
         # 即使fund_data为None，只要history_data有数据，就处理
         if history_data:
             # 准备数据
-            data = {
-                'fund_code': fund_code,
-                'fund_name': fund.fund_name,
-                'net_value_date': fund_data.get('net_value') if fund_data else history_data.get('fsrq', ''),
-                'unit_net_value': float(fund_data.get('unit_net_value', 0)) if fund_data and fund_data.get('unit_net_value') else (float(history_data.get('unit_net_value', 0)) if history_data and history_data.get('unit_net_value') else None),
-                'estimate_net_value': float(fund_data.get('estimate_net_value', 0)) if fund_data and fund_data.get('estimate_net_value') else None,
-                'estimate_change_rate': float(fund_data.get('estimate_change_rate', 0)) if fund_data and fund_data.get('estimate_change_rate') else None,
-                'estimate_time': fund_data.get('estimate_time', '') if fund_data else '',
-                'one_month_rate': history_data.get('one_month_rate', 0),
-                'three_month_rate': history_data.get('three_month_rate', 0),
-                'one_year_rate': history_data.get('one_year_rate', 0),
-                'daily_change_rate': history_data.get('daily_change_rate', 0),
-                'fsrq': history_data.get('fsrq', '')
-            }
-
-            # 只有需要完整历史数据时才更新 net_values，否则保留数据库中的值
-            if need_history_data:
-                data['net_values'] = json.dumps(history_data.get('net_values', []))
-            elif realtime_data and realtime_data.net_values:
-                # 不需要完整历史数据但数据库中有值时，保留原值
-                data['net_values'] = realtime_data.net_values
-            else:
-                # 数据库中也没有值时，设置为空数组
-                data['net_values'] = json.dumps([])
+            data = build_realtime_row(fund_code, fund_data, history_data)
 
-            # 更新或创建数据库记录
+            # 更新或创建数据库记录（实时数据交给写入队列，历史净值由调用方提交事务）
             if not skip_db_write:
-                if realtime_data:
-                    for key, value in data.items():
-                        if key != 'fund_code' and key != 'fund_name':
-                            # 只有需要完整历史数据时才更新 net_values
-                            if key == 'net_values' and not need_history_data:
-                                continue
-                            setattr(realtime_data, key, value)
-                else:
-                    realtime_data = FundRealtimeData(
-                        fund_id=fund.id,
-                        net_value_date=data['net_value_date'],
-                        unit_net_value=data['unit_net_value'],
-                        estimate_net_value=data['estimate_net_value'],
-                        estimate_change_rate=data['estimate_change_rate'],
-                        estimate_time=data['estimate_time'],
-                        one_month_rate=data['one_month_rate'],
-                        three_month_rate=data['three_month_rate'],
-                        one_year_rate=data['one_year_rate'],
-                        daily_change_rate=data['daily_change_rate'],
-                        fsrq=data['fsrq'],
-                        net_values=data['net_values']
-                    )
-                    db.add(realtime_data)
-
-                # 添加死锁处理和重试机制
-                max_retries = 3
-                for attempt in range(max_retries):
+                row = {key: value for key, value in data.items() if key != 'fund_code'}
+                row['fund_id'] = fund.id
+                refresh_writer.submit(row)
+                # 只有需要完整历史数据时才写入历史净值表
+                if need_history_data:
                     try:
-                        db.flush()
-                        db.refresh(realtime_data)
-                        break
+                        save_nav_history(db, fund.id, history_data.get('net_values', []))
+                        touch(db, history_scope(fund_code))
                     except Exception as e:
-                        if attempt < max_retries - 1:
-                            print(f"数据库更新失败，第{attempt + 1}次重试... 错误: {e}")
-                            db.rollback()
-                            time.sleep(0.1 * (attempt + 1))
-                        else:
-                            print(f"数据库更新失败，已达到最大重试次数{max_retries}次。错误: {e}")
-                            db.rollback()
-                            raise
+                        logger.error("数据库更新失败: %s", e)
+                        db.rollback()
+                        raise
         else:
             # API调用失败，返回数据库中的旧数据（如果有）
             if not realtime_data:
@@ -1052,8 +1087,7 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
             'three_month_rate': realtime_data.three_month_rate,
             'one_year_rate': realtime_data.one_year_rate,
             'daily_change_rate': realtime_data.daily_change_rate,
-            'fsrq': realtime_data.fsrq,
-            'net_values': json.loads(realtime_data.net_values) if realtime_data.net_values else []
+            'fsrq': realtime_data.fsrq
         }
 
     # 返回格式化的数据
@@ -1072,7 +1106,7 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
             'one_year_rate': data.get('one_year_rate', 0),
             'daily_change_rate': data.get('daily_change_rate', 0),
             'fsrq': data.get('fsrq', ''),
-            'net_values': json.loads(data.get('net_values', '[]'))
+            'net_values': history_data.get('net_values', []) if need_history_data and history_data else []
         }
     else:
         # 否则使用realtime_data
@@ -1089,7 +1123,7 @@ def get_fund_realtime_data(db: Session, fund_code: str, force_refresh=False, nee
             'one_year_rate': realtime_data.one_year_rate if realtime_data else 0,
             'daily_change_rate': realtime_data.daily_change_rate if realtime_data else 0,
             'fsrq': realtime_data.fsrq if realtime_data else '',
-            'net_values': json.loads(realtime_data.net_values) if realtime_data and realtime_data.net_values else []
+            'net_values': load_nav_history(db, fund.id) if need_history_data and realtime_data else []
         }
 
 # 辅助函数：计算持仓信息
@@ -1137,14 +1171,14 @@ def get_fund_detail(fund_code):
         # 获取基金估值数据
         fund_data = DataFetcher.get_fund_valuation(fund_code)
     except Exception as e:
-        print(f"获取基金估值失败: {e}")
+        logger.warning("获取基金估值失败: %s", e)
         fund_data = None
 
     try:
         # 获取基金历史净值和涨跌幅数据
         history_data = DataFetcher.get_fund_history(fund_code)
     except Exception as e:
-        print(f"获取基金历史数据失败: {e}")
+        logger.warning("获取基金历史数据失败: %s", e)
         history_data = None
 
     # 即使估值数据不可用，只要有历史数据，就返回数据
@@ -1168,7 +1202,7 @@ def get_fund_detail(fund_code):
         holdings = DataFetcher.get_fund_holding(fund_code)
         fund_data['holdings'] = holdings
     except Exception as e:
-        print(f"获取基金重仓股失败: {e}")
+        logger.warning("获取基金重仓股失败: %s", e)
         fund_data['holdings'] = []
 
     # 添加历史数据
@@ -1182,68 +1216,72 @@ def get_fund_detail(fund_code):
     return jsonify(fund_data)
 
 @app.route('/api/fund/<fund_code>/history', methods=['GET'])
+@conditional_get('fund_history', fund_detail_scopes, CONDITIONAL_HISTORY_TTL, last_modified=realtime_last_modified)
 def get_fund_history(fund_code):
     """
     获取基金历史净值数据
     优先从数据库读取，如果没有或数据过期则从第三方接口获取
+    支持 start、end 查询参数（YYYY-MM-DD）按日期范围读取
     :param fund_code: 基金代码
     :return: 历史净值数据和近1个月涨幅
     """
-    from datetime import datetime, timedelta
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
     db = next(get_db())
+    fund = None
     try:
         # 先尝试从数据库获取
         fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
-        if fund and fund.realtime_data and fund.realtime_data.net_values:
-            # 检查数据是否过期（超过1天）
-            updated_at = fund.realtime_data.updated_at
-            if updated_at and (datetime.now() - updated_at.replace(tzinfo=None)) < timedelta(days=1):
-                # 数据未过期，直接返回数据库中的数据
-                net_values = json.loads(fund.realtime_data.net_values) if fund.realtime_data.net_values else []
-                return jsonify({
-                    'fund_code': fund_code,
-                    'net_values': net_values,
-                    'one_month_rate': fund.realtime_data.one_month_rate or 0,
-                    'three_month_rate': fund.realtime_data.three_month_rate or 0,
-                    'one_year_rate': fund.realtime_data.one_year_rate or 0,
-                    'daily_change_rate': fund.realtime_data.daily_change_rate or 0,
-                    'fsrq': fund.realtime_data.fsrq or '',
-                    'unit_net_value': fund.realtime_data.unit_net_value or 0
-                })
+        if is_history_fresh(db, fund):
+            # 数据未过期，直接返回数据库中的数据
+            return history_response(load_fund_history(db, fund, start_date, end_date))
 
-        # 数据不存在或已过期，从第三方接口获取
-        history_data = DataFetcher.get_fund_history(fund_code)
-
-        # 保存到数据库
+        # 数据不存在或已过期，从第三方接口增量获取并合并到数据库
         if fund:
-            if not fund.realtime_data:
-                fund.realtime_data = FundRealtimeData(fund_id=fund.id)
-            fund.realtime_data.net_values = json.dumps(history_data.get('net_values', []))
-            fund.realtime_data.one_month_rate = history_data.get('one_month_rate', 0)
-            fund.realtime_data.three_month_rate = history_data.get('three_month_rate', 0)
-            fund.realtime_data.one_year_rate = history_data.get('one_year_rate', 0)
-            fund.realtime_data.daily_change_rate = history_data.get('daily_change_rate', 0)
-            fund.realtime_data.fsrq = history_data.get('fsrq', '')
-            fund.realtime_data.unit_net_value = history_data.get('unit_net_value', 0)
-            fund.realtime_data.updated_at = datetime.now()
+            sync_fund_history(db, fund)
             db.commit()
+            wait_realtime_written()
+            return history_response(load_fund_history(db, fund, start_date, end_date))
 
-        return jsonify(history_data)
+        return history_response(DataFetcher.get_fund_history(fund_code))
     except Exception as e:
-        logger.error(f"获取基金历史净值失败: {e}")
+        logger.error("获取基金历史净值失败: %s", e)
+        db.rollback()
         # 如果出错，尝试返回数据库中的旧数据（如果有）
-        if fund and fund.realtime_data and fund.realtime_data.net_values:
-            net_values = json.loads(fund.realtime_data.net_values) if fund.realtime_data.net_values else []
-            return jsonify({
-                'fund_code': fund_code,
-                'net_values': net_values,
-                'one_month_rate': fund.realtime_data.one_month_rate or 0,
-                'three_month_rate': fund.realtime_data.three_month_rate or 0,
-                'one_year_rate': fund.realtime_data.one_year_rate or 0,
-                'daily_change_rate': fund.realtime_data.daily_change_rate or 0,
-                'fsrq': fund.realtime_data.fsrq or '',
-                'unit_net_value': fund.realtime_data.unit_net_value or 0
-            })
+        if fund and fund.realtime_data and latest_nav_date(db, fund.id):
+            return history_response(load_fund_history(db, fund, start_date, end_date))
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@app.route('/api/fund/<fund_code>/history/backfill', methods=['POST'])
+def backfill_history(fund_code):
+    """
+    回填基金完整历史净值（不受500条限制），用于长周期收益和回撤图表
+    :param fund_code: 基金代码
+    :return: 回填结果
+    """
+    import time
+    db = next(get_db())
+    try:
+        fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
+        if not fund:
+            return jsonify({'error': '基金不存在'}), 404
+
+        start = time.time()
+        count = backfill_fund_history(db, fund)
+        db.commit()
+        logger.info("基金 %s 完整历史净值回填完成，共 %s 条", fund_code, count)
+
+        return jsonify({
+            'success': True,
+            'fund_code': fund_code,
+            'count': count,
+            'elapsed': round(time.time() - start, 2)
+        })
+    except Exception as e:
+        logger.error("回填基金 %s 历史净值失败: %s", fund_code, e)
+        db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         db.close()
@@ -1268,17 +1306,17 @@ def trigger_preload_history():
             'message': '历史净值预加载任务已启动，请在后台查看进度'
         })
     except Exception as e:
-        logger.error(f"启动预加载任务失败: {e}")
+        logger.error("启动预加载任务失败: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/fund/<fund_code>/complete', methods=['GET'])
+@conditional_get('fund_complete', fund_detail_scopes, CONDITIONAL_HISTORY_TTL, last_modified=realtime_last_modified)
 def get_fund_complete_info(fund_code):
     """
     获取基金完整信息，包括基本信息、历史净值和交易记录
     :param fund_code: 基金代码
     :return: 基金完整信息
     """
-    from datetime import datetime, timedelta
     db = next(get_db())
     try:
         # 并行获取数据
@@ -1302,52 +1340,26 @@ def get_fund_complete_info(fund_code):
             """获取基金历史净值"""
             # 先尝试从数据库获取
             fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
-            if fund and fund.realtime_data and fund.realtime_data.net_values:
-                # 检查数据是否过期（超过1天）
-                updated_at = fund.realtime_data.updated_at
-                net_values = json.loads(fund.realtime_data.net_values) if fund.realtime_data.net_values else []
-
-                # 检查数据是否过期或者 net_values 为空数组
-                data_is_valid = (
-                    updated_at and
-                    (datetime.now() - updated_at.replace(tzinfo=None)) < timedelta(days=1) and
-                    len(net_values) > 0
-                )
-
-                if data_is_valid:
-                    # 数据未过期且 net_values 不为空，直接返回数据库中的数据
-                    return {
-                        'fund_code': fund_code,
-                        'net_values': net_values,
-                        'one_month_rate': fund.realtime_data.one_month_rate or 0,
-                        'three_month_rate': fund.realtime_data.three_month_rate or 0,
-                        'one_year_rate': fund.realtime_data.one_year_rate or 0,
-                        'daily_change_rate': fund.realtime_data.daily_change_rate or 0,
-                        'fsrq': fund.realtime_data.fsrq or '',
-                        'unit_net_value': fund.realtime_data.unit_net_value or 0
-                    }
+            if is_history_fresh(db, fund):
+                # 数据未过期，直接返回数据库中的数据
+                return load_fund_history(db, fund)
 
-            # 数据不存在、已过期或 net_values 为空，从第三方接口获取
-            logger.info(f"从第三方接口获取基金 {fund_code} 的历史数据")
-            history_data = DataFetcher.get_fund_history(fund_code)
-            logger.info(f"从第三方获取到的历史数据中 net_values 数量: {len(history_data.get('net_values', []))}")
+            # 数据不存在或已过期，从第三方接口增量获取
+            logger.debug("从第三方接口获取基金 %s 的历史数据", fund_code)
+            if not fund:
+                return DataFetcher.get_fund_history(fund_code)
 
-            # 保存到数据库
-            if fund:
-                if not fund.realtime_data:
-                    fund.realtime_data = FundRealtimeData(fund_id=fund.id)
-                fund.realtime_data.net_values = json.dumps(history_data.get('net_values', []))
-                fund.realtime_data.one_month_rate = history_data.get('one_month_rate', 0)
-                fund.realtime_data.three_month_rate = history_data.get('three_month_rate', 0)
-                fund.realtime_data.one_year_rate = history_data.get('one_year_rate', 0)
-                fund.realtime_data.daily_change_rate = history_data.get('daily_change_rate', 0)
-                fund.realtime_data.fsrq = history_data.get('fsrq', '')
-                fund.realtime_data.unit_net_value = history_data.get('unit_net_value', 0)
-                fund.realtime_data.updated_at = datetime.now()
+            try:
+                new_count = sync_fund_history(db, fund)
                 db.commit()
-                logger.info(f"已保存基金 {fund_code} 的历史数据到数据库，net_values 数量: {len(history_data.get('net_values', []))}")
+                wait_realtime_written()
+                logger.info("已保存基金 %s 的历史数据到数据库，新增 net_values 数量: %s", fund_code, new_count)
+            except Exception as e:
+                # 获取失败时返回数据库中已有的数据
+                logger.error("同步基金 %s 历史净值失败: %s", fund_code, e)
+                db.rollback()
 
-            return history_data
+            return load_fund_history(db, fund)
 
         def get_transactions():
             """获取基金交易记录"""
@@ -1386,13 +1398,15 @@ def get_fund_complete_info(fund_code):
         # 构建响应
         response = {
             'fund_info': basic_info,
-            'history_data': history_data,
+            'history_data': format_history(history_data),
             'transactions': transactions
         }
 
-        return jsonify(response)
+        response = jsonify(response)
+        response.vary.add('Accept')
+        return response
     except Exception as e:
-        logger.error(f"获取基金完整信息失败: {e}")
+        logger.error("获取基金完整信息失败: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         db.close()
@@ -1418,115 +1432,124 @@ def add_fund():
     finally:
         db.close()
 
+# 辅助函数：自选列表中展示的基金
+def watchlist_entries(db: Session) -> list:
+    """
+    获取自选列表中展示的基金：自选基金，以及不在自选列表中的持仓基金（标签为空）
+    :param db: 数据库会话
+    :return: [(基金对象, 标签)]
+    """
+    entries = []
+    seen_fund_ids = set()
+    for item in db.query(Watchlist).all():
+        if item.fund and item.fund.id not in seen_fund_ids:
+            entries.append((item.fund, item.tags))
+            seen_fund_ids.add(item.fund.id)
+
+    for holding in db.query(FundHolding).all():
+        if holding.fund.id not in seen_fund_ids:
+            entries.append((holding.fund, ''))
+            seen_fund_ids.add(holding.fund.id)
+    return entries
+
+# 辅助函数：数据获取失败时自选列表返回的基本信息
+def basic_watchlist_data(fund: Fund, tags: str) -> dict:
+    return {
+        'fund_code': fund.fund_code,
+        'fund_name': fund.fund_name,
+        'net_value': '',
+        'unit_net_value': '',
+        'estimate_net_value': '',
+        'estimate_change_rate': None,
+        'estimate_time': '',
+        'one_month_rate': 0,
+        'three_month_rate': 0,
+        'one_year_rate': 0,
+        'daily_change_rate': '-',
+        'tags': tags
+    }
+
+def stream_watchlist():
+    """
+    以 NDJSON 流式返回自选列表
+    先立即输出数据库中已有的数据（source 为 cache，需要刷新的标记 stale），
+    再按第三方接口完成的顺序逐条输出刷新后的数据（source 为 refresh），最后输出一行 done
+    每行格式：{"event": "row", "source": ..., "stale": ..., "fund": {...}} 或 {"event": "done", ...}
+    :return: 流式响应
+    """
+    def dumps(payload):
+        return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
+
+    def generate():
+        start = time.time()
+        db = next(get_db())
+        try:
+            entries = watchlist_entries(db)
+            fund_rows, funds_to_refresh, funds_from_db = split_realtime_rates(db, [fund.fund_code for fund, tags in entries])
+        finally:
+            # 数据库会话在等待第三方接口前关闭
+            db.close()
+
+        tags_by_code = {fund.fund_code: tags for fund, tags in entries}
+        refresh_codes = set(funds_to_refresh)
+        for fund, tags in entries:
+            realtime_data = fund_rows[fund.fund_code][1]
+            if not realtime_data:
+                continue
+            fund_data = funds_from_db.get(fund.fund_code) or realtime_rates_from_db(fund, realtime_data)
+            fund_data['tags'] = tags
+            yield dumps({'event': 'row', 'source': 'cache', 'stale': fund.fund_code in refresh_codes, 'fund': fund_data})
+
+        refreshed = 0
+        for fund_code, (valuation_data, rates_data) in fetch_engine.imap(fetch_realtime_rates, funds_to_refresh):
+            fund = fund_rows[fund_code][0]
+            fund_data, row = build_refreshed_rates(fund, valuation_data, rates_data)
+            if row:
+                refresh_writer.submit(row)
+                refreshed += 1
+            elif fund_rows[fund_code][1]:
+                # 刷新失败且已输出过数据库中的数据，保留旧数据
+                continue
+            fund_data['tags'] = tags_by_code[fund_code]
+            yield dumps({'event': 'row', 'source': 'refresh', 'stale': False, 'fund': fund_data})
+
+        yield dumps({
+            'event': 'done',
+            'count': len(entries),
+            'refreshed': refreshed,
+            'elapsed': round(time.time() - start, 3)
+        })
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/watchlist', methods=['GET', 'POST', 'DELETE'])
+@conditional_get('watchlist', [SCOPE_REALTIME, SCOPE_PORTFOLIO], CONDITIONAL_REALTIME_TTL, last_modified=realtime_last_modified)
 def manage_watchlist():
     """
     管理自选基金
     """
-    from datetime import datetime
     db = next(get_db())
     try:
         if request.method == 'GET':
-            # 获取自选基金列表
-            watchlist = db.query(Watchlist).all()
-            funds = []
-
-            # 收集所有自选基金的fund_code
-            watchlist_fund_codes = []
-            watchlist_fund_ids = set()
+            if request.args.get('stream'):
+                return stream_watchlist()
 
-            for item in watchlist:
-                if item.fund:
-                    watchlist_fund_codes.append(item.fund.fund_code)
-                    watchlist_fund_ids.add(item.fund.id)
+            # 自选基金在前，不在自选列表中的持仓基金在后
+            entries = watchlist_entries(db)
 
-            # 构建返回结果
-            import time
-            # 使用批量并发方法获取所有自选基金数据
-            funds_data_dict = get_fund_realtime_rates_batch(db, watchlist_fund_codes, force_refresh=False)
-
-            today = datetime.now().strftime('%Y-%m-%d')
-
-            for item in watchlist:
-                if not item.fund:
-                    continue
-
-                fund_code = item.fund.fund_code
-                fund_data = funds_data_dict.get(fund_code)
+            # 使用批量并发方法获取所有基金数据
+            funds_data_dict = get_fund_realtime_rates_batch(db, [fund.fund_code for fund, tags in entries], force_refresh=False)
 
+            funds = []
+            for fund, tags in entries:
+                fund_data = funds_data_dict.get(fund.fund_code)
                 if fund_data:
-                    fund_data['tags'] = item.tags
+                    fund_data['tags'] = tags
                     # 保留估算数据，无论净值日期是否为今天
                     funds.append(fund_data)
                 else:
                     # 即使数据获取失败，也要返回基本信息
-                    basic_fund_data = {
-                        'fund_code': fund_code,
-                        'fund_name': item.fund.fund_name,
-                        'net_value': '',
-                        'unit_net_value': '',
-                        'estimate_net_value': '',
-                        'estimate_change_rate': None,
-                        'estimate_time': '',
-                        'one_month_rate': 0,
-                        'three_month_rate': 0,
-                        'one_year_rate': 0,
-                        'daily_change_rate': '-',
-                        'tags': item.tags
-                    }
-                    funds.append(basic_fund_data)
-
-            # 获取持仓基金，添加不在自选列表中的持仓基金
-            holdings = db.query(FundHolding).all()
-            holding_fund_codes = []
-
-            for holding in holdings:
-                if holding.fund.id not in watchlist_fund_ids:
-                    holding_fund_codes.append(holding.fund.fund_code)
-
-            # 去重持仓基金代码
-            holding_fund_codes = list(set(holding_fund_codes))
-
-            # 如果有持仓基金需要获取数据，批量获取
-            if holding_fund_codes:
-                holding_funds_data_dict = get_fund_realtime_rates_batch(db, holding_fund_codes, force_refresh=False)
-
-                # 构建持仓基金返回结果
-                added_fund_codes = set()
-                for holding in holdings:
-                    if holding.fund.id in watchlist_fund_ids:
-                        continue
-
-                    fund_code = holding.fund.fund_code
-
-                    # 检查是否已经添加过该基金
-                    if fund_code in added_fund_codes:
-                        continue
-
-                    fund_data = holding_funds_data_dict.get(fund_code)
-
-                    if fund_data:
-                        fund_data['tags'] = ''
-                        # 保留估算数据，无论净值日期是否为今天
-                        funds.append(fund_data)
-                        added_fund_codes.add(fund_code)
-                    else:
-                        basic_fund_data = {
-                            'fund_code': fund_code,
-                            'fund_name': holding.fund.fund_name,
-                            'net_value': '',
-                            'unit_net_value': '',
-                            'estimate_net_value': '',
-                            'estimate_change_rate': None,
-                            'estimate_time': '',
-                            'one_month_rate': 0,
-                            'three_month_rate': 0,
-                            'one_year_rate': 0,
-                            'daily_change_rate': '-',
-                            'tags': ''
-                        }
-                        funds.append(basic_fund_data)
-                        added_fund_codes.add(fund_code)
+                    funds.append(basic_watchlist_data(fund, tags))
 
             return jsonify(funds)
 
@@ -1589,11 +1612,8 @@ def manage_watchlist():
                     db.commit()
             return jsonify({'success': True})
     except Exception as e:
-        import traceback
         error_message = str(e)
-        error_traceback = traceback.format_exc()
-        print(f"[ERROR] 处理 /api/watchlist 请求时出错: {error_message}")
-        print(f"[ERROR] 详细错误信息: {error_traceback}")
+        logger.exception("处理 /api/watchlist 请求时出错: %s", error_message)
         db.rollback()
         return jsonify({'error': error_message}), 500
     finally:
@@ -1634,157 +1654,55 @@ def change_fund_tags():
         db.close()
 
 @app.route('/api/holding', methods=['GET', 'POST'])
+@conditional_get('holding', [SCOPE_REALTIME, SCOPE_PORTFOLIO], CONDITIONAL_REALTIME_TTL, last_modified=realtime_last_modified)
 def manage_holding():
     """
     管理持仓接口
     GET: 获取持仓列表
     POST: 添加或更新持仓
     """
-    from datetime import datetime, timedelta
+    from datetime import datetime
     try:
-        logger.info("开始处理 /api/holding 请求")
-        logger.info("获取数据库连接")
+        logger.debug("开始处理 /api/holding 请求")
+        logger.debug("获取数据库连接")
         db = next(get_db())
-        logger.info("数据库连接获取成功")
+        logger.debug("数据库连接获取成功")
 
         if request.method == 'GET':
-            logger.info("处理 GET 请求")
-            # 设置请求超时控制
-            start_time = datetime.now().timestamp()
-            MAX_REQUEST_TIME = 30  # 最大请求时间（秒）
+            logger.debug("处理 GET 请求")
 
             # 获取持仓列表
-            logger.info("开始获取持仓列表")
+            logger.debug("开始获取持仓列表")
             try:
                 holdings = db.query(FundHolding).all()
-                logger.info(f"获取到 {len(holdings)} 个持仓")
+                logger.debug("获取到 %d 个持仓", len(holdings))
             except Exception as e:
-                logger.error(f"获取持仓列表失败: {e}")
+                logger.error("获取持仓列表失败: %s", e)
                 return jsonify({'error': '获取持仓列表失败'}), 500
 
-            # 批量获取所有基金的实时数据（并发优化）
+            # 批量获取所有基金的实时数据（抓取并发进行，数据库访问只在当前线程）
             fund_codes = [holding.fund.fund_code for holding in holdings]
-            logger.info(f"基金代码: {fund_codes}")
+            logger.debug("基金代码: %s", fund_codes)
 
-            # 使用线程池执行数据获取，设置超时
             fund_data_dict = {}
             try:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                    # 为每个基金代码创建一个任务
-                    future_to_fund = {executor.submit(get_fund_realtime_rates, db, fund_code): fund_code for fund_code in fund_codes}
-
-                    # 处理完成的任务，设置超时
-                    for future in concurrent.futures.as_completed(future_to_fund, timeout=20):
-                        fund_code = future_to_fund[future]
-                        try:
-                            data = future.result()
-                            if data:
-                                fund_data_dict[fund_code] = data
-                                logger.info(f"获取基金 {fund_code} 数据成功: {data}")
-                            else:
-                                logger.warning(f"获取基金 {fund_code} 数据返回空")
-                        except Exception as e:
-                            logger.error(f"获取基金 {fund_code} 数据失败: {e}")
-            except concurrent.futures.TimeoutError:
-                logger.warning("获取基金数据超时，使用部分数据")
+                fund_data_dict = get_fund_realtime_rates_batch(db, fund_codes)
             except Exception as e:
-                logger.error(f"获取基金数据失败: {e}")
-
-            logger.info(f"获取到的基金数据: {fund_data_dict}")
+                logger.error("获取基金数据失败: %s", e)
 
             # 批量获取所有基金的标签（板块）
             fund_ids = [holding.fund.id for holding in holdings]
             watchlist_items = db.query(Watchlist).filter(Watchlist.fund_id.in_(fund_ids)).all()
             tags_dict = {item.fund_id: item.tags for item in watchlist_items}
 
-            holding_list = []
-            for holding in holdings:
-                # 检查请求时间是否超时
-                if datetime.now().timestamp() - start_time > MAX_REQUEST_TIME:
-                    logger.warning("请求超时，返回部分数据")
-                    break
-
-                fund_data = fund_data_dict.get(holding.fund.fund_code)
-                tags = tags_dict.get(holding.fund.id, '')
-
-                if fund_data:
-                    unit_net_value = fund_data.get('unit_net_value')
-                    fsrq = fund_data.get('fsrq', '')
-                    daily_change_rate = fund_data.get('daily_change_rate', '-')
-                    estimate_change_rate = fund_data.get('estimate_change_rate', '-')
-
-                    if unit_net_value:
-                        current_value = holding.shares * float(unit_net_value)
+            # 一次性计算所有持仓的收益和汇总数据
+            valuation = value_portfolio(holdings, fund_data_dict, tags_dict)
 
-                        # 检查最新涨幅是否已更新（fsrq是否为今日）
-                        today = datetime.now().strftime('%Y-%m-%d')
-                        is_today = (fsrq == today)
-
-                        # 逻辑：
-                        # 1. 最新涨幅已更新（is_today为true），优先使用最新涨幅计算
-                        # 2. 最新涨幅未更新，使用估算涨幅计算
-                        if is_today and daily_change_rate != '-' and daily_change_rate is not None and daily_change_rate != 0:
-                            # 最新涨幅已更新，使用最新涨幅计算今日收益和持仓金额
-                            change_rate = float(daily_change_rate)
-                            # 今日持仓金额 = 昨日持仓金额 × (1 + 涨幅%)
-                            # 昨日持仓金额 = 当前持仓金额（因为单位净值是昨天的）
-                            today_value = current_value * (1 + change_rate / 100)
-                            estimate_profit = today_value - current_value
-                            current_value = today_value
-                        elif estimate_change_rate != '-' and estimate_change_rate is not None:
-                            # 最新涨幅未更新，使用估算涨幅计算今日收益
-                            change_rate = float(estimate_change_rate)
-                            estimate_profit = current_value * (change_rate / 100)
-                        else:
-                            # 没有估算数据且不是交易日，设置为None表示不显示
-                            estimate_profit = None
-                            estimate_change_rate = None
-                    else:
-                        current_value = holding.cost
-                        estimate_profit = 0
-
-                    # 实时计算持有收益和持仓金额
-                    profit_loss = current_value - holding.cost
-                    profit_loss_rate = (profit_loss / holding.cost * 100) if holding.cost > 0 else 0
-
-                    holding_list.append({
-                        'fund_code': holding.fund.fund_code,
-                        'fund_name': holding.fund.fund_name,
-                        'cost': holding.cost,
-                        'shares': holding.shares,
-                        'avg_cost': holding.avg_cost,
-                        'current_value': current_value,
-                        'profit_loss': profit_loss,
-                        'profit_loss_rate': profit_loss_rate,
-                        'estimate_change_rate': estimate_change_rate,
-                        'estimate_profit': estimate_profit,
-                        'daily_change_rate': fund_data.get('daily_change_rate', '-'),
-                        'fsrq': fund_data.get('fsrq', ''),
-                        'one_month_rate': fund_data.get('one_month_rate', 0),
-                        'tags': tags,
-                        'platform': holding.platform or '其他'
-                    })
-                else:
-                    holding_list.append({
-                        'fund_code': holding.fund.fund_code,
-                        'fund_name': holding.fund.fund_name,
-                        'cost': holding.cost,
-                        'shares': holding.shares,
-                        'avg_cost': holding.avg_cost,
-                        'current_value': holding.current_value or holding.cost,
-                        'profit_loss': holding.profit_loss or 0,
-                        'profit_loss_rate': holding.profit_loss_rate or 0,
-                        'estimate_change_rate': '0.00',
-                        'estimate_profit': 0,
-                        'daily_change_rate': '-',
-                        'fsrq': '',
-                        'one_month_rate': 0,
-                        'tags': tags,
-                        'platform': holding.platform or '其他'
-                    })
-
-            logger.info(f"返回 {len(holding_list)} 个持仓数据")
-            return jsonify(holding_list)
+            logger.debug("返回 %d 个持仓数据", len(valuation.holdings))
+            # summary=1 时同时返回按平台、标签汇总的数据
+            if request.args.get('summary') == '1':
+                return jsonify({'holdings': valuation.holdings, 'summary': valuation.summary})
+            return jsonify(valuation.holdings)
 
         elif request.method == 'POST':
             # 添加或更新持仓
@@ -1820,7 +1738,7 @@ def manage_holding():
                 platform = '默认'
             elif not platform:
                 platform = '其他'
-            logger.info(f"收到的平台参数: {platform}")
+            logger.info("收到的平台参数: %s", platform)
 
             # 检查是否已有对应平台的持仓
             fund_holding = db.query(FundHolding).filter(
@@ -1829,7 +1747,7 @@ def manage_holding():
             ).first()
 
             actual_platform = platform
-            logger.info(f"查询持仓: fund_id={fund.id}, platform={platform}, 结果: {fund_holding is not None}")
+            logger.info("查询持仓: fund_id=%s, platform=%s, 结果: %s", fund.id, platform, fund_holding is not None)
 
             # 获取当前价格（根据日期获取净值）
             current_price = None
@@ -1845,15 +1763,15 @@ def manage_holding():
             # 尝试获取历史净值
             if transaction_date:
                 # 根据日期获取净值
-                logger.info(f"尝试获取基金 {fund_code} 在 {transaction_date} 的净值")
-                # 调用新添加的方法获取历史净值
+                logger.info("尝试获取基金 %s 在 %s 的净值", fund_code, transaction_date)
+                # 优先从历史净值表读取，没有时再调用接口获取
                 history_data = DataFetcher.get_fund_history_by_date(fund_code, transaction_date)
                 if history_data and history_data.get('unit_net_value'):
                     current_price = float(history_data.get('unit_net_value'))
-                    logger.info(f"使用历史净值，基金代码: {fund_code}, 日期: {transaction_date}, 净值: {current_price}")
+                    logger.info("使用历史净值，基金代码: %s, 日期: %s, 净值: %s", fund_code, transaction_date, current_price)
                 else:
                     # 如果没有找到历史净值，使用最新净值
-                    logger.warning(f"无法获取基金 {fund_code} 在 {transaction_date} 的历史净值，使用最新净值")
+                    logger.warning("无法获取基金 %s 在 %s 的历史净值，使用最新净值", fund_code, transaction_date)
                     current_price = None
 
             # 如果没有指定日期或无法获取指定日期的净值，使用最新净值
@@ -1861,17 +1779,17 @@ def manage_holding():
                 fund_data = get_fund_realtime_data(db, fund_code, force_refresh=True, need_history_data=False)
                 if fund_data and fund_data.get('unit_net_value'):
                     current_price = float(fund_data.get('unit_net_value'))
-                    logger.info(f"使用最新净值，基金代码: {fund_code}, 净值: {current_price}, 净值日期: {fund_data.get('fsrq', '')}")
+                    logger.info("使用最新净值，基金代码: %s, 净值: %s, 净值日期: %s", fund_code, current_price, fund_data.get('fsrq', ''))
                 else:
                     # 尝试从估值数据中获取
                     valuation_data = DataFetcher.get_fund_valuation(fund_code)
                     if valuation_data and valuation_data.get('estimate_net_value'):
                         current_price = float(valuation_data['estimate_net_value'])
-                        logger.info(f"使用估值数据，基金代码: {fund_code}, 估值净值: {current_price}")
+                        logger.info("使用估值数据，基金代码: %s, 估值净值: %s", fund_code, current_price)
                     else:
                         # 如果仍然无法获取，使用1.0作为默认值
                         current_price = 1.0
-                        logger.warning(f"无法获取净值数据，基金代码: {fund_code}, 使用默认值: {current_price}")
+                        logger.warning("无法获取净值数据，基金代码: %s, 使用默认值: %s", fund_code, current_price)
 
             if transaction_type == 'sync':
                 # 同步持仓操作
@@ -1889,7 +1807,7 @@ def manage_holding():
                 unit_net_value = None
                 if fund_data:
                     unit_net_value = fund_data.get('unit_net_value')
-                    logger.info(f"获取基金数据成功，基金代码: {fund_code}, 净值: {unit_net_value}, 净值日期: {fund_data.get('fsrq', '')}")
+                    logger.info("获取基金数据成功，基金代码: %s, 净值: %s, 净值日期: %s", fund_code, unit_net_value, fund_data.get('fsrq', ''))
 
                 # 如果无法获取最新净值，使用默认值
                 if not unit_net_value:
@@ -1897,11 +1815,11 @@ def manage_holding():
                     valuation_data = DataFetcher.get_fund_valuation(fund_code)
                     if valuation_data and valuation_data.get('estimate_net_value'):
                         unit_net_value = float(valuation_data['estimate_net_value'])
-                        logger.info(f"使用估值数据，基金代码: {fund_code}, 估值净值: {unit_net_value}")
+                        logger.info("使用估值数据，基金代码: %s, 估值净值: %s", fund_code, unit_net_value)
                     else:
                         # 如果仍然无法获取，使用1.0作为默认值
                         unit_net_value = 1.0
-                        logger.warning(f"无法获取净值数据，基金代码: {fund_code}, 使用默认值: {unit_net_value}")
+                        logger.warning("无法获取净值数据，基金代码: %s, 使用默认值: %s", fund_code, unit_net_value)
                 else:
                     unit_net_value = float(unit_net_value)
 
@@ -1921,9 +1839,9 @@ def manage_holding():
                 if cost > 0:
                     profit_rate = (profit / cost) * 100
 
-                logger.info(f"添加持仓 - 基金代码: {fund_code}, 平台: {platform}")
-                logger.info(f"输入数据: 持仓金额={current_value}, 持有收益={profit}")
-                logger.info(f"计算数据: 净值={unit_net_value}, 份额={shares}, 成本={cost}, 平均成本={avg_cost}")
+                logger.info("添加持仓 - 基金代码: %s, 平台: %s", fund_code, platform)
+                logger.info("输入数据: 持仓金额=%s, 持有收益=%s", current_value, profit)
+                logger.info("计算数据: 净值=%s, 份额=%s, 成本=%s, 平均成本=%s", unit_net_value, shares, cost, avg_cost)
 
                 if fund_holding:
                     # 更新持仓
@@ -1998,9 +1916,9 @@ def manage_holding():
                 shares = data.get('shares', 0)
                 sell_date = data.get('sell_date')
 
-                logger.info(f"减仓操作 - 基金代码: {fund_code}, 平台: {platform}")
-                logger.info(f"输入数据: 份额={shares}, 卖出日期={sell_date}")
-                logger.info(f"当前持仓: 份额={fund_holding.shares if fund_holding else 'None'}, 成本={fund_holding.cost if fund_holding else 'None'}")
+                logger.info("减仓操作 - 基金代码: %s, 平台: %s", fund_code, platform)
+                logger.info("输入数据: 份额=%s, 卖出日期=%s", shares, sell_date)
+                logger.info("当前持仓: 份额=%s, 成本=%s", fund_holding.shares if fund_holding else 'None', fund_holding.cost if fund_holding else 'None')
 
                 # 确保shares是浮点数类型
                 try:
@@ -2008,13 +1926,13 @@ def manage_holding():
                 except (TypeError, ValueError):
                     return jsonify({'error': '份额格式错误'}), 400
 
-                logger.info(f"转换后份额: {shares}, current_price: {current_price}")
+                logger.info("转换后份额: %s, current_price: %s", shares, current_price)
 
                 if shares <= 0:
                     return jsonify({'error': '份额不能为空且必须大于0'}), 400
 
                 if not fund_holding or fund_holding.shares < shares - 0.01:
-                    logger.error(f"持仓份额不足: 持仓份额={fund_holding.shares if fund_holding else 'None'}, 减仓份额={shares}")
+                    logger.error("持仓份额不足: 持仓份额=%s, 减仓份额=%s", fund_holding.shares if fund_holding else 'None', shares)
                     return jsonify({'error': '持仓份额不足'}), 400
 
                 # 计算卖出金额
@@ -2026,10 +1944,10 @@ def manage_holding():
                 # 更新持仓：按比例减少持仓成本
                 fund_holding.cost = fund_holding.cost * (1 - sell_ratio)
                 fund_holding.shares -= shares
-                logger.info(f"减仓后 - 剩余份额: {fund_holding.shares}, 剩余成本: {fund_holding.cost}")
+                logger.info("减仓后 - 剩余份额: %s, 剩余成本: %s", fund_holding.shares, fund_holding.cost)
                 if fund_holding.shares <= 0.01 or fund_holding.cost <= 0.01:
                     # 清空持仓 - 先删除相关的收益历史记录
-                    logger.info(f"清仓 - 基金代码: {fund_code}, 平台: {platform}")
+                    logger.info("清仓 - 基金代码: %s, 平台: %s", fund_code, platform)
                     from models import HoldingProfitHistory
                     db.query(HoldingProfitHistory).filter(HoldingProfitHistory.holding_id == fund_holding.id).delete()
                     db.delete(fund_holding)
@@ -2153,12 +2071,7 @@ def manage_holding():
 
             return jsonify({'success': True})
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        logger.error(f"处理 /api/holding 请求时发生错误: {e}")
-        logger.error(f"错误堆栈: {error_trace}")
-        print(f"处理 /api/holding 请求时发生错误: {e}")
-        print(f"错误堆栈: {error_trace}")
+        logger.exception("处理 /api/holding 请求时发生错误: %s", e)
         if 'db' in locals():
             db.rollback()
         return jsonify({'error': str(e)}), 500
@@ -2166,6 +2079,25 @@ def manage_holding():
         if 'db' in locals():
             db.close()
 
+@app.route('/api/portfolio/summary', methods=['GET'])
+def portfolio_summary():
+    """
+    获取持仓汇总数据：总持仓金额、成本、持有收益、今日估算收益，以及按平台和标签的汇总
+    数据来自持仓快照，估值或持仓变化后才重新计算；支持 ETag，未变化时返回 304
+    :return: 持仓汇总数据
+    """
+    db = next(get_db())
+    try:
+        summary, etag = portfolio_snapshot.get(db)
+        response = jsonify(summary)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error("获取持仓汇总数据失败: %s", e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
 @app.route('/api/transaction/<fund_code>', methods=['GET'])
 def get_transaction_history(fund_code):
     """
@@ -2235,11 +2167,99 @@ def get_holding_profit_history(fund_code):
             })
         return jsonify(history_list)
     except Exception as e:
-        logger.error(f"获取持仓收益历史失败: {e}")
+        logger.error("获取持仓收益历史失败: %s", e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    获取数据缓存的统计信息（命中、未命中、淘汰等）、并发请求合并以及条件请求（ETag）的统计
+    """
+    stats = get_cache_stats()
+    stats['single_flight'] = get_flight_stats()
+    stats['conditional'] = get_conditional_stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus 格式的监控指标：第三方接口耗时与重试、缓存命中、数据库 flush/提交耗时与重试、定时任务耗时与结果
+    """
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/stream/valuations', methods=['GET'])
+def stream_valuations():
+    """
+    估值变化推送（Server-Sent Events）
+    连接后先发送一次 snapshot 事件（数据库中的当前估值），之后每当后台刷新写入估值，
+    只推送发生变化的 estimate_net_value、estimate_change_rate、daily_change_rate（delta 事件）
+    支持 codes 查询参数（逗号分隔的基金代码）订阅指定基金，不传时订阅全部基金
+    :return: text/event-stream 流式响应
+    """
+    codes = [code.strip() for code in request.args.get('codes', '').split(',') if code.strip()]
+    # 先订阅再读取快照，读取期间发生的变化不会丢失
+    subscription = valuation_broker.subscribe(codes)
+
+    db = next(get_db())
+    try:
+        query = db.query(Fund.fund_code, FundRealtimeData).join(FundRealtimeData, FundRealtimeData.fund_id == Fund.id)
+        if codes:
+            query = query.filter(Fund.fund_code.in_(codes))
+        snapshot = {
+            fund_code: {field: getattr(realtime_data, field) for field in VALUATION_FIELDS}
+            for fund_code, realtime_data in query.all()
+        }
+    except Exception as e:
+        valuation_broker.unsubscribe(subscription)
+        logger.error("获取估值快照失败: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         db.close()
+    valuation_broker.seed(snapshot)
+
+    def generate():
+        try:
+            yield format_sse(json.dumps(snapshot, ensure_ascii=False), event='snapshot', event_id=valuation_broker.sequence)
+            for item in iter_events(subscription, SSE_HEARTBEAT_INTERVAL):
+                if item is None:
+                    # 心跳，保持连接并及时发现已断开的客户端
+                    yield ': keepalive\n\n'
+                    continue
+                sequence, payload = item
+                yield format_sse(json.dumps(payload, ensure_ascii=False), event='delta', event_id=sequence)
+        finally:
+            valuation_broker.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/stream/stats', methods=['GET'])
+def stream_stats():
+    """
+    获取估值推送的统计信息（订阅方数量、已推送和丢弃的变化数）
+    :return: 统计信息
+    """
+    return jsonify(valuation_broker.stats())
 
+@app.route('/api/refresh/stats', methods=['GET'])
+def refresh_stats():
+    """
+    获取刷新写入队列的统计信息（队列深度、批次大小、写入耗时）
+    :return: 统计信息
+    """
+    return jsonify(refresh_writer.stats())
+
+@app.route('/api/db/writer/stats', methods=['GET'])
+def db_writer_stats():
+    """
+    获取基金实时数据批量写入的统计信息（批次数、写入条数、耗时）
+    """
+    return jsonify(get_writer_stats())
 
 @app.route('/api/test', methods=['GET'])
 def test_api():
@@ -2247,7 +2267,7 @@ def test_api():
     测试API端点
     """
     from datetime import datetime
-    print(f"[{datetime.now()}] 收到 /api/test 请求")
+    logger.debug("收到 /api/test 请求")
     return jsonify({'message': '测试API正常工作', 'timestamp': datetime.now().isoformat()})
 
 @app.route('/api/holding/<fund_code>', methods=['DELETE'])
@@ -2331,12 +2351,12 @@ def update_holding(fund_code):
             FundHolding.platform == platform
         ).first()
         if not fund_holding:
-            logger.warning(f"持仓不存在，基金ID: {fund.id}, 平台: {platform}")
+            logger.warning("持仓不存在，基金ID: %s, 平台: %s", fund.id, platform)
             return jsonify({'error': '持仓不存在'}), 404
 
         # 记录更新前的数据
-        logger.info(f"更新前 - 持仓ID: {fund_holding.id}, 成本: {fund_holding.cost}, 份额: {fund_holding.shares}, 当前价值: {fund_holding.current_value}, 持有收益: {fund_holding.profit_loss}, 平台: {fund_holding.platform}")
-        logger.info(f"更新后 - 成本: {cost}, 份额: {shares}, 当前价值: {current_value}, 持有收益: {profit}, 平台: {platform}")
+        logger.info("更新前 - 持仓ID: %s, 成本: %s, 份额: %s, 当前价值: %s, 持有收益: %s, 平台: %s", fund_holding.id, fund_holding.cost, fund_holding.shares, fund_holding.current_value, fund_holding.profit_loss, fund_holding.platform)
+        logger.info("更新后 - 成本: %s, 份额: %s, 当前价值: %s, 持有收益: %s, 平台: %s", cost, shares, current_value, profit, platform)
 
         # 更新持仓
         fund_holding.cost = cost
@@ -2388,9 +2408,7 @@ def update_watchlist_tags():
         return jsonify({'success': True})
     except Exception as e:
         db.rollback()
-        print(f"更新自选基金标签时出错: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("更新自选基金标签时出错: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         db.close()
@@ -2428,9 +2446,7 @@ def update_holding_tags():
         return jsonify({'success': True})
     except Exception as e:
         db.rollback()
-        print(f"更新持仓基金标签时出错: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("更新持仓基金标签时出错: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         db.close()
@@ -2446,7 +2462,7 @@ def get_holding_codes():
         fund_codes = [holding.fund.fund_code for holding in holdings]
         return jsonify({'fund_codes': fund_codes})
     except Exception as e:
-        print(f"获取持仓基金代码失败: {e}")
+        logger.error("获取持仓基金代码失败: %s", e)
         return jsonify({'fund_codes': []})
     finally:
         db.close()
@@ -2472,7 +2488,7 @@ def get_all_tags():
         tags = sorted(list(tags_set))
         return jsonify({'tags': tags})
     except Exception as e:
-        print(f"获取标签失败: {e}")
+        logger.error("获取标签失败: %s", e)
         return jsonify({'tags': []})
     finally:
         db.close()
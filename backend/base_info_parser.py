@@ -0,0 +1,68 @@
+import threading
+
+# FundBaseTypeInformation 接口各字段可能使用的名称（按优先级排列，与原先各处解析代码接受的字段名相同）
+FIELD_ALIASES = {
+    'one_month_rate': ('SYL_Y', 'syl_y', '近1月', 'OneMonth', 'syly', 'SYLY', '1y', '1Y', 'oneyear', 'OneYear'),
+    'three_month_rate': ('SYL_3Y', 'syl_3y', '近3月', 'ThreeMonth', 'syl3y', 'SYL3Y', '3m', '3M', 'threemonth'),
+    'one_year_rate': ('SYL_1N', 'syl_1n', '近1年', 'OneYear', 'syl1n', 'SYL1N', '1y', '1Y', 'oneyear'),
+    'daily_change_rate': ('RZDF', 'rzdf', '日涨跌幅', 'DailyChange', 'rdf', 'RDF', 'daily_change', 'DAILY_CHANGE', 'zdf', 'ZDF'),
+    'unit_net_value': ('DWJZ', 'dwjz', '单位净值', 'UnitNetValue'),
+}
+
+# 最多记录的响应结构数（接口字段结构很少变化）
+_MAX_SCHEMAS = 32
+
+
+class BaseInfoExtractor:
+    """
+    FundBaseTypeInformation 响应解析器
+    按响应的字段结构（字段名集合）解析一次每个字段实际存在的别名并缓存，
+    之后相同结构的响应直接按解析结果取值，不再逐个尝试所有别名。
+    """
+
+    def __init__(self, aliases=FIELD_ALIASES):
+        self.aliases = aliases
+        self._schemas = {}  # 字段名集合 -> {字段: 存在的别名元组}
+        self._lock = threading.Lock()
+        self.resolutions = 0
+
+    def _resolve(self, datas):
+        schema = frozenset(datas)
+        resolved = self._schemas.get(schema)
+        if resolved is None:
+            resolved = {
+                field: tuple(alias for alias in aliases if alias in schema)
+                for field, aliases in self.aliases.items()
+            }
+            with self._lock:
+                if len(self._schemas) >= _MAX_SCHEMAS:
+                    self._schemas.clear()
+                self._schemas[schema] = resolved
+                self.resolutions += 1
+        return resolved
+
+    def extract(self, datas):
+        """
+        从响应的 Datas 中提取涨跌幅、单位净值和净值日期
+        同一字段存在多个别名时使用第一个可以转换为数值的别名，都没有时为 0
+        :param datas: 响应中的 Datas 字典
+        :return: {'one_month_rate', 'three_month_rate', 'one_year_rate', 'daily_change_rate', 'unit_net_value', 'fsrq'}
+        """
+        result = {field: 0 for field in self.aliases}
+        result['fsrq'] = ''
+        if not datas:
+            return result
+
+        for field, aliases in self._resolve(datas).items():
+            for alias in aliases:
+                try:
+                    result[field] = float(datas[alias])
+                    break
+                except (ValueError, TypeError):
+                    continue
+        result['fsrq'] = datas.get('FSRQ', '') or ''
+        return result
+
+
+# 全局解析器
+base_info_extractor = BaseInfoExtractor()
@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# 已注册的缓存实例，用于统计信息查询
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class TTLCache:
+    """
+    带过期时间和容量上限的线程安全缓存
+    每个条目可以单独指定过期时间，超出容量时淘汰最久未使用的条目
+    """
+
+    def __init__(self, name, maxsize=128, ttl=300):
+        """
+        :param name: 缓存名称（用于统计）
+        :param maxsize: 最大条目数
+        :param ttl: 默认过期时间（秒）
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        with _registry_lock:
+            _registry[name] = self
+
+    def get(self, key, default=None):
+        """
+        读取缓存，过期条目视为未命中并删除
+        :param key: 缓存键
+        :param default: 未命中时的返回值
+        :return: 缓存值或 default
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """
+        写入缓存
+        :param key: 缓存键
+        :param value: 缓存值
+        :param ttl: 过期时间（秒），为空时使用默认值
+        :param expires_at: 绝对过期时间戳，优先于 ttl
+        """
+        if expires_at is None:
+            expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        删除指定缓存条目
+        :param key: 缓存键
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        获取缓存统计信息
+        :return: 统计字典
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / total, 4) if total else 0
+            }
+
+
+def get_cache_stats():
+    """
+    获取所有已注册缓存的统计信息
+    :return: {name: stats}
+    """
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+def _default_key(*args, **kwargs):
+    return args + tuple(sorted(kwargs.items()))
+
+
+def ttl_cache(name, maxsize=512, ttl=300, ttl_func=None, key_func=None, should_cache=None):
+    """
+    带过期时间的缓存装饰器
+    :param name: 缓存名称（用于统计）
+    :param maxsize: 最大条目数
+    :param ttl: 默认过期时间（秒）
+    :param ttl_func: 根据结果计算过期时间的函数 ttl_func(result) -> 秒数
+    :param key_func: 根据参数计算缓存键的函数，默认使用全部参数
+    :param should_cache: 判断结果是否可以缓存的函数，默认只跳过 None
+    """
+    def decorator(func):
+        cache = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        make_key = key_func or _default_key
+
+        def store(key, result):
+            if result is None:
+                return
+            if should_cache is not None and not should_cache(result):
+                return
+            cache.set(key, result, ttl=ttl_func(result) if ttl_func else None)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(*args, **kwargs)
+            result = cache.get(key)
+            if result is not None:
+                return result
+            result = func(*args, **kwargs)
+            store(key, result)
+            return result
+
+        def refresh(*args, **kwargs):
+            """跳过缓存重新获取，并更新缓存"""
+            result = func(*args, **kwargs)
+            store(make_key(*args, **kwargs), result)
+            return result
+
+        def invalidate(*args, **kwargs):
+            """删除指定参数对应的缓存"""
+            cache.invalidate(make_key(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.refresh = refresh
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
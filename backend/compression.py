@@ -0,0 +1,64 @@
+import gzip
+
+from flask import request
+
+from config import COMPRESS_MIN_SIZE, COMPRESS_LEVEL, BROTLI_QUALITY, COMPRESS_MIMETYPES
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
+
+def _choose_encoding():
+    """
+    根据 Accept-Encoding 选择压缩算法，优先 brotli
+    """
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """
+    压缩较大的 JSON 响应（after_request 钩子）
+    流式响应、304、已压缩或小于 COMPRESS_MIN_SIZE 的响应保持不变；
+    压缩后 ETag 改为弱校验，同一内容不同编码的响应可以共用 ETag
+    :param response: 响应对象
+    :return: 响应对象
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """
+    为 Flask 应用启用响应压缩
+    :param app: Flask 应用
+    """
+    app.after_request(compress_response)
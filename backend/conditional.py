@@ -0,0 +1,183 @@
+"""
+条件请求（ETag / Last-Modified）
+
+数据范围的版本号只保存在当前进程内存中，由本进程的 ORM 提交和刷新写入队列增加。
+migrate_nav_history.py、update_db.py 等脚本或另一个工作进程写入的数据不会增加这里的版本号，
+客户端在对应接口的 ttl 内仍可能收到过期的 304，超过 ttl 后重新执行接口才会返回新数据。
+"""
+import hashlib
+import threading
+import time
+from datetime import timezone
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from config import CONDITIONAL_CACHE_MAXSIZE
+from models import Fund, FundHolding, FundRealtimeData, Platform, Transaction, Watchlist
+from refresh_pipeline import refresh_writer
+
+# 数据范围：实时估值数据、持仓/自选/交易记录，以及按基金代码区分的历史净值（history:<基金代码>）
+SCOPE_REALTIME = 'realtime'
+SCOPE_PORTFOLIO = 'portfolio'
+
+# ORM对象变更时对应的数据范围
+_MODEL_SCOPES = (
+    (FundRealtimeData, SCOPE_REALTIME),
+    ((Fund, FundHolding, Watchlist, Transaction, Platform), SCOPE_PORTFOLIO),
+)
+
+_versions = {}
+_versions_lock = threading.Lock()
+# 进程启动标识，重启后版本号从头计数，避免与重启前的 ETag 冲突
+_boot_id = hashlib.md5(str(time.time()).encode('utf-8')).hexdigest()[:8]
+
+# 最近一次生成的 ETag：(接口, 路径和参数, Accept) -> (ETag, Last-Modified, 生成时的版本号)
+_etags = TTLCache('conditional_etags', maxsize=CONDITIONAL_CACHE_MAXSIZE)
+_short_circuits = 0
+_stats_lock = threading.Lock()
+
+
+def history_scope(fund_code):
+    """
+    基金历史净值的数据范围
+    """
+    return f'history:{fund_code}'
+
+
+def bump(*scopes):
+    """
+    数据已变更（已提交），增加对应数据范围的版本号
+    """
+    with _versions_lock:
+        for scope in scopes:
+            _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def current_versions(scopes):
+    """
+    获取数据范围的当前版本号
+    :return: 版本号元组
+    """
+    with _versions_lock:
+        return tuple(_versions.get(scope, 0) for scope in scopes)
+
+
+def touch(session, *scopes):
+    """
+    记录会话中变更了的数据范围，事务提交后才增加版本号
+    用于不经过ORM对象的写入（如历史净值批量写入）
+    :param session: 数据库会话
+    :param scopes: 数据范围
+    """
+    session.info.setdefault('conditional_scopes', set()).update(scopes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_scopes_on_flush(session, flush_context):
+    """
+    通过ORM变更实时数据、持仓、自选或交易记录时记录对应的数据范围
+    """
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for models, scope in _MODEL_SCOPES:
+            if isinstance(obj, models):
+                touch(session, scope)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    scopes = session.info.pop('conditional_scopes', None)
+    if scopes:
+        bump(*scopes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('conditional_scopes', None)
+
+
+# 刷新队列写入估值后增加实时数据版本号
+refresh_writer.add_listener(lambda rows: bump(SCOPE_REALTIME))
+
+
+def _to_http_date(value):
+    """
+    数据库中的更新时间为 UTC（不带时区，见 models.db_now），转换为带时区的时间用于 Last-Modified
+    """
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def conditional_get(name, scopes, ttl, last_modified=None):
+    """
+    条件请求装饰器：为 GET 接口生成内容哈希 ETag 和 Last-Modified
+    客户端携带的 If-None-Match 与上次生成的 ETag 相同，且相关数据范围的版本号没有变化、未超过 ttl 时，
+    直接返回 304，不查询数据库也不请求第三方接口
+    超过 ttl 后重新执行接口（接口内部会按需刷新过期数据），内容不变时仍返回 304
+    :param name: 接口名称
+    :param scopes: 数据范围列表，或根据路由参数返回数据范围列表的函数
+    :param ttl: 未变更时直接返回 304 的最长时间（秒）
+    :param last_modified: 根据路由参数返回最后更新时间的函数
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            global _short_circuits
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            scope_list = scopes(**kwargs) if callable(scopes) else scopes
+            versions = current_versions(scope_list)
+            # 同一地址可以通过 Accept 请求不同格式
+            key = (name, request.full_path, request.headers.get('Accept', ''))
+
+            cached = _etags.get(key)
+            if cached and cached[2] == versions and request.if_none_match.contains_weak(cached[0]):
+                with _stats_lock:
+                    _short_circuits += 1
+                response = make_response('', 304)
+                response.set_etag(cached[0])
+                if cached[1]:
+                    response.last_modified = cached[1]
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            etag = f"{_boot_id}-{hashlib.md5(response.get_data()).hexdigest()}"
+            modified = None
+            if last_modified:
+                try:
+                    modified = _to_http_date(last_modified(**kwargs))
+                except Exception:
+                    modified = None
+            response.set_etag(etag)
+            if modified:
+                response.last_modified = modified
+            # 使用执行前的版本号，执行期间发生的变更会让下一次请求重新计算
+            _etags.set(key, (etag, modified, versions), ttl=ttl)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def get_conditional_stats():
+    """
+    获取条件请求统计信息
+    :return: 统计字典
+    """
+    with _versions_lock:
+        versions = dict(_versions)
+    with _stats_lock:
+        short_circuits = _short_circuits
+    return {
+        'short_circuits': short_circuits,
+        'etags': _etags.stats(),
+        'versions': {scope: version for scope, version in versions.items() if not scope.startswith('history:')},
+        'history_scopes': sum(1 for scope in versions if scope.startswith('history:'))
+    }
@@ -4,7 +4,8 @@
 DATA_SOURCES = {
     'fund_valuation': 'http://fundgz.1234567.com.cn/js/',  # 天天基金估值
     'eastmoney': 'http://fundf10.eastmoney.com/',  # 东方财富基金详情
-    'tencent_stock': 'http://qt.gtimg.cn/q='  # 腾讯财经股票行情
+    'tencent_stock': 'http://qt.gtimg.cn/q=',  # 腾讯财经股票行情
+    'fund_valuation_multi': 'https://fundmobapi.eastmoney.com/FundMNewApi/FundMNFInfo'  # 东方财富多基金估值列表
 }
 
 # 数据库配置
@@ -22,3 +23,102 @@ CONNECT_ARGS = {'options': '-c timezone=UTC'}
 
 # 刷新间隔（秒）
 REFRESH_INTERVAL = 30
+
+# HTTP连接池配置（按主机复用长连接）
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))  # 每个主机缓存的连接池数量
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '20'))  # 每个连接池的最大连接数
+HTTP_MAX_RETRIES = 0  # 连接层不重试，由 retry_on_failure 统一处理
+HTTP_DEFAULT_TIMEOUT = 10  # 默认超时时间（秒）
+
+# 各主机的请求超时时间（秒）
+HTTP_HOST_TIMEOUTS = {
+    'fundgz.1234567.com.cn': 5,  # 天天基金估值
+    'fundmobapi.eastmoney.com': 5,  # 东方财富移动端API
+    'fund.eastmoney.com': 5,  # 天天基金 pingzhongdata
+    'api.fund.eastmoney.com': 10,  # 东方财富历史净值
+    'fundf10.eastmoney.com': 10,  # 东方财富基金详情
+    'fundsuggest.eastmoney.com': 10,  # 东方财富基金搜索
+    'qt.gtimg.cn': 10,  # 腾讯财经股票行情
+}
+
+# 各主机的连接池大小（未配置的主机使用 HTTP_POOL_MAXSIZE）
+HTTP_HOST_POOL_SIZES = {
+    'fundgz.1234567.com.cn': 50,
+    'fundmobapi.eastmoney.com': 50,
+    'api.fund.eastmoney.com': 20,
+}
+
+# 批量抓取引擎配置
+FETCH_MAX_IN_FLIGHT = int(os.environ.get('FETCH_MAX_IN_FLIGHT', '32'))  # 同时进行的上游请求上限
+FETCH_TASK_TIMEOUT = 15  # 单个抓取任务的超时时间（秒）
+
+# 历史净值缓存配置
+HISTORY_CACHE_MAXSIZE = 256  # 最多缓存的基金数量
+HISTORY_NAV_PUBLISH_HOUR = 19  # 基金净值一般在该时刻之后公布
+HISTORY_CACHE_PENDING_TTL = 600  # 等待当日净值公布期间的缓存时间（秒）
+HISTORY_CACHE_MAX_TTL = 86400  # 历史净值缓存的最长时间（秒）
+
+# 估值与涨跌幅缓存配置
+VALUATION_CACHE_TTL_TRADING = 60  # 交易时段内估值缓存时间（秒）
+VALUATION_CACHE_TTL_IDLE = 1800  # 非交易时段估值缓存的最长时间（秒）
+RATES_CACHE_TTL_PUBLISHING = 600  # 净值公布时段内涨跌幅缓存时间（秒）
+RATES_CACHE_MAX_TTL = 21600  # 涨跌幅缓存的最长时间（秒）
+FETCH_CACHE_MAXSIZE = 1024  # 估值、涨跌幅缓存的最大条目数
+
+# 历史净值接口默认返回的最大条数
+NAV_HISTORY_DEFAULT_LIMIT = 500
+
+# 完整历史净值回填配置
+HISTORY_PAGE_SIZE = 100  # 历史净值接口每页条数
+HISTORY_BACKFILL_WORKERS = 4  # 回填时并发请求的最大页数
+
+# 实时数据刷新配置
+REFRESH_WRITE_BATCH_SIZE = 200  # 每次提交写入的最大基金数量
+REFRESH_QUEUE_MAXSIZE = 2000  # 刷新写入队列的最大长度
+REFRESH_FLUSH_INTERVAL = 0.5  # 写入线程凑批的最长等待时间（秒）
+REFRESH_SUBMIT_TIMEOUT = 5  # 队列满时提交方的最长等待时间（秒）
+
+# 交易日历调度配置
+INTRADAY_REFRESH_MARGIN = 10  # 盘中刷新在交易时段前后额外放宽的分钟数
+
+# 净值公布轮询配置
+NAV_POLL_INTERVAL = 300  # 普通基金未公布净值时的轮询间隔（秒）
+NAV_POLL_LATE_INTERVAL = 1800  # 延迟公布净值的基金（QDII、FOF）初始轮询间隔（秒）
+NAV_POLL_MAX_INTERVAL = 7200  # 退避后的最大轮询间隔（秒）
+NAV_LATE_FUND_KEYWORDS = ('QDII', 'FOF')  # 基金名称或类型中包含这些关键字时视为延迟公布
+
+# 条件请求（ETag）配置
+CONDITIONAL_REALTIME_TTL = 30  # 自选、持仓列表未变更时直接返回304的最长时间（秒）
+CONDITIONAL_HISTORY_TTL = 300  # 历史净值、基金完整信息未变更时直接返回304的最长时间（秒）
+CONDITIONAL_CACHE_MAXSIZE = 1024  # 记录的 ETag 最大条目数
+
+# 估值推送（SSE）配置
+SSE_HEARTBEAT_INTERVAL = 15  # 没有变化时发送心跳的间隔（秒）
+SSE_SUBSCRIBER_QUEUE_SIZE = 100  # 每个订阅方最多缓存的未发送变化数
+SSE_REFRESH_INTERVAL = 60  # 有订阅方时交易时段内刷新被订阅基金估值的间隔（秒）
+
+# 响应压缩与紧凑格式配置
+COMPRESS_MIN_SIZE = 1024  # 超过该字节数的响应才压缩
+COMPRESS_LEVEL = 6  # gzip 压缩级别
+BROTLI_QUALITY = 5  # brotli 压缩质量（安装 brotli 后启用）
+COMPRESS_MIMETYPES = ('application/json',)  # 需要压缩的响应类型（流式响应不压缩）
+COMPACT_MIMETYPE = 'application/vnd.fund-tracker.compact+json'  # 请求紧凑格式时使用的 Accept 类型
+
+# 批量估值接口配置
+VALUATION_BATCH_SIZE = 50  # 多基金估值接口每次请求的基金数量
+
+# pingzhongdata 配置
+PINGZHONG_CACHE_MAXSIZE = 32  # pingzhongdata（包含完整净值序列）最多缓存的基金数量
+
+# 日志配置
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # 日志级别，设为 DEBUG 时输出抓取细节
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # text 或 json（结构化日志）
+LOG_FILE = 'holding_profit.log'  # 日志文件
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))  # DEBUG 级别下记录完整接口数据的采样率
+REQUEST_ID_HEADER = 'X-Request-ID'  # 请求关联ID的请求头和响应头
+
+# 监控指标（/metrics）配置
+METRICS_HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)  # 第三方接口请求耗时直方图区间（秒）
+METRICS_DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)  # 数据库 flush/提交耗时直方图区间（秒）
+METRICS_JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)  # 定时任务耗时直方图区间（秒）
+METRICS_BATCH_BUCKETS = (1, 5, 10, 25, 50, 100, 200)  # 刷新队列每批写入记录数直方图区间
@@ -1,11 +1,27 @@
 import requests
 import json
+import logging
 import time
-from functools import lru_cache, wraps
+from functools import wraps
 from bs4 import BeautifulSoup
-from config import DATA_SOURCES
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+from config import (
+    DATA_SOURCES, HISTORY_CACHE_MAXSIZE, HISTORY_NAV_PUBLISH_HOUR, HISTORY_CACHE_PENDING_TTL, HISTORY_CACHE_MAX_TTL,
+    VALUATION_CACHE_TTL_TRADING, VALUATION_CACHE_TTL_IDLE, RATES_CACHE_TTL_PUBLISHING, RATES_CACHE_MAX_TTL, FETCH_CACHE_MAXSIZE,
+    HISTORY_PAGE_SIZE, HISTORY_BACKFILL_WORKERS, VALUATION_BATCH_SIZE, PINGZHONG_CACHE_MAXSIZE
+)
+from http_client import http_get
+from fetch_engine import fetch_engine
+from datetime import datetime, timedelta
+from cache import TTLCache, ttl_cache
+from singleflight import SingleFlight, single_flight
+from trading_calendar import next_session_start
+from base_info_parser import base_info_extractor
+from pingzhong_parser import parse_pingzhongdata
+from metrics import fetch_retries
+from models import SessionLocal, Fund
+from nav_history import get_nav_by_date
+
+logger = logging.getLogger(__name__)
 
 def retry_on_failure(max_retries=3, delay=1, backoff=2, exceptions=(requests.RequestException, requests.Timeout, ConnectionError, json.JSONDecodeError)):
     """
@@ -30,47 +46,115 @@ def retry_on_failure(max_retries=3, delay=1, backoff=2, exceptions=(requests.Req
                 except exceptions as e:
                     last_exception = e
                     if attempt < max_retries - 1:
-                        print(f"API请求失败，第{attempt + 1}次重试，等待{current_delay:.2f}秒... 错误: {e}")
+                        logger.warning("API请求失败，第%d次重试，等待%.2f秒... 错误: %s", attempt + 1, current_delay, e)
+                        fetch_retries.inc(method=func.__name__, outcome='retry')
                         time.sleep(current_delay)
                         current_delay *= backoff
                     else:
-                        print(f"API请求失败，已达到最大重试次数{max_retries}次，放弃重试。错误: {e}")
+                        logger.error("API请求失败，已达到最大重试次数%d次，放弃重试。错误: %s", max_retries, e)
+                        fetch_retries.inc(method=func.__name__, outcome='exhausted')
                 except ValueError as e:
                     last_exception = e
                     if attempt < max_retries - 1:
-                        print(f"API返回None值，第{attempt + 1}次重试，等待{current_delay:.2f}秒... 错误: {e}")
+                        logger.warning("API返回None值，第%d次重试，等待%.2f秒... 错误: %s", attempt + 1, current_delay, e)
+                        fetch_retries.inc(method=func.__name__, outcome='retry')
                         time.sleep(current_delay)
                         current_delay *= backoff
                     else:
-                        print(f"API返回None值，已达到最大重试次数{max_retries}次，放弃重试。错误: {e}")
+                        logger.error("API返回None值，已达到最大重试次数%d次，放弃重试。错误: %s", max_retries, e)
+                        fetch_retries.inc(method=func.__name__, outcome='exhausted')
                 except Exception as e:
-                    print(f"API请求遇到非重试异常: {e}")
+                    logger.error("API请求遇到非重试异常: %s", e)
                     raise e
 
             return None
         return wrapper
     return decorator
 
+# 历史净值缓存（按基金代码）
+_history_cache = TTLCache('fund_history', maxsize=HISTORY_CACHE_MAXSIZE, ttl=HISTORY_CACHE_PENDING_TTL)
+# 同一基金并发获取历史净值时只发起一次上游请求
+_history_flight = SingleFlight('fund_history')
+_history_full_flight = SingleFlight('fund_history_full')
+
+def _history_expires_at(fsrq, now=None):
+    """
+    根据净值日期计算历史净值缓存的过期时间
+    当日净值已公布时缓存到下一个公布时刻；未公布时在公布时刻前缓存到公布时刻，
+    进入公布时段后只做短时间缓存以便尽快拿到新净值
+    :param fsrq: 最新净值日期，格式为YYYY-MM-DD
+    :param now: 当前时间（用于测试）
+    :return: 过期时间戳
+    """
+    now = now or datetime.now()
+    publish_today = now.replace(hour=HISTORY_NAV_PUBLISH_HOUR, minute=0, second=0, microsecond=0)
+
+    if fsrq == now.strftime('%Y-%m-%d'):
+        expires = publish_today + timedelta(days=1)
+    elif now < publish_today:
+        expires = publish_today
+    else:
+        expires = now + timedelta(seconds=HISTORY_CACHE_PENDING_TTL)
+
+    expires = min(expires, now + timedelta(seconds=HISTORY_CACHE_MAX_TTL))
+    return expires.timestamp()
+
+def _valuation_ttl(result=None, now=None):
+    """
+    估值缓存时间：交易时段内估值持续变化，只短时间缓存；
+    非交易时段缓存到下一个交易时段开始（不超过 VALUATION_CACHE_TTL_IDLE）
+    """
+    now = now or datetime.now()
+    trading, next_start = next_session_start(now)
+    if trading:
+        return VALUATION_CACHE_TTL_TRADING
+    seconds = (next_start - now).total_seconds()
+    return max(VALUATION_CACHE_TTL_TRADING, min(seconds, VALUATION_CACHE_TTL_IDLE))
+
+def _rates_ttl(result=None, now=None):
+    """
+    涨跌幅缓存时间：涨跌幅每天只在净值公布后变化一次，
+    公布时段内短时间缓存，其余时间缓存到下一个公布时刻（不超过 RATES_CACHE_MAX_TTL）
+    """
+    now = now or datetime.now()
+    publish_today = now.replace(hour=HISTORY_NAV_PUBLISH_HOUR, minute=0, second=0, microsecond=0)
+    if now >= publish_today:
+        return RATES_CACHE_TTL_PUBLISHING
+    seconds = (publish_today - now).total_seconds()
+    return max(RATES_CACHE_TTL_PUBLISHING, min(seconds, RATES_CACHE_MAX_TTL))
+
+def _pingzhong_ttl(result, now=None):
+    """
+    pingzhongdata 缓存时间：与历史净值缓存相同，按净值日期缓存到下一个公布时刻
+    """
+    now = now or datetime.now()
+    return max(1, _history_expires_at(result.get('fsrq'), now) - now.timestamp())
+
+def _fund_code_key(fund_code, timestamp=None):
+    """缓存键只使用基金代码，timestamp 参数已废弃"""
+    return fund_code
+
+def _has_nav_date(result):
+    """只缓存带有净值日期的结果，接口失败时返回的默认数据不缓存"""
+    return bool(result.get('fsrq'))
+
 class DataFetcher:
     """数据获取类"""
 
-    # 线程池执行器，用于并发请求
-    _executor = ThreadPoolExecutor(max_workers=5)  # 减少线程池大小，避免资源占用过多
-    _lock = threading.Lock()
-
     @staticmethod
-    @lru_cache(maxsize=512)
+    @ttl_cache('fund_valuation', maxsize=FETCH_CACHE_MAXSIZE, ttl_func=_valuation_ttl, key_func=_fund_code_key)
+    @single_flight('fund_valuation', key_func=_fund_code_key)
     @retry_on_failure(max_retries=3, delay=1, backoff=2)
     def get_fund_valuation(fund_code, timestamp=None):
         """
-        获取基金估值数据
+        获取基金估值数据（交易时段内短时间缓存）
         :param fund_code: 基金代码
-        :param timestamp: 时间戳（用于缓存过期）
+        :param timestamp: 已废弃，保留以兼容旧调用
         :return: 基金估值数据字典
         """
         url = f"{DATA_SOURCES['fund_valuation']}{fund_code}.js"
         try:
-            response = requests.get(url, timeout=5)  # 5秒超时
+            response = http_get(url, caller='get_fund_valuation')
             response.encoding = 'utf-8'
             # 解析JSONP格式数据
             # 找到第一个左括号和最后一个右括号
@@ -93,7 +177,7 @@ class DataFetcher:
             else:
                 return None
         except Exception as e:
-            print(f"获取基金估值失败: {e}")
+            logger.warning("获取基金估值失败: %s", e)
             return None
 
     @staticmethod
@@ -105,7 +189,7 @@ class DataFetcher:
         """
         url = f"{DATA_SOURCES['eastmoney']}ccmx_{fund_code}.html"
         try:
-            response = requests.get(url, timeout=10)
+            response = http_get(url, caller='get_fund_holding')
             response.encoding = 'utf-8'
             soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -129,7 +213,7 @@ class DataFetcher:
                     })
             return holdings
         except Exception as e:
-            print(f"获取基金重仓股失败: {e}")
+            logger.warning("获取基金重仓股失败: %s", e)
             return []
 
     @staticmethod
@@ -145,7 +229,7 @@ class DataFetcher:
         url = f"{DATA_SOURCES['tencent_stock']}{tencent_code}"
 
         try:
-            response = requests.get(url, timeout=10)
+            response = http_get(url, caller='get_stock_quote')
             response.encoding = 'utf-8'
             data_str = response.text.split('=')[1].rstrip(';')
             data_list = data_str.split('~')
@@ -165,7 +249,7 @@ class DataFetcher:
                 }
             return None
         except Exception as e:
-            print(f"获取股票行情失败: {e}")
+            logger.warning("获取股票行情失败: %s", e)
             return None
 
     @staticmethod
@@ -178,7 +262,7 @@ class DataFetcher:
         # 使用东方财富搜索API
         url = f"http://fundsuggest.eastmoney.com/FundSearch/api/FundSearchAPI.ashx?m=1&key={fund_keyword}"
         try:
-            response = requests.get(url, timeout=10)
+            response = http_get(url, caller='search_fund')
             data = response.json()
             funds = []
             for item in data.get('Datas', []):
@@ -189,156 +273,120 @@ class DataFetcher:
                 })
             return funds
         except Exception as e:
-            print(f"搜索基金失败: {e}")
+            logger.warning("搜索基金失败: %s", e)
             return []
 
     @staticmethod
-    @lru_cache(maxsize=512)
+    @retry_on_failure(max_retries=2, delay=1, backoff=2)
+    def _fetch_valuation_chunk(fund_codes):
+        """
+        通过东方财富多基金估值接口一次获取多个基金的估值数据
+        :param fund_codes: 基金代码元组
+        :return: {fund_code: 与 get_fund_valuation 相同格式的估值数据}，接口返回的基金可能少于请求的基金
+        """
+        params = {
+            'pageIndex': 1,
+            'pageSize': len(fund_codes),
+            'plat': 'Android',
+            'appType': 'ttjj',
+            'product': 'EFund',
+            'Version': 1,
+            'deviceid': 'Wap',
+            'Fcodes': ','.join(fund_codes)
+        }
+        response = http_get(DATA_SOURCES['fund_valuation_multi'], params=params, caller='_fetch_valuation_chunk')
+        data = response.json()
+        if data.get('ErrCode') not in (0, None) or data.get('Datas') is None:
+            raise ValueError(f"多基金估值接口返回错误: {data.get('ErrMsg')}")
+
+        def value(item, field):
+            # 没有估值的基金（如QDII）字段为 '--'
+            text = item.get(field)
+            return None if text in (None, '', '--') else text
+
+        results = {}
+        for item in data['Datas']:
+            fund_code = item.get('FCODE')
+            if not fund_code:
+                continue
+            results[fund_code] = {
+                'fund_code': fund_code,
+                'fund_name': item.get('SHORTNAME'),
+                'net_value': value(item, 'PDATE'),  # 净值日期
+                'unit_net_value': value(item, 'NAV'),  # 单位净值
+                'estimate_net_value': value(item, 'GSZ'),  # 估算净值
+                'estimate_change_rate': value(item, 'GSZZL'),  # 估算涨跌幅
+                'estimate_time': value(item, 'GZTIME')  # 估值时间
+            }
+        return results
+
+    @staticmethod
+    @ttl_cache('fund_base_info', maxsize=FETCH_CACHE_MAXSIZE, ttl_func=_rates_ttl, key_func=_fund_code_key, should_cache=_has_nav_date)
+    @single_flight('fund_base_info', key_func=_fund_code_key)
+    @retry_on_failure(max_retries=2, delay=0.5, backoff=2)
+    def get_fund_base_info(fund_code, timestamp=None):
+        """
+        获取并解析东方财富 FundBaseTypeInformation 接口的涨跌幅、单位净值和净值日期
+        get_fund_rates、get_fund_history_simple 和历史净值获取共用这一份缓存的响应（按净值公布时间缓存）
+        :param fund_code: 基金代码
+        :param timestamp: 已废弃，保留以兼容旧调用
+        :return: {'one_month_rate', 'three_month_rate', 'one_year_rate', 'daily_change_rate', 'unit_net_value', 'fsrq'}，请求失败时返回 None
+        """
+        url = f"https://fundmobapi.eastmoney.com/FundMApi/FundBaseTypeInformation.ashx?FCODE={fund_code}&deviceid=Wap&plat=Wap&product=EFund&version=2.0.0&Uid="
+        response = http_get(url, caller='get_fund_base_info')
+        return base_info_extractor.extract(response.json().get('Datas'))
+
+    @staticmethod
+    @ttl_cache('fund_pingzhongdata', maxsize=PINGZHONG_CACHE_MAXSIZE, ttl_func=_pingzhong_ttl, key_func=_fund_code_key, should_cache=_has_nav_date)
+    @single_flight('fund_pingzhongdata', key_func=_fund_code_key)
+    @retry_on_failure(max_retries=2, delay=1, backoff=2)
+    def get_pingzhongdata(fund_code, timestamp=None):
+        """
+        获取并解析天天基金 pingzhongdata/<code>.js：涨跌幅和成立以来的完整净值序列（按净值公布时间缓存）
+        :param fund_code: 基金代码
+        :param timestamp: 已废弃，保留以兼容旧调用
+        :return: parse_pingzhongdata 返回的数据
+        """
+        response = http_get(f"http://fund.eastmoney.com/pingzhongdata/{fund_code}.js", caller='get_pingzhongdata')
+        response.encoding = 'utf-8'
+        return parse_pingzhongdata(response.text)
+
+    @staticmethod
+    @ttl_cache('fund_rates', maxsize=FETCH_CACHE_MAXSIZE, ttl_func=_rates_ttl, key_func=_fund_code_key, should_cache=_has_nav_date)
+    @single_flight('fund_rates', key_func=_fund_code_key)
     @retry_on_failure(max_retries=3, delay=1, backoff=2)
     def get_fund_rates(fund_code, timestamp=None):
         """
-        只获取基金涨跌幅数据（不获取历史净值数组）
+        只获取基金涨跌幅数据（不获取历史净值数组，按净值公布时间缓存）
         :param fund_code: 基金代码
-        :param timestamp: 时间戳（用于缓存过期）
+        :param timestamp: 已废弃，保留以兼容旧调用
         :return: 涨跌幅数据
         """
-        print(f"开始获取基金 {fund_code} 的涨跌幅数据")
-        # 首先尝试使用东方财富的FundBaseTypeInformation API
-        url = f"https://fundmobapi.eastmoney.com/FundMApi/FundBaseTypeInformation.ashx?FCODE={fund_code}&deviceid=Wap&plat=Wap&product=EFund&version=2.0.0&Uid="
         try:
-            response = requests.get(url, timeout=5)  # 5秒超时
-            print(f"东方财富API响应状态码: {response.status_code}")
-            data = response.json()
-            print(f"东方财富API返回数据: {data}")
-
-            # 解析涨跌幅数据
-            one_month_rate = 0
-            three_month_rate = 0
-            one_year_rate = 0
-            daily_change_rate = 0
-
-            # 提取FSRQ（净值日期）
-            fsrq = ''
-            if data.get('Datas'):
-                fsrq = data['Datas'].get('FSRQ', '')
-                print(f"基金 {fund_code} 的FSRQ: {fsrq}")
-                # 尝试使用不同的字段名称组合
-                # 常见的字段名称组合
-                field_mappings = {
-                    'one_month': ['SYL_Y', 'syl_y', '近1月', 'OneMonth', 'syly', 'SYLY', '1y', '1Y', 'oneyear', 'OneYear'],
-                    'three_month': ['SYL_3Y', 'syl_3y', '近3月', 'ThreeMonth', 'syl3y', 'SYL3Y', '3m', '3M', 'threemonth', 'ThreeMonth'],
-                    'one_year': ['SYL_1N', 'syl_1n', '近1年', 'OneYear', 'syl1n', 'SYL1N', '1y', '1Y', 'oneyear', 'OneYear'],
-                    'daily': ['RZDF', 'rzdf', '日涨跌幅', 'DailyChange', 'rdf', 'RDF', 'daily_change', 'DAILY_CHANGE', 'zdf', 'ZDF']
-                }
-
-                # 尝试获取近1月收益率
-                for field in field_mappings['one_month']:
-                    if field in data['Datas']:
-                        try:
-                            one_month_rate = float(data['Datas'][field])
-                            print(f"使用字段 {field} 获取基金 {fund_code} 的近1月收益率: {one_month_rate}")
-                            break
-                        except (ValueError, TypeError) as e:
-                            print(f"字段 {field} 转换失败: {e}")
-                            continue
-
-                # 尝试获取近3月收益率
-                for field in field_mappings['three_month']:
-                    if field in data['Datas']:
-                        try:
-                            three_month_rate = float(data['Datas'][field])
-                            print(f"使用字段 {field} 获取基金 {fund_code} 的近3月收益率: {three_month_rate}")
-                            break
-                        except (ValueError, TypeError) as e:
-                            print(f"字段 {field} 转换失败: {e}")
-                            continue
-
-                # 尝试获取近1年收益率
-                for field in field_mappings['one_year']:
-                    if field in data['Datas']:
-                        try:
-                            one_year_rate = float(data['Datas'][field])
-                            print(f"使用字段 {field} 获取基金 {fund_code} 的近1年收益率: {one_year_rate}")
-                            break
-                        except (ValueError, TypeError) as e:
-                            print(f"字段 {field} 转换失败: {e}")
-                            continue
-
-                # 尝试获取日涨跌幅
-                for field in field_mappings['daily']:
-                    if field in data['Datas']:
-                        try:
-                            daily_change_rate = float(data['Datas'][field])
-                            print(f"使用字段 {field} 获取基金 {fund_code} 的日涨跌幅: {daily_change_rate}")
-                            break
-                        except (ValueError, TypeError) as e:
-                            print(f"字段 {field} 转换失败: {e}")
-                            continue
+            # 首先使用东方财富的FundBaseTypeInformation API（与历史净值接口共用缓存的响应）
+            base_info = DataFetcher.get_fund_base_info(fund_code) or {}
+            one_month_rate = base_info.get('one_month_rate', 0)
+            three_month_rate = base_info.get('three_month_rate', 0)
+            one_year_rate = base_info.get('one_year_rate', 0)
+            daily_change_rate = base_info.get('daily_change_rate', 0)
+            fsrq = base_info.get('fsrq', '')
 
             # 如果使用东方财富API没有获取到数据，尝试使用天天基金API
             if one_month_rate == 0 and three_month_rate == 0 and one_year_rate == 0 and daily_change_rate == 0:
-                print(f"东方财富API未获取到基金 {fund_code} 的数据，尝试使用天天基金API")
-                # 天天基金API
-                url = f"http://fund.eastmoney.com/pingzhongdata/{fund_code}.js"
+                logger.debug("东方财富API未获取到基金 %s 的数据，尝试使用天天基金API", fund_code)
                 try:
-                    response = requests.get(url, timeout=5)
-                    print(f"天天基金API响应状态码: {response.status_code}")
-                    response.encoding = 'utf-8'
-                    content = response.text
-                    print(f"天天基金API返回数据长度: {len(content)}")
-
-                    # 提取涨跌幅数据
-                    import re
-                    # 提取日涨跌幅
-                    daily_match = re.search(r'var\s+rzdf\s*=\s*"([-+]?\d+\.\d+)"', content)
-                    if daily_match:
-                        try:
-                            daily_change_rate = float(daily_match.group(1))
-                            print(f"使用正则提取基金 {fund_code} 的日涨跌幅: {daily_change_rate}")
-                        except (ValueError, TypeError) as e:
-                            print(f"日涨跌幅转换失败: {e}")
-                            pass
-
-                    # 提取近1月收益率
-                    one_month_match = re.search(r'var\s+syly\s*=\s*"([-+]?\d+\.\d+)"', content)
-                    if one_month_match:
-                        try:
-                            one_month_rate = float(one_month_match.group(1))
-                            print(f"使用正则提取基金 {fund_code} 的近1月收益率: {one_month_rate}")
-                        except (ValueError, TypeError) as e:
-                            print(f"近1月收益率转换失败: {e}")
-                            pass
-
-                    # 提取近3月收益率
-                    three_month_match = re.search(r'var\s+syl3y\s*=\s*"([-+]?\d+\.\d+)"', content)
-                    if three_month_match:
-                        try:
-                            three_month_rate = float(three_month_match.group(1))
-                            print(f"使用正则提取基金 {fund_code} 的近3月收益率: {three_month_rate}")
-                        except (ValueError, TypeError) as e:
-                            print(f"近3月收益率转换失败: {e}")
-                            pass
-
-                    # 提取近1年收益率
-                    one_year_match = re.search(r'var\s+syl1n\s*=\s*"([-+]?\d+\.\d+)"', content)
-                    if one_year_match:
-                        try:
-                            one_year_rate = float(one_year_match.group(1))
-                            print(f"使用正则提取基金 {fund_code} 的近1年收益率: {one_year_rate}")
-                        except (ValueError, TypeError) as e:
-                            print(f"近1年收益率转换失败: {e}")
-                            pass
-
-                    # 提取净值日期
-                    fsrq_match = re.search(r'var\s+fsrq\s*=\s*"([\d-]+)"', content)
-                    if fsrq_match:
-                        fsrq = fsrq_match.group(1)
-                        print(f"使用正则提取基金 {fund_code} 的FSRQ: {fsrq}")
-
+                    pingzhong = DataFetcher.get_pingzhongdata(fund_code)
+                    if pingzhong:
+                        one_month_rate = pingzhong['one_month_rate']
+                        three_month_rate = pingzhong['three_month_rate']
+                        one_year_rate = pingzhong['one_year_rate']
+                        daily_change_rate = pingzhong['daily_change_rate']
+                        fsrq = pingzhong['fsrq'] or fsrq
                 except Exception as e:
-                    print(f"使用天天基金API获取基金涨跌幅数据失败: {e}")
+                    logger.warning("使用天天基金API获取基金涨跌幅数据失败: %s", e)
 
-            print(f"基金 {fund_code} 的最终涨跌幅数据: one_month_rate={one_month_rate}, three_month_rate={three_month_rate}, one_year_rate={one_year_rate}, daily_change_rate={daily_change_rate}, fsrq={fsrq}")
+            logger.debug("基金 %s 的最终涨跌幅数据: one_month_rate=%s, three_month_rate=%s, one_year_rate=%s, daily_change_rate=%s, fsrq=%s",
+                         fund_code, one_month_rate, three_month_rate, one_year_rate, daily_change_rate, fsrq)
             return {
                 'fund_code': fund_code,
                 'one_month_rate': one_month_rate,
@@ -348,7 +396,7 @@ class DataFetcher:
                 'fsrq': fsrq
             }
         except Exception as e:
-            print(f"获取基金涨跌幅数据失败: {e}")
+            logger.warning("获取基金涨跌幅数据失败: %s", e)
             return {
                 'fund_code': fund_code,
                 'one_month_rate': 0,
@@ -359,98 +407,24 @@ class DataFetcher:
             }
 
     @staticmethod
-    @lru_cache(maxsize=256)
+    @ttl_cache('fund_history_simple', maxsize=FETCH_CACHE_MAXSIZE, ttl_func=_rates_ttl, key_func=_fund_code_key, should_cache=_has_nav_date)
+    @single_flight('fund_history_simple', key_func=_fund_code_key)
     def get_fund_history_simple(fund_code, timestamp=None):
         """
-        获取基金基本涨跌幅数据，不获取完整的历史净值
+        获取基金基本涨跌幅数据，不获取完整的历史净值（按净值公布时间缓存）
         :param fund_code: 基金代码
-        :param timestamp: 时间戳（用于缓存过期）
+        :param timestamp: 已废弃，保留以兼容旧调用
         :return: 涨跌幅数据
         """
-        # 使用东方财富的FundBaseTypeInformation API获取涨跌幅数据
-        url = f"https://fundmobapi.eastmoney.com/FundMApi/FundBaseTypeInformation.ashx?FCODE={fund_code}&deviceid=Wap&plat=Wap&product=EFund&version=2.0.0&Uid="
         try:
-            response = requests.get(url, timeout=3)  # 3秒超时
-            data = response.json()
-
-            # 解析涨跌幅数据
-            one_month_rate = 0
-            three_month_rate = 0
-            one_year_rate = 0
-            daily_change_rate = 0
-            unit_net_value = 0
-
-            # 提取FSRQ（净值日期）
-            fsrq = ''
-            if data.get('Datas'):
-                fsrq = data['Datas'].get('FSRQ', '')
-                # 尝试使用不同的字段名称组合
-                # 常见的字段名称组合
-                field_mappings = {
-                    'one_month': ['SYL_Y', 'syl_y', '近1月', 'OneMonth'],
-                    'three_month': ['SYL_3Y', 'syl_3y', '近3月', 'ThreeMonth'],
-                    'one_year': ['SYL_1N', 'syl_1n', '近1年', 'OneYear'],
-                    'daily': ['RZDF', 'rzdf', '日涨跌幅', 'DailyChange'],
-                    'unit_net_value': ['DWJZ', 'dwjz', '单位净值', 'UnitNetValue']
-                }
-
-                # 尝试获取近1月收益率
-                for field in field_mappings['one_month']:
-                    if field in data['Datas']:
-                        try:
-                            one_month_rate = float(data['Datas'][field])
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                # 尝试获取近3月收益率
-                for field in field_mappings['three_month']:
-                    if field in data['Datas']:
-                        try:
-                            three_month_rate = float(data['Datas'][field])
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                # 尝试获取近1年收益率
-                for field in field_mappings['one_year']:
-                    if field in data['Datas']:
-                        try:
-                            one_year_rate = float(data['Datas'][field])
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                # 尝试获取日涨跌幅
-                for field in field_mappings['daily']:
-                    if field in data['Datas']:
-                        try:
-                            daily_change_rate = float(data['Datas'][field])
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                # 尝试获取单位净值
-                for field in field_mappings['unit_net_value']:
-                    if field in data['Datas']:
-                        try:
-                            unit_net_value = float(data['Datas'][field])
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-            return {
-                'fund_code': fund_code,
-                'net_values': [],  # 空数组，不返回历史数据
-                'one_month_rate': one_month_rate,
-                'three_month_rate': three_month_rate,
-                'one_year_rate': one_year_rate,
-                'daily_change_rate': daily_change_rate,
-                'fsrq': fsrq,
-                'unit_net_value': unit_net_value
-            }
+            # 使用东方财富的FundBaseTypeInformation API获取涨跌幅数据（与其他调用方共用缓存的响应）
+            base_info = DataFetcher.get_fund_base_info(fund_code)
+            if base_info is None:
+                raise ValueError("FundBaseTypeInformation 接口请求失败")
+            # net_values 为空数组，不返回历史数据
+            return dict(base_info, fund_code=fund_code, net_values=[])
         except Exception as e:
-            print(f"获取基金涨跌幅数据失败: {e}")
+            logger.warning("获取基金涨跌幅数据失败: %s", e)
             return {
                 'fund_code': fund_code,
                 'net_values': [],
@@ -462,165 +436,240 @@ class DataFetcher:
                 'unit_net_value': 0
             }
 
+    @staticmethod
+    def refresh_fund_history_simple(fund_code):
+        """
+        跳过缓存重新请求基金涨跌幅数据（用于轮询当日净值是否已公布），并更新缓存
+        :param fund_code: 基金代码
+        :return: 涨跌幅数据
+        """
+        DataFetcher.get_fund_base_info.invalidate(fund_code)
+        return DataFetcher.get_fund_history_simple.refresh(fund_code)
+
     @staticmethod
     def get_fund_history(fund_code, timestamp=None):
         """
-        获取基金历史净值数据
+        获取基金历史净值数据（带缓存，过期时间由净值日期决定）
         :param fund_code: 基金代码
-        :param timestamp: 时间戳（用于缓存过期）
+        :param timestamp: 已废弃，保留以兼容旧调用
         :return: 历史净值数据和涨跌幅数据
         """
-        # 确保timestamp为天级时间戳，实现24小时缓存过期
-        if timestamp is None:
-            # 使用天级时间戳（86400秒）
-            timestamp = int(time.time() / 86400)
-
-        # 内部函数，用于缓存
-        @lru_cache(maxsize=128)
-        def _get_fund_history(fund_code, timestamp):
-            # 使用东方财富的FundBaseTypeInformation API获取涨跌幅数据
-            url = f"https://fundmobapi.eastmoney.com/FundMApi/FundBaseTypeInformation.ashx?FCODE={fund_code}&deviceid=Wap&plat=Wap&product=EFund&version=2.0.0&Uid="
-            try:
-                response = requests.get(url, timeout=5)
-                data = response.json()
-
-                # 解析涨跌幅数据
-                one_month_rate = 0
-                three_month_rate = 0
-                one_year_rate = 0
-                daily_change_rate = 0
-
-                # 提取FSRQ（净值日期）
-                fsrq = ''
-                unit_net_value = 0
-                if data.get('Datas'):
-                    fsrq = data['Datas'].get('FSRQ', '')
-                    # 尝试使用不同的字段名称组合
-                    # 常见的字段名称组合
-                    field_mappings = {
-                        'one_month': ['SYL_Y', 'syl_y', '近1月', 'OneMonth'],
-                        'three_month': ['SYL_3Y', 'syl_3y', '近3月', 'ThreeMonth'],
-                        'one_year': ['SYL_1N', 'syl_1n', '近1年', 'OneYear'],
-                        'daily': ['RZDF', 'rzdf', '日涨跌幅', 'DailyChange'],
-                        'unit_net_value': ['DWJZ', 'dwjz', '单位净值', 'UnitNetValue']
-                    }
+        cached = _history_cache.get(fund_code)
+        if cached is not None:
+            return cached
 
-                    # 尝试获取单位净值
-                    for field in field_mappings['unit_net_value']:
-                        if field in data['Datas']:
-                            try:
-                                unit_net_value = float(data['Datas'][field])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    # 尝试获取近1月收益率
-                    for field in field_mappings['one_month']:
-                        if field in data['Datas']:
-                            try:
-                                one_month_rate = float(data['Datas'][field])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    # 尝试获取近3月收益率
-                    for field in field_mappings['three_month']:
-                        if field in data['Datas']:
-                            try:
-                                three_month_rate = float(data['Datas'][field])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    # 尝试获取近1年收益率
-                    for field in field_mappings['one_year']:
-                        if field in data['Datas']:
-                            try:
-                                one_year_rate = float(data['Datas'][field])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    # 尝试获取日涨跌幅
-                    for field in field_mappings['daily']:
-                        if field in data['Datas']:
-                            try:
-                                daily_change_rate = float(data['Datas'][field])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                # 同时获取历史净值数据
+        # 同一基金的并发请求共享一次上游请求
+        return _history_flight.do(fund_code, DataFetcher._fetch_and_cache_history, fund_code)
+
+    @staticmethod
+    def _fetch_and_cache_history(fund_code):
+        result = DataFetcher._fetch_fund_history(fund_code)
+        # 获取失败（没有净值日期且没有历史数据）时不缓存，下次重新请求
+        if result.get('fsrq') or result.get('net_values'):
+            _history_cache.set(fund_code, result, expires_at=_history_expires_at(result.get('fsrq')))
+        return result
+
+    @staticmethod
+    def get_fund_history_since(fund_code, since_date=None):
+        """
+        增量获取基金历史净值数据：只请求晚于 since_date 的记录，遇到已有日期即停止翻页
+        :param fund_code: 基金代码
+        :param since_date: 已存储的最新净值日期，格式YYYY-MM-DD，为空时获取完整数据
+        :return: 与 get_fund_history 相同格式的数据，net_values 只包含新增记录
+        """
+        if not since_date:
+            return DataFetcher.get_fund_history(fund_code)
+        return DataFetcher._fetch_fund_history(fund_code, since_date=since_date)
+
+    @staticmethod
+    def get_fund_history_full(fund_code):
+        """
+        获取基金完整历史净值数据（不受500条限制），用于回填
+        根据第一页返回的 TotalCount 并发获取其余各页
+        :param fund_code: 基金代码
+        :return: 与 get_fund_history 相同格式的数据，net_values 为完整序列
+        """
+        return _history_full_flight.do(fund_code, DataFetcher._fetch_fund_history, fund_code, full=True)
+
+    @staticmethod
+    def _fetch_all_nav_pages(fund_code, page_size=HISTORY_PAGE_SIZE):
+        """
+        获取全部历史净值：先取第一页得到总条数，再通过抓取引擎并发获取剩余页
+        任意一页获取失败时抛出异常，避免把不完整的序列当作完整数据
+        :param fund_code: 基金代码
+        :param page_size: 每页条数
+        :return: 按日期倒序的净值列表
+        """
+        first_page, total_count = DataFetcher._fetch_nav_page(fund_code, 1, page_size)
+        page_count = (total_count + page_size - 1) // page_size
+        if page_count <= 1:
+            return first_page
+
+        errors = {}
+
+        def on_error(page_index, e):
+            errors[page_index] = e
+            return None
+
+        pages = fetch_engine.map(
+            lambda page_index: DataFetcher._fetch_nav_page(fund_code, page_index, page_size),
+            range(2, page_count + 1),
+            on_error=on_error,
+            max_in_flight=HISTORY_BACKFILL_WORKERS
+        )
+        if errors:
+            raise Exception(f"获取基金 {fund_code} 第 {sorted(errors)} 页历史净值失败: {next(iter(errors.values()))}")
+
+        net_values = list(first_page)
+        for page_index in range(2, page_count + 1):
+            net_values.extend(pages[page_index][0])
+        return net_values
+
+    @staticmethod
+    @retry_on_failure(max_retries=3, delay=1, backoff=2)
+    def _fetch_nav_page(fund_code, page_index, page_size=HISTORY_PAGE_SIZE, start_date=''):
+        """
+        获取一页历史净值数据
+        :param fund_code: 基金代码
+        :param page_index: 页码，从1开始
+        :param page_size: 每页条数
+        :param start_date: 开始日期（包含），为空时不限制
+        :return: (净值列表, 总条数)，没有数据时返回 ([], 0)
+        """
+        net_values_url = f"https://api.fund.eastmoney.com/f10/lsjz?fundCode={fund_code}&pageIndex={page_index}&pageSize={page_size}&startDate={start_date}&endDate="
+        headers = {
+            "Referer": f"https://fundf10.eastmoney.com/jjjz_{fund_code}.html",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+        }
+        net_values_response = http_get(net_values_url, headers=headers, caller='_fetch_nav_page')
+        net_values_data = net_values_response.json()
+
+        if not (net_values_data.get('Data') and net_values_data['Data'].get('LSJZList')):
+            return [], 0
+
+        net_values = []
+        for item in net_values_data['Data']['LSJZList']:
+            # 跳过DWJZ为空的记录（如节假日）
+            if item.get('DWJZ'):
+                net_values.append({
+                    'date': item.get('FSRQ'),
+                    'unit_net_value': item.get('DWJZ'),
+                    'cumulative_net_value': item.get('LJJZ'),
+                    'change_rate': item.get('JZZZL')
+                })
+        return net_values, net_values_data.get('TotalCount', 0)
+
+    @staticmethod
+    def _pingzhong_net_values(fund_code):
+        """
+        从 pingzhongdata 获取完整净值序列，获取失败时返回 None
+        :param fund_code: 基金代码
+        :return: 历史净值列表（按日期倒序）或 None
+        """
+        try:
+            pingzhong = DataFetcher.get_pingzhongdata(fund_code)
+            return pingzhong['net_values'] if pingzhong else None
+        except Exception as e:
+            logger.warning("从 pingzhongdata 获取基金 %s 净值序列失败: %s", fund_code, e)
+            return None
+
+    @staticmethod
+    def _fetch_fund_history(fund_code, since_date=None, full=False):
+        """
+        从第三方接口获取基金历史净值数据（不经过缓存）
+        :param fund_code: 基金代码
+        :param since_date: 只获取晚于该日期的记录，为空时获取最近500条
+        :param full: 是否获取完整历史净值
+        :return: 历史净值数据和涨跌幅数据
+        """
+        try:
+            # 使用东方财富的FundBaseTypeInformation API获取涨跌幅数据（与其他调用方共用缓存的响应）
+            base_info = DataFetcher.get_fund_base_info(fund_code)
+            if base_info is None:
+                raise ValueError("FundBaseTypeInformation 接口请求失败")
+            one_month_rate = base_info['one_month_rate']
+            three_month_rate = base_info['three_month_rate']
+            one_year_rate = base_info['one_year_rate']
+            daily_change_rate = base_info['daily_change_rate']
+            fsrq = base_info['fsrq']
+            unit_net_value = base_info['unit_net_value']
+
+            # 同时获取历史净值数据（接口按日期倒序返回）
+            # 完整历史或最近500条优先从 pingzhongdata 一次获取，失败时按页请求历史净值接口；增量获取只需请求一页
+            net_values = DataFetcher._pingzhong_net_values(fund_code) if full or not since_date else None
+            if net_values:
+                if not full:
+                    net_values = net_values[:500]
+            elif full:
+                net_values = DataFetcher._fetch_all_nav_pages(fund_code)
+            else:
                 net_values = []
                 page_index = 1
-                page_size = 100
+                page_size = HISTORY_PAGE_SIZE
 
                 while True:
-                    net_values_url = f"https://api.fund.eastmoney.com/f10/lsjz?fundCode={fund_code}&pageIndex={page_index}&pageSize={page_size}"
-                    headers = {
-                        "Referer": f"https://fundf10.eastmoney.com/jjjz_{fund_code}.html",
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    }
-                    net_values_response = requests.get(net_values_url, headers=headers, timeout=10)
-                    net_values_data = net_values_response.json()
-
-                    # 解析历史净值数据
-                    if net_values_data.get('Data') and net_values_data['Data'].get('LSJZList'):
-                        for item in net_values_data['Data']['LSJZList']:
-                            # 跳过DWJZ为空的记录（如节假日）
-                            if item.get('DWJZ'):
-                                net_values.append({
-                                    'date': item.get('FSRQ'),
-                                    'unit_net_value': item.get('DWJZ'),
-                                    'cumulative_net_value': item.get('LJJZ'),
-                                    'change_rate': item.get('JZZZL')
-                                })
-
-                        # 检查是否还有更多数据
-                        total_count = net_values_data.get('TotalCount', 0)
-                        if len(net_values) >= total_count or len(net_values) >= 500:
+                    page, total_count = DataFetcher._fetch_nav_page(fund_code, page_index, page_size, since_date or '')
+                    if not page:
+                        break
+
+                    if since_date:
+                        # 增量模式：遇到已存储的日期说明后面都是已有数据
+                        new_values = [item for item in page if item['date'] > since_date]
+                        net_values.extend(new_values)
+                        if len(new_values) < len(page):
                             break
-                        page_index += 1
                     else:
-                        break
+                        net_values.extend(page)
 
-                return {
-                    'fund_code': fund_code,
-                    'net_values': net_values,
-                    'one_month_rate': one_month_rate,
-                    'three_month_rate': three_month_rate,
-                    'one_year_rate': one_year_rate,
-                    'daily_change_rate': daily_change_rate,
-                    'fsrq': fsrq,
-                    'unit_net_value': unit_net_value
-                }
-            except Exception as e:
-                print(f"获取基金历史净值失败: {e}")
-                return {
-                    'fund_code': fund_code,
-                    'net_values': [],
-                    'one_month_rate': 0,
-                    'three_month_rate': 0,
-                    'one_year_rate': 0,
-                    'daily_change_rate': 0,
-                    'fsrq': '',
-                    'unit_net_value': 0
-                }
+                    # 检查是否还有更多数据
+                    if page_index * page_size >= total_count or (not since_date and len(net_values) >= 500):
+                        break
+                    page_index += 1
 
-        # 调用内部函数
-        return _get_fund_history(fund_code, timestamp)
+            return {
+                'fund_code': fund_code,
+                'net_values': net_values,
+                'one_month_rate': one_month_rate,
+                'three_month_rate': three_month_rate,
+                'one_year_rate': one_year_rate,
+                'daily_change_rate': daily_change_rate,
+                'fsrq': fsrq,
+                'unit_net_value': unit_net_value
+            }
+        except Exception as e:
+            logger.warning("获取基金历史净值失败: %s", e)
+            return {
+                'fund_code': fund_code,
+                'net_values': [],
+                'one_month_rate': 0,
+                'three_month_rate': 0,
+                'one_year_rate': 0,
+                'daily_change_rate': 0,
+                'fsrq': '',
+                'unit_net_value': 0
+            }
 
     @staticmethod
-    @lru_cache(maxsize=512)
     def get_fund_history_by_date(fund_code, target_date):
         """
-        根据基金代码和日期获取历史净值
+        根据基金代码和日期获取历史净值：优先读取 fund_nav_history 表，没有时再从接口获取
         :param fund_code: 基金代码
         :param target_date: 目标日期，格式为 'YYYY-MM-DD'
         :return: 对应日期的净值数据，或 None
         """
+        db = SessionLocal()
         try:
-            # 获取基金历史净值数据
+            fund = db.query(Fund).filter(Fund.fund_code == fund_code).first()
+            record = get_nav_by_date(db, fund.id, target_date) if fund else None
+            if record:
+                return dict(record, fund_code=fund_code)
+        except Exception as e:
+            logger.warning("从数据库读取基金 %s 在 %s 的净值失败: %s", fund_code, target_date, e)
+        finally:
+            db.close()
+
+        try:
+            # 数据库中没有时从接口获取基金历史净值数据
             history_data = DataFetcher.get_fund_history(fund_code)
             net_values = history_data.get('net_values', [])
 
@@ -638,7 +687,7 @@ class DataFetcher:
             # 如果没有找到目标日期的净值，返回 None
             return None
         except Exception as e:
-            print(f"获取基金历史净值失败: {e}")
+            logger.warning("获取基金历史净值失败: %s", e)
             return None
 
     @staticmethod
@@ -646,71 +695,72 @@ class DataFetcher:
         """
         批量并发获取多个基金的涨跌幅数据
         :param fund_codes: 基金代码列表
-        :param timestamp: 时间戳（用于缓存过期）
+        :param timestamp: 已废弃，保留以兼容旧调用
         :return: 基金数据字典 {fund_code: data}
         """
         if not fund_codes:
             return {}
 
-        results = {}
-
-        # 使用线程池并发获取数据
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            # 提交所有任务
-            future_to_fund = {
-                executor.submit(DataFetcher.get_fund_rates, fund_code, timestamp): fund_code
-                for fund_code in fund_codes
+        def on_error(fund_code, e):
+            logger.warning("获取基金 %s 数据失败: %s", fund_code, e)
+            # 返回默认数据，避免阻塞其他基金
+            return {
+                'fund_code': fund_code,
+                'one_month_rate': 0,
+                'three_month_rate': 0,
+                'one_year_rate': 0,
+                'daily_change_rate': 0,
+                'fsrq': ''
             }
 
-            # 等待所有任务完成
-            for future in as_completed(future_to_fund):
-                fund_code = future_to_fund[future]
-                try:
-                    data = future.result(timeout=15)  # 增加超时时间到15秒
-                    results[fund_code] = data
-                except Exception as e:
-                    print(f"获取基金 {fund_code} 数据失败: {e}")
-                    # 返回默认数据，避免阻塞其他基金
-                    results[fund_code] = {
-                        'fund_code': fund_code,
-                        'one_month_rate': 0,
-                        'three_month_rate': 0,
-                        'one_year_rate': 0,
-                        'daily_change_rate': 0,
-                        'fsrq': ''
-                    }
-
-        return results
+        # 通过抓取引擎并发获取数据
+        return fetch_engine.map(DataFetcher.get_fund_rates, fund_codes, on_error=on_error)
 
     @staticmethod
     def get_fund_valuation_batch(fund_codes, timestamp=None):
         """
-        批量并发获取多个基金的估值数据
+        批量获取多个基金的估值数据
+        未命中缓存的基金按 VALUATION_BATCH_SIZE 分组，通过多基金估值接口并发请求；
+        某组请求失败或接口没有返回的基金，再逐个使用单基金估值接口获取
         :param fund_codes: 基金代码列表
-        :param timestamp: 时间戳（用于缓存过期）
-        :return: 基金数据字典 {fund_code: data}
+        :param timestamp: 已废弃，保留以兼容旧调用
+        :return: 基金数据字典 {fund_code: data}，包含所有请求的基金，两种接口都获取失败的基金值为 None
         """
         if not fund_codes:
             return {}
 
+        def on_error(fund_code, e):
+            logger.warning("获取基金 %s 估值数据失败: %s", fund_code, e)
+            return None
+
+        cache = DataFetcher.get_fund_valuation.cache
         results = {}
+        missing = []
+        for fund_code in dict.fromkeys(fund_codes):
+            cached = cache.get(fund_code)
+            if cached is not None:
+                results[fund_code] = cached
+            else:
+                missing.append(fund_code)
 
-        # 使用线程池并发获取数据
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            # 提交所有任务
-            future_to_fund = {
-                executor.submit(DataFetcher.get_fund_valuation, fund_code, timestamp): fund_code
-                for fund_code in fund_codes
-            }
+        if missing:
+            chunks = [tuple(missing[i:i + VALUATION_BATCH_SIZE]) for i in range(0, len(missing), VALUATION_BATCH_SIZE)]
 
-            # 等待所有任务完成
-            for future in as_completed(future_to_fund):
-                fund_code = future_to_fund[future]
-                try:
-                    data = future.result(timeout=15)  # 增加超时时间到15秒
-                    results[fund_code] = data
-                except Exception as e:
-                    print(f"获取基金 {fund_code} 估值数据失败: {e}")
-                    results[fund_code] = None
+            def on_chunk_error(chunk, e):
+                logger.warning("多基金估值接口请求失败（%d 个基金），改为逐个获取: %s", len(chunk), e)
+                return None
+
+            ttl = _valuation_ttl()
+            requested = set(missing)
+            for chunk_results in fetch_engine.map(DataFetcher._fetch_valuation_chunk, chunks, on_error=on_chunk_error).values():
+                for fund_code, data in (chunk_results or {}).items():
+                    if fund_code in requested:
+                        results[fund_code] = data
+                        cache.set(fund_code, data, ttl=ttl)
+
+            # 分组请求失败或没有返回的基金，使用单基金估值接口
+            fallback = [fund_code for fund_code in missing if fund_code not in results]
+            if fallback:
+                results.update(fetch_engine.map(DataFetcher.get_fund_valuation, fallback, on_error=on_error))
 
         return results
@@ -0,0 +1,193 @@
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import FundRealtimeData, FundNavHistory
+from metrics import db_retries
+
+logger = logging.getLogger(__name__)
+
+# 累计写入统计
+_stats = {
+    'batches': 0,
+    'rows': 0,
+    'statements': 0,
+    'total_ms': 0.0,
+    'last_batch_rows': 0,
+    'last_batch_ms': 0.0
+}
+_stats_lock = threading.Lock()
+
+
+# 数据库操作重试装饰器
+def retry_db_operation(max_retries=3, base_delay=0.1):
+    """
+    数据库操作重试装饰器，用于处理数据库锁定和死锁问题
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    error_msg = str(e)
+                    if ('database is locked' in error_msg or 'deadlock detected' in error_msg) and attempt < max_retries - 1:
+                        delay = base_delay * (2 ** attempt) + random.uniform(0, 0.1)
+                        logger.warning("数据库锁定或死锁，第%s次重试，等待%.2f秒...", attempt + 1, delay)
+                        db_retries.inc(operation=func.__name__, outcome='retry')
+                        time.sleep(delay)
+                    else:
+                        logger.error("数据库操作失败: %s", e)
+                        db_retries.inc(operation=func.__name__, outcome='failed')
+                        raise
+        return wrapper
+    return decorator
+
+
+def _dialect_insert(db):
+    """
+    获取支持 ON CONFLICT 的 insert 构造函数，不支持的数据库返回 None
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert
+    if dialect == 'sqlite':
+        return sqlite.insert
+    return None
+
+
+def _group_rows(rows):
+    """
+    按列集合对记录分组，同一条 INSERT 语句中的记录必须有相同的列
+    :param rows: 记录列表
+    :return: {列集合: 记录列表}
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+    return groups
+
+
+def _upsert_statement(dialect_insert, table, columns, group):
+    stmt = dialect_insert(table).values(group)
+    update_columns = {column: stmt.excluded[column] for column in columns if column not in ('id', 'fund_id')}
+    update_columns['updated_at'] = func.now()
+    return stmt.on_conflict_do_update(index_elements=['fund_id'], set_=update_columns)
+
+
+def _upsert_fallback(db, columns, group):
+    """
+    不支持 ON CONFLICT 的数据库：逐条查询后更新或插入
+    """
+    for row in group:
+        realtime_data = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id == row['fund_id']).first()
+        if realtime_data:
+            for column in columns:
+                setattr(realtime_data, column, row[column])
+        else:
+            db.add(FundRealtimeData(**row))
+    db.flush()
+
+
+def _expire_cached_instances(db, fund_ids):
+    """
+    批量语句绕过了ORM，会话中已加载的实时数据对象需要失效，下次访问时重新读取
+    """
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, FundRealtimeData) and obj.fund_id in fund_ids:
+            db.expire(obj)
+
+
+def bulk_upsert_realtime_data(db, rows):
+    """
+    使用一条 INSERT ... ON CONFLICT (fund_id) DO UPDATE 语句批量写入基金实时数据
+    PostgreSQL 和 SQLite 使用原生语法，其他数据库逐条写入。不提交事务，由调用方提交。
+    :param db: 数据库会话
+    :param rows: 记录列表，每条记录必须包含 fund_id，其余键为 FundRealtimeData 的列名
+    :return: 本批次统计 {'rows': 写入条数, 'statements': 语句数, 'elapsed_ms': 耗时毫秒}
+    """
+    start = time.perf_counter()
+    rows = [row for row in rows if row.get('fund_id') is not None]
+    if not rows:
+        return {'rows': 0, 'statements': 0, 'elapsed_ms': 0.0}
+
+    # 同一批次中同一基金只保留最后一条
+    rows = list({row['fund_id']: row for row in rows}.values())
+
+    dialect_insert = _dialect_insert(db)
+    table = FundRealtimeData.__table__
+    statements = 0
+    for columns, group in _group_rows(rows).items():
+        if dialect_insert is not None:
+            db.execute(_upsert_statement(dialect_insert, table, columns, group))
+        else:
+            _upsert_fallback(db, columns, group)
+        statements += 1
+
+    _expire_cached_instances(db, {row['fund_id'] for row in rows})
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats['batches'] += 1
+        _stats['rows'] += len(rows)
+        _stats['statements'] += statements
+        _stats['total_ms'] += elapsed_ms
+        _stats['last_batch_rows'] = len(rows)
+        _stats['last_batch_ms'] = elapsed_ms
+
+    logger.info("批量写入基金实时数据: %s 条，%s 条语句，耗时 %.1fms", len(rows), statements, elapsed_ms)
+    return {'rows': len(rows), 'statements': statements, 'elapsed_ms': round(elapsed_ms, 2)}
+
+
+def bulk_upsert_nav_history(db, rows, chunk_size=1000):
+    """
+    批量写入基金历史净值，主键 (fund_id, date) 冲突时更新净值。不提交事务，由调用方提交。
+    :param db: 数据库会话
+    :param rows: 记录列表，每条记录包含 fund_id, date, unit_nav, cumulative_nav, change_rate
+    :param chunk_size: 每条语句写入的最大记录数
+    :return: 写入条数
+    """
+    # 同一基金同一日期只保留最后一条
+    rows = list({(row['fund_id'], row['date']): row for row in rows if row.get('date')}.values())
+    if not rows:
+        return 0
+
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            db.merge(FundNavHistory(**row))
+        db.flush()
+        return len(rows)
+
+    table = FundNavHistory.__table__
+    for i in range(0, len(rows), chunk_size):
+        stmt = dialect_insert(table).values(rows[i:i + chunk_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['fund_id', 'date'],
+            set_={
+                'unit_nav': stmt.excluded.unit_nav,
+                'cumulative_nav': stmt.excluded.cumulative_nav,
+                'change_rate': stmt.excluded.change_rate
+            }
+        )
+        db.execute(stmt)
+    return len(rows)
+
+
+def get_writer_stats():
+    """
+    获取累计写入统计
+    :return: 统计字典
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['total_ms'] = round(stats['total_ms'], 2)
+    stats['last_batch_ms'] = round(stats['last_batch_ms'], 2)
+    return stats
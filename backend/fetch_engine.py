@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FETCH_MAX_IN_FLIGHT, FETCH_TASK_TIMEOUT
+
+
+class FetchEngine:
+    """
+    基于 asyncio 的批量抓取引擎
+    事件循环运行在后台线程中，负责调度和限制同时进行的上游请求数：
+    所有调用共享一个引擎级的名额（max_in_flight），单次调用的 max_in_flight 只能在此之内进一步限制；
+    阻塞的抓取函数（连接池、缓存、重试逻辑均在其中）在共享的工作线程中执行。
+    对外提供同步接口，Flask 路由和定时任务可以直接调用。
+    """
+
+    def __init__(self, max_in_flight=FETCH_MAX_IN_FLIGHT, task_timeout=FETCH_TASK_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.task_timeout = task_timeout
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._slots = None  # 引擎级并发名额，所有 map/imap 调用共享
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _ensure_started(self):
+        """
+        启动后台事件循环（仅首次调用时）
+        """
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight,
+                    thread_name_prefix='fetch-worker',
+                    initializer=self._mark_worker
+                )
+                loop.set_default_executor(self._executor)
+                self._slots = asyncio.Semaphore(self.max_in_flight)
+                thread = threading.Thread(target=loop.run_forever, name='fetch-engine', daemon=True)
+                thread.start()
+                self._thread = thread
+                self._loop = loop
+        return self._loop
+
+    def _mark_worker(self):
+        self._local.is_worker = True
+
+    def _in_worker(self):
+        return getattr(self._local, 'is_worker', False) or threading.current_thread() is self._thread
+
+    def _call_slots(self, max_in_flight):
+        """
+        单次调用的并发名额，不超过引擎上限
+        """
+        return asyncio.Semaphore(min(max_in_flight or self.max_in_flight, self.max_in_flight))
+
+    async def _run_one(self, call_slots, func, key, args, timeout, context):
+        # 先取得本次调用的名额再占用引擎名额，等待本次调用名额时不占用其他调用可用的引擎名额
+        await call_slots.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            call_slots.release()
+            raise
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def mark_started():
+            if not started.done():
+                started.set_result(None)
+
+        def call():
+            loop.call_soon_threadsafe(mark_started)
+            # 在调用方上下文的副本中执行，工作线程中的日志保留请求的关联ID
+            return context.copy().run(func, key, *args)
+
+        future = loop.run_in_executor(None, call)
+
+        def release(done):
+            # 超时后工作线程中的请求仍在进行，请求真正结束时才释放名额，同时进行的上游请求不会超过上限
+            self._slots.release()
+            call_slots.release()
+            if not done.cancelled():
+                done.exception()  # 超时后结束的任务，其异常已不再需要，取出以免事件循环报告未处理的异常
+
+        future.add_done_callback(release)
+        # 超时从工作线程开始执行时计算，在线程池中排队的时间不计入
+        await asyncio.wait([started, future], return_when=asyncio.FIRST_COMPLETED)
+        # shield：超时只停止等待结果，不把执行中的任务标记为已结束
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def _gather(self, func, keys, args, timeout, max_in_flight, context):
+        call_slots = self._call_slots(max_in_flight)
+        tasks = [self._run_one(call_slots, func, key, args, timeout, context) for key in keys]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _feed(self, func, keys, args, timeout, max_in_flight, out, context):
+        call_slots = self._call_slots(max_in_flight)
+
+        async def run(key):
+            try:
+                out.put((key, await self._run_one(call_slots, func, key, args, timeout, context)))
+            except Exception as e:
+                out.put((key, e))
+
+        await asyncio.gather(*(run(key) for key in keys))
+
+    def _result(self, key, outcome, timeout, on_error):
+        """
+        将任务结果转换为返回值，失败时交给 on_error 处理
+        """
+        if isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.TimeoutError):
+                outcome = TimeoutError(f"抓取超时（{timeout}秒）")
+            return on_error(key, outcome) if on_error else None
+        return outcome
+
+    def map(self, func, keys, *args, timeout=None, on_error=None, max_in_flight=None):
+        """
+        并发执行 func(key, *args)，返回 {key: result}
+        :param func: 同步抓取函数，第一个参数为键（如基金代码）
+        :param keys: 键列表
+        :param args: 透传给 func 的其余参数
+        :param timeout: 单个任务超时时间（秒）
+        :param on_error: 任务失败时的回调 on_error(key, exception)，返回值作为该键的结果
+        :param max_in_flight: 本次调用的最大并发数，不超过引擎上限
+        :return: 结果字典 {key: result}
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        timeout = timeout or self.task_timeout
+
+        # 在抓取线程内部嵌套调用时串行执行，避免占满工作线程导致死锁
+        if self._in_worker():
+            results = {}
+            for key in keys:
+                try:
+                    results[key] = func(key, *args)
+                except Exception as e:
+                    results[key] = on_error(key, e) if on_error else None
+            return results
+
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._gather(func, keys, args, timeout, max_in_flight, contextvars.copy_context()), loop)
+        outcomes = future.result()
+
+        return {key: self._result(key, outcome, timeout, on_error) for key, outcome in zip(keys, outcomes)}
+
+    def imap(self, func, keys, *args, timeout=None, on_error=None, max_in_flight=None):
+        """
+        并发执行 func(key, *args)，按完成顺序逐个产出 (key, result)
+        参数与 map 相同，用于边抓取边返回结果的场景（如流式接口）
+        :return: 生成器，产出 (key, result)
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return
+        timeout = timeout or self.task_timeout
+
+        if self._in_worker():
+            for key in keys:
+                try:
+                    yield key, func(key, *args)
+                except Exception as e:
+                    yield key, on_error(key, e) if on_error else None
+            return
+
+        loop = self._ensure_started()
+        out = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._feed(func, keys, args, timeout, max_in_flight, out, contextvars.copy_context()), loop)
+        for _ in keys:
+            key, outcome = out.get()
+            yield key, self._result(key, outcome, timeout, on_error)
+
+    def shutdown(self):
+        """
+        停止事件循环并关闭工作线程
+        """
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._executor.shutdown(wait=False)
+            self._loop = None
+            self._thread = None
+            self._executor = None
+            self._slots = None
+
+
+# 全局抓取引擎
+fetch_engine = FetchEngine()
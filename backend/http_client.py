@@ -0,0 +1,97 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_DEFAULT_TIMEOUT,
+    HTTP_HOST_TIMEOUTS,
+    HTTP_HOST_POOL_SIZES,
+)
+from metrics import upstream_latency
+
+# 按 (scheme, host) 缓存的会话，每个会话挂载独立的连接池
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _host_key(url):
+    """
+    解析URL得到连接池键
+    :param url: 请求地址
+    :return: (scheme, host)
+    """
+    parts = urlsplit(url)
+    return parts.scheme or 'http', parts.hostname or ''
+
+
+def get_session(url):
+    """
+    获取目标主机对应的长连接会话，不存在则创建
+    :param url: 请求地址
+    :return: requests.Session
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            scheme, host = key
+            pool_maxsize = HTTP_HOST_POOL_SIZES.get(host, HTTP_POOL_MAXSIZE)
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=pool_maxsize,
+                max_retries=HTTP_MAX_RETRIES,
+                pool_block=False
+            )
+            session = requests.Session()
+            session.mount(f"{scheme}://{host}", adapter)
+            _sessions[key] = session
+    return session
+
+
+def get_timeout(url):
+    """
+    获取目标主机的超时时间
+    :param url: 请求地址
+    :return: 超时时间（秒）
+    """
+    return HTTP_HOST_TIMEOUTS.get(_host_key(url)[1], HTTP_DEFAULT_TIMEOUT)
+
+
+def http_get(url, timeout=None, caller='unknown', **kwargs):
+    """
+    通过共享连接池发送GET请求，按调用方法和主机记录请求耗时
+    :param url: 请求地址
+    :param timeout: 超时时间（秒），为空时使用主机配置
+    :param caller: 调用方法名称（监控指标的 method 标签）
+    :return: requests.Response
+    """
+    if timeout is None:
+        timeout = get_timeout(url)
+    status = 'error'
+    start = time.perf_counter()
+    try:
+        response = get_session(url).get(url, timeout=timeout, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        upstream_latency.observe(time.perf_counter() - start, method=caller, host=_host_key(url)[1], status=status)
+
+
+def close_sessions():
+    """
+    关闭所有会话，释放连接池
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
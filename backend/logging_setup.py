@@ -0,0 +1,108 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_PAYLOAD_SAMPLE_RATE, REQUEST_ID_HEADER
+
+# 当前请求的关联ID，定时任务等非请求上下文中为 '-'
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+_listener = None
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(request_id)s] %(name)s - %(message)s'
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    为日志记录添加当前请求的关联ID
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    以单行 JSON 输出日志，额外字段 payload 原样输出
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage()
+        }
+        payload = getattr(record, 'payload', None)
+        if payload is not None:
+            entry['payload'] = payload
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, log_file=LOG_FILE):
+    """
+    配置日志：请求线程只把日志记录放入内存队列，由后台线程写入文件和控制台，日志 I/O 不阻塞请求
+    重复调用时不会重复添加处理器
+    :param level: 日志级别
+    :param log_format: 'text' 或 'json'
+    :param log_file: 日志文件
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.FileHandler(log_file, encoding='utf-8'), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    # 关联ID需要在请求线程中读取，过滤器挂在入队的处理器上
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [queue_handler]
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def log_payload(logger, message, payload, sample_rate=LOG_PAYLOAD_SAMPLE_RATE):
+    """
+    按采样率在 DEBUG 级别记录完整的数据内容（如接口响应），未开启 DEBUG 时不做任何序列化
+    :param logger: 日志记录器
+    :param message: 日志消息
+    :param payload: 数据内容
+    :param sample_rate: 采样率（0-1）
+    """
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < sample_rate:
+        logger.debug('%s: %s', message, payload, extra={'payload': payload})
+
+
+def init_request_logging(app):
+    """
+    为每个请求分配关联ID：优先使用请求头中的 ID，响应时原样返回，便于串联同一请求的日志
+    :param app: Flask 应用
+    """
+    from flask import request
+
+    @app.before_request
+    def _assign_request_id():
+        request_id_var.set((request.headers.get(REQUEST_ID_HEADER) or '')[:64] or uuid.uuid4().hex[:12])
+
+    @app.after_request
+    def _return_request_id(response):
+        response.headers[REQUEST_ID_HEADER] = request_id_var.get()
+        return response
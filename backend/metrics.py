@@ -0,0 +1,274 @@
+import bisect
+import contextvars
+import threading
+import time
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import get_cache_stats
+from config import METRICS_HTTP_BUCKETS, METRICS_DB_BUCKETS, METRICS_JOB_BUCKETS, METRICS_BATCH_BUCKETS
+
+# Prometheus 文本格式的响应类型
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """
+    只增不减的计数器，按标签值分别计数
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值元组 -> 计数
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for key, value in sorted(values):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    直方图：按标签值分别统计观测值落入各区间的次数、总和与总次数
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=METRICS_HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # 标签值元组 -> [各区间计数（非累计）, 总和, 总次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表：汇总计数器、直方图和按需采集的指标，输出 Prometheus 文本格式
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=METRICS_HTTP_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        注册采集函数，输出时调用，返回 Prometheus 文本行列表
+        用于已有统计数据（如缓存命中数）的指标，避免重复计数
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        :return: Prometheus 文本格式的全部指标
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+# 第三方接口请求
+upstream_latency = metrics_registry.histogram(
+    'fund_tracker_upstream_request_seconds', '第三方接口请求耗时（秒）',
+    ('method', 'host', 'status'), buckets=METRICS_HTTP_BUCKETS)
+fetch_retries = metrics_registry.counter(
+    'fund_tracker_fetch_retries_total', 'retry_on_failure 重试次数（retry：重试，exhausted：达到最大重试次数后放弃）',
+    ('method', 'outcome'))
+
+# 数据库
+db_flush_latency = metrics_registry.histogram(
+    'fund_tracker_db_flush_seconds', '数据库会话 flush 耗时（秒）', buckets=METRICS_DB_BUCKETS)
+db_commit_latency = metrics_registry.histogram(
+    'fund_tracker_db_commit_seconds', '数据库事务提交耗时（秒，包含提交前的 flush）', buckets=METRICS_DB_BUCKETS)
+db_retries = metrics_registry.counter(
+    'fund_tracker_db_retries_total', 'retry_db_operation 重试次数（retry：锁定或死锁后重试，failed：放弃）',
+    ('operation', 'outcome'))
+
+# 刷新写入队列
+refresh_batch_size = metrics_registry.histogram(
+    'fund_tracker_refresh_batch_rows', '刷新队列每批写入的记录数', buckets=METRICS_BATCH_BUCKETS)
+refresh_write_latency = metrics_registry.histogram(
+    'fund_tracker_refresh_write_seconds', '刷新队列每批写入耗时（秒），outcome 为 success 或 error',
+    ('outcome',), buckets=METRICS_DB_BUCKETS)
+
+# 定时任务
+job_duration = metrics_registry.histogram(
+    'fund_tracker_job_duration_seconds', '定时任务执行耗时（秒），outcome 为 success 或 error',
+    ('job', 'outcome'), buckets=METRICS_JOB_BUCKETS)
+
+
+@event.listens_for(Session, 'before_flush')
+def _start_flush_timer(session, flush_context, instances):
+    session.info['metrics_flush_start'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _observe_flush(session, flush_context):
+    start = session.info.pop('metrics_flush_start', None)
+    if start is not None:
+        db_flush_latency.observe(time.perf_counter() - start)
+
+
+@event.listens_for(Session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['metrics_commit_start'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _observe_commit(session):
+    start = session.info.pop('metrics_commit_start', None)
+    if start is not None:
+        db_commit_latency.observe(time.perf_counter() - start)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_commit_timer(session):
+    session.info.pop('metrics_commit_start', None)
+
+
+# 当前定时任务的执行结果，任务内部捕获异常后通过 job_failed() 标记
+_job_outcome = contextvars.ContextVar('job_outcome', default=None)
+
+
+def track_job(func):
+    """
+    定时任务装饰器：记录每次执行的耗时和结果
+    任务抛出异常或调用了 job_failed() 时结果为 error
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _job_outcome.set('success')
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            _job_outcome.set('error')
+            raise
+        finally:
+            job_duration.observe(time.perf_counter() - start, job=func.__name__, outcome=_job_outcome.get())
+            _job_outcome.reset(token)
+    return wrapper
+
+
+def job_failed():
+    """
+    标记当前定时任务执行失败（用于任务内部已捕获并记录的异常）
+    """
+    if _job_outcome.get() is not None:
+        _job_outcome.set('error')
+
+
+def _collect_cache_metrics():
+    """
+    缓存命中、未命中、淘汰、过期次数和当前条目数（来自各缓存自身的统计）
+    """
+    stats = get_cache_stats()
+    lines = []
+    for field, kind, documentation in (
+            ('hits', 'counter', '缓存命中次数'),
+            ('misses', 'counter', '缓存未命中次数'),
+            ('evictions', 'counter', '超出容量淘汰的条目数'),
+            ('expirations', 'counter', '过期的条目数'),
+            ('size', 'gauge', '当前缓存条目数')):
+        name = f'fund_tracker_cache_{field}' + ('_total' if kind == 'counter' else '')
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for cache_name, cache_stats in sorted(stats.items()):
+            lines.append(f'{name}{{cache="{_escape(cache_name)}"}} {_format_value(cache_stats[field])}')
+    return lines
+
+
+def _collect_refresh_metrics():
+    """
+    刷新写入队列的当前长度、未写入完成的记录数和丢弃的记录数
+    """
+    # 刷新队列模块依赖数据获取模块（其中使用本模块的指标），在采集时再导入
+    from refresh_pipeline import refresh_writer
+
+    stats = refresh_writer.stats()
+    lines = []
+    for name, kind, documentation, value in (
+            ('fund_tracker_refresh_queue_depth', 'gauge', '刷新队列中等待写入的记录数', stats['queue_depth']),
+            ('fund_tracker_refresh_queue_maxsize', 'gauge', '刷新队列最大长度', stats['queue_maxsize']),
+            ('fund_tracker_refresh_pending', 'gauge', '已提交但还未写入完成的记录数', stats['pending']),
+            ('fund_tracker_refresh_dropped_total', 'counter', '队列已满时丢弃的记录数', stats['dropped'])):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {_format_value(value)}')
+    return lines
+
+
+metrics_registry.add_collector(_collect_cache_metrics)
+metrics_registry.add_collector(_collect_refresh_metrics)
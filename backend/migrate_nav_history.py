@@ -0,0 +1,31 @@
+import json
+
+from models import engine, SessionLocal, FundNavHistory, FundRealtimeData
+from nav_history import save_nav_history
+
+# 将 fund_realtime_data.net_values 中的 JSON 历史净值迁移到 fund_nav_history 表
+FundNavHistory.__table__.create(bind=engine, checkfirst=True)
+
+db = SessionLocal()
+try:
+    records = db.query(FundRealtimeData).filter(FundRealtimeData.net_values.isnot(None)).all()
+    print('待迁移基金数量:', len(records))
+
+    total = 0
+    for record in records:
+        try:
+            net_values = json.loads(record.net_values or '[]')
+        except ValueError:
+            print(f'基金ID {record.fund_id} 的历史净值格式错误，跳过')
+            continue
+        if not net_values:
+            continue
+
+        count = save_nav_history(db, record.fund_id, net_values)
+        db.commit()
+        total += count
+        print(f'基金ID {record.fund_id}: 已迁移 {count} 条历史净值')
+
+    print('迁移完成，共写入历史净值:', total)
+finally:
+    db.close()
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -8,6 +10,13 @@ from sqlalchemy.orm import sessionmaker
 
 Base = declarative_base()
 
+
+def db_now():
+    """
+    当前时间（UTC，不带时区），与数据库中 updated_at 的存储方式一致（会话时区为 UTC，由 func.now() 写入）
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # 尝试创建数据库连接
 try:
     engine = create_engine(DATABASE_URL, echo=False, connect_args=CONNECT_ARGS)
@@ -90,7 +99,7 @@ class FundRealtimeData(Base):
     daily_change_rate = Column(Float, default=0)  # 日涨跌幅
     fsrq = Column(String(20))  # 净值日期
 
-    # 历史净值数据（JSON格式存储）
+    # 历史净值数据（JSON格式存储，已由 fund_nav_history 表取代，仅用于迁移旧数据）
     net_values = Column(Text)  # 历史净值数据，JSON格式
 
     # 更新时间
@@ -99,6 +108,16 @@ class FundRealtimeData(Base):
     # 关系
     fund = relationship("Fund", back_populates="realtime_data")
 
+class FundNavHistory(Base):
+    """基金历史净值表（按基金和日期存储，主键同时作为范围查询的索引）"""
+    __tablename__ = 'fund_nav_history'
+
+    fund_id = Column(Integer, ForeignKey('fund.id'), primary_key=True)
+    date = Column(String(10), primary_key=True)  # 净值日期，格式YYYY-MM-DD
+    unit_nav = Column(Float)  # 单位净值
+    cumulative_nav = Column(Float)  # 累计净值
+    change_rate = Column(Float)  # 日增长率
+
 class FundHolding(Base):
     """基金持仓表"""
     __tablename__ = 'fund_holding'
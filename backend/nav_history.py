@@ -0,0 +1,145 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from config import NAV_HISTORY_DEFAULT_LIMIT
+from db_writer import bulk_upsert_nav_history
+from models import FundNavHistory
+
+
+def _to_float(value):
+    """
+    将接口返回的净值字符串转换为浮点数，空值或无效值返回 None
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def to_nav_rows(fund_id, net_values):
+    """
+    将接口格式的历史净值列表转换为 fund_nav_history 表记录
+    :param fund_id: 基金ID
+    :param net_values: [{'date', 'unit_net_value', 'cumulative_net_value', 'change_rate'}]
+    :return: 表记录列表
+    """
+    rows = []
+    for item in net_values or []:
+        date = item.get('date')
+        unit_nav = _to_float(item.get('unit_net_value'))
+        if not date or unit_nav is None:
+            continue
+        rows.append({
+            'fund_id': fund_id,
+            'date': date,
+            'unit_nav': unit_nav,
+            'cumulative_nav': _to_float(item.get('cumulative_net_value')),
+            'change_rate': _to_float(item.get('change_rate'))
+        })
+    return rows
+
+
+def _to_str(value, digits):
+    """
+    将表中的数值转换为接口格式的字符串（与第三方接口一致，净值保留4位、涨跌幅保留2位小数），空值返回 None
+    """
+    if value is None:
+        return None
+    text = f'{value:.{digits}f}'
+    # 超出默认位数的精度（如货币基金净值）不截断
+    return text if float(text) == value else repr(value)
+
+
+def to_net_value(record):
+    """
+    将表记录转换为接口格式的净值数据（数值为字符串，与第三方接口返回的格式相同）
+    """
+    return {
+        'date': record.date,
+        'unit_net_value': _to_str(record.unit_nav, 4),
+        'cumulative_net_value': _to_str(record.cumulative_nav, 4),
+        'change_rate': _to_str(record.change_rate, 2)
+    }
+
+
+def to_columnar(net_values, delta_dates=False):
+    """
+    将历史净值列表转换为按列存储的紧凑格式，净值为数值类型，保持原有顺序
+    :param net_values: 接口格式的历史净值列表
+    :param delta_dates: 是否对日期做差分编码（start_date + 与上一条相差的天数）
+    :return: {'date' 或 'start_date'/'date_delta', 'unit_net_value', 'cumulative_net_value', 'change_rate'}
+    """
+    dates = [item.get('date') for item in net_values]
+    columns = {
+        'unit_net_value': [_to_float(item.get('unit_net_value')) for item in net_values],
+        'cumulative_net_value': [_to_float(item.get('cumulative_net_value')) for item in net_values],
+        'change_rate': [_to_float(item.get('change_rate')) for item in net_values]
+    }
+    if not delta_dates or not dates:
+        return dict(columns, date=dates)
+
+    days = [datetime.strptime(date, '%Y-%m-%d').toordinal() for date in dates]
+    deltas = [0] + [days[i] - days[i - 1] for i in range(1, len(days))]
+    return dict(columns, start_date=dates[0], date_delta=deltas)
+
+
+def save_nav_history(db, fund_id, net_values):
+    """
+    合并写入基金历史净值（已存在的日期会被更新），不提交事务
+    :param db: 数据库会话
+    :param fund_id: 基金ID
+    :param net_values: 接口格式的历史净值列表
+    :return: 写入条数
+    """
+    return bulk_upsert_nav_history(db, to_nav_rows(fund_id, net_values))
+
+
+def load_nav_history(db, fund_id, start_date=None, end_date=None, limit=None):
+    """
+    按日期范围读取基金历史净值，按日期倒序返回
+    :param db: 数据库会话
+    :param fund_id: 基金ID
+    :param start_date: 开始日期（包含），格式YYYY-MM-DD
+    :param end_date: 结束日期（包含），格式YYYY-MM-DD
+    :param limit: 最大条数，未指定日期范围时默认 NAV_HISTORY_DEFAULT_LIMIT
+    :return: 接口格式的历史净值列表
+    """
+    query = db.query(FundNavHistory).filter(FundNavHistory.fund_id == fund_id)
+    if start_date:
+        query = query.filter(FundNavHistory.date >= start_date)
+    if end_date:
+        query = query.filter(FundNavHistory.date <= end_date)
+    if limit is None and not start_date and not end_date:
+        limit = NAV_HISTORY_DEFAULT_LIMIT
+    query = query.order_by(FundNavHistory.date.desc())
+    if limit:
+        query = query.limit(limit)
+    return [to_net_value(record) for record in query.all()]
+
+
+def get_nav_by_date(db, fund_id, date):
+    """
+    获取基金指定日期的净值
+    :param db: 数据库会话
+    :param fund_id: 基金ID
+    :param date: 日期，格式YYYY-MM-DD
+    :return: 接口格式的净值数据，或 None
+    """
+    record = db.query(FundNavHistory).filter(
+        FundNavHistory.fund_id == fund_id,
+        FundNavHistory.date == date
+    ).first()
+    return to_net_value(record) if record else None
+
+
+def latest_nav_date(db, fund_id):
+    """
+    获取已存储的最新净值日期
+    :param db: 数据库会话
+    :param fund_id: 基金ID
+    :return: 日期字符串，没有数据时返回 None
+    """
+    return db.query(func.max(FundNavHistory.date)).filter(FundNavHistory.fund_id == fund_id).scalar()
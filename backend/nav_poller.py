@@ -0,0 +1,129 @@
+import threading
+from datetime import datetime, timedelta
+
+from config import NAV_POLL_INTERVAL, NAV_POLL_LATE_INTERVAL, NAV_POLL_MAX_INTERVAL, NAV_LATE_FUND_KEYWORDS
+from trading_calendar import latest_trading_day, previous_trading_day
+
+
+def is_late_publisher(fund_name, fund_type=None):
+    """
+    判断基金是否通常延迟公布净值（QDII、FOF 一般在 T+1 或更晚公布）
+    :param fund_name: 基金名称
+    :param fund_type: 基金类型
+    :return: 是否延迟公布
+    """
+    text = f"{fund_name or ''} {fund_type or ''}".upper()
+    return any(keyword in text for keyword in NAV_LATE_FUND_KEYWORDS)
+
+
+def expected_nav_date(late, today=None):
+    """
+    当晚应该公布的净值日期：普通基金为当日，延迟公布的基金为上一个交易日
+    :param late: 是否延迟公布
+    :param today: 日期，默认今天
+    :return: 日期字符串 YYYY-MM-DD
+    """
+    day = latest_trading_day(today)
+    if late:
+        day = previous_trading_day(day)
+    return day.strftime('%Y-%m-%d')
+
+
+class NavPublicationPoller:
+    """
+    净值公布轮询状态
+    记录当天每个基金是否已公布净值，已公布的基金不再请求；
+    未公布的基金按退避间隔轮询，延迟公布的基金（QDII、FOF）使用更长的初始间隔。
+    状态按日期保存，进入新的一天自动清空。
+    """
+
+    def __init__(self, interval=NAV_POLL_INTERVAL, late_interval=NAV_POLL_LATE_INTERVAL, max_interval=NAV_POLL_MAX_INTERVAL):
+        """
+        :param interval: 普通基金的轮询间隔（秒）
+        :param late_interval: 延迟公布基金的初始轮询间隔（秒）
+        :param max_interval: 退避后的最大轮询间隔（秒）
+        """
+        self.interval = interval
+        self.late_interval = late_interval
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self._day = None
+        self._settled = {}  # fund_code -> 净值日期
+        self._next_poll = {}  # fund_code -> 下次轮询时间
+        self._attempts = {}  # fund_code -> 未公布的次数
+
+    def _reset_if_new_day(self, now):
+        day = now.date()
+        if self._day != day:
+            self._day = day
+            self._settled.clear()
+            self._next_poll.clear()
+            self._attempts.clear()
+
+    def due(self, fund_codes, now=None):
+        """
+        筛选本次需要请求的基金（未公布且已到轮询时间）
+        :param fund_codes: 基金代码列表
+        :param now: 当前时间
+        :return: 基金代码列表
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._reset_if_new_day(now)
+            return [
+                code for code in fund_codes
+                if code not in self._settled and self._next_poll.get(code, now) <= now
+            ]
+
+    def mark_settled(self, fund_code, fsrq, now=None):
+        """
+        记录基金已公布净值，当天不再轮询
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._reset_if_new_day(now)
+            self._settled[fund_code] = fsrq
+            self._next_poll.pop(fund_code, None)
+
+    def mark_pending(self, fund_code, late=False, now=None):
+        """
+        记录基金净值尚未公布，计算下次轮询时间
+        普通基金按固定间隔轮询；延迟公布的基金从 late_interval 开始指数退避
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._reset_if_new_day(now)
+            attempts = self._attempts.get(fund_code, 0) + 1
+            self._attempts[fund_code] = attempts
+            if late:
+                delay = min(self.late_interval * (2 ** (attempts - 1)), self.max_interval)
+            else:
+                delay = self.interval
+            self._next_poll[fund_code] = now + timedelta(seconds=delay)
+
+    def all_settled(self, fund_codes, now=None):
+        """
+        判断所有基金是否都已公布净值
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._reset_if_new_day(now)
+            return all(code in self._settled for code in fund_codes)
+
+    def stats(self):
+        """
+        获取当天的轮询状态
+        :return: 统计字典
+        """
+        with self._lock:
+            return {
+                'day': self._day.strftime('%Y-%m-%d') if self._day else None,
+                'settled': len(self._settled),
+                'pending': len(self._next_poll),
+                'attempts': sum(self._attempts.values()),
+                'next_poll': {code: t.strftime('%H:%M:%S') for code, t in self._next_poll.items()}
+            }
+
+
+# 全局净值公布轮询状态
+nav_poller = NavPublicationPoller()
@@ -0,0 +1,123 @@
+import json
+import re
+from datetime import datetime, timedelta, timezone
+
+# pingzhongdata/<code>.js 由一连串 "var 名称 = 值;" 语句组成，语句之间可能夹有 /*注释*/
+_VAR_PATTERN = re.compile(r'var\s+(\w+)\s*=\s*')
+
+# 涨跌幅变量名（新旧两种命名，按优先级排列）
+RATE_VARIABLES = {
+    'one_month_rate': ('syl_1y', 'syly'),
+    'three_month_rate': ('syl_3y', 'syl3y'),
+    'one_year_rate': ('syl_1n', 'syl1n'),
+    'daily_change_rate': ('rzdf',),
+}
+_SCALAR_VARIABLES = {name for names in RATE_VARIABLES.values() for name in names} | {'fS_name', 'fS_code', 'fsrq'}
+_SERIES_VARIABLES = {'Data_netWorthTrend', 'Data_ACWorthTrend'}
+
+# 净值序列中的时间戳为北京时间零点
+_CHINA_TZ = timezone(timedelta(hours=8))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_date(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=_CHINA_TZ).strftime('%Y-%m-%d')
+
+
+def scan_variables(content, names):
+    """
+    单次扫描 pingzhongdata 内容，取出指定变量的原始值文本
+    :param content: 响应文本
+    :param names: 需要的变量名集合
+    :return: {变量名: 原始值文本}
+    """
+    matches = list(_VAR_PATTERN.finditer(content))
+    values = {}
+    for i, match in enumerate(matches):
+        name = match.group(1)
+        if name not in names:
+            continue
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        segment = content[match.end():end]
+        # 值以最后一个分号结束，分号之后是注释
+        semicolon = segment.rfind(';')
+        values[name] = (segment[:semicolon] if semicolon != -1 else segment).strip()
+    return values
+
+
+def _scalar(raw):
+    """
+    解析字符串或数值变量，空字符串返回 None
+    """
+    if raw is None:
+        return None
+    raw = raw.strip()
+    if raw.startswith('"') and raw.endswith('"'):
+        raw = raw[1:-1]
+    return raw or None
+
+
+def _build_net_values(net_worth_raw, ac_worth_raw):
+    """
+    将单位净值走势和累计净值走势合并为与历史净值接口相同格式的列表（按日期倒序）
+    """
+    net_worth = json.loads(net_worth_raw) if net_worth_raw else []
+    ac_worth = json.loads(ac_worth_raw) if ac_worth_raw else []
+    cumulative = {point[0]: point[1] for point in ac_worth if len(point) >= 2}
+
+    net_values = []
+    for point in reversed(net_worth):
+        timestamp = point.get('x')
+        unit_nav = point.get('y')
+        if timestamp is None or unit_nav is None:
+            continue
+        change_rate = point.get('equityReturn')
+        cumulative_nav = cumulative.get(timestamp)
+        net_values.append({
+            'date': _to_date(timestamp),
+            'unit_net_value': str(unit_nav),
+            'cumulative_net_value': str(cumulative_nav) if cumulative_nav is not None else None,
+            'change_rate': str(change_rate) if change_rate not in (None, '') else None
+        })
+    return net_values
+
+
+def parse_pingzhongdata(content):
+    """
+    解析 pingzhongdata/<code>.js：一次扫描得到涨跌幅和完整的净值序列
+    接口没有净值日期、日涨跌幅变量时，从净值序列的最新一条推算
+    :param content: 响应文本
+    :return: {'fund_code', 'fund_name', 'one_month_rate', 'three_month_rate', 'one_year_rate',
+              'daily_change_rate', 'fsrq', 'unit_net_value', 'net_values'}
+    """
+    values = scan_variables(content, _SCALAR_VARIABLES | _SERIES_VARIABLES)
+
+    result = {
+        'fund_code': _scalar(values.get('fS_code')),
+        'fund_name': _scalar(values.get('fS_name')),
+        'fsrq': _scalar(values.get('fsrq')) or '',
+        'unit_net_value': 0
+    }
+    for field, variables in RATE_VARIABLES.items():
+        result[field] = 0
+        for variable in variables:
+            rate = _to_float(_scalar(values.get(variable)))
+            if rate is not None:
+                result[field] = rate
+                break
+
+    net_values = _build_net_values(values.get('Data_netWorthTrend'), values.get('Data_ACWorthTrend'))
+    if net_values:
+        latest = net_values[0]
+        result['fsrq'] = result['fsrq'] or latest['date']
+        result['unit_net_value'] = _to_float(latest['unit_net_value']) or 0
+        if not result['daily_change_rate']:
+            result['daily_change_rate'] = _to_float(latest['change_rate']) or 0
+    result['net_values'] = net_values
+    return result
@@ -0,0 +1,175 @@
+from datetime import datetime
+
+import numpy as np
+
+# 没有标签的持仓归入该分组
+UNTAGGED = '未分类'
+
+
+def _to_float(value):
+    """
+    将接口返回的数值（可能是字符串、'-' 或 None）转换为浮点数，无效值返回 NaN
+    """
+    if value is None or value == '-' or value == '':
+        return np.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def _none_if_nan(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _group_totals(keys, columns):
+    """
+    按分组键汇总各列
+    :param keys: 每个持仓的分组键
+    :param columns: {列名: 数组}
+    :return: {分组键: {列名: 合计}}
+    """
+    if not keys:
+        return {}
+    groups, inverse = np.unique(np.asarray(keys, dtype=object), return_inverse=True)
+    sums = {name: np.bincount(inverse, weights=values, minlength=len(groups)) for name, values in columns.items()}
+    counts = np.bincount(inverse, minlength=len(groups))
+    return {
+        group: dict({name: float(sums[name][i]) for name in columns}, count=int(counts[i]))
+        for i, group in enumerate(groups)
+    }
+
+
+def _with_rate(totals):
+    """
+    根据合计的成本和盈亏计算收益率
+    """
+    cost = totals['cost']
+    totals['profit_loss_rate'] = (totals['profit_loss'] / cost * 100) if cost > 0 else 0
+    return totals
+
+
+class PortfolioValuation:
+    """
+    持仓估值结果：逐条持仓的计算结果和按平台、标签汇总的数据
+    """
+
+    def __init__(self, holdings, summary):
+        self.holdings = holdings
+        self.summary = summary
+
+
+def value_portfolio(holdings, fund_data_dict, tags_dict, today=None):
+    """
+    一次性计算所有持仓的持仓金额、今日估算收益和持有收益
+    计算规则：
+    1. 当日净值已公布（净值日期为今天且日涨跌幅不为0），按日涨跌幅计算今日收益和持仓金额
+    2. 否则有估算涨幅时按估算涨幅计算今日收益
+    3. 都没有时今日收益为空（不显示）
+    4. 没有单位净值时持仓金额取成本；没有实时数据时使用数据库中保存的收益
+    :param holdings: FundHolding 列表
+    :param fund_data_dict: {fund_code: 实时涨跌幅数据}
+    :param tags_dict: {fund_id: 标签}
+    :param today: 今天的日期字符串 YYYY-MM-DD
+    :return: PortfolioValuation
+    """
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    n = len(holdings)
+
+    fund_data_list = [fund_data_dict.get(holding.fund.fund_code) for holding in holdings]
+    has_data = np.array([fund_data is not None for fund_data in fund_data_list], dtype=bool)
+
+    shares = np.array([holding.shares or 0 for holding in holdings], dtype=float)
+    cost = np.array([holding.cost or 0 for holding in holdings], dtype=float)
+    unit_net_value = np.array([_to_float(d.get('unit_net_value')) if d else np.nan for d in fund_data_list], dtype=float)
+    daily_rate = np.array([_to_float(d.get('daily_change_rate', '-')) if d else np.nan for d in fund_data_list], dtype=float)
+    estimate_rate = np.array([_to_float(d.get('estimate_change_rate', '-')) if d else np.nan for d in fund_data_list], dtype=float)
+    is_today = np.array([bool(d) and d.get('fsrq', '') == today for d in fund_data_list], dtype=bool)
+
+    # 数据库中保存的收益（没有实时数据时使用）
+    stored_value = np.array([holding.current_value or holding.cost for holding in holdings], dtype=float)
+    stored_profit = np.array([holding.profit_loss or 0 for holding in holdings], dtype=float)
+    stored_rate = np.array([holding.profit_loss_rate or 0 for holding in holdings], dtype=float)
+
+    # 单位净值为0视为没有净值
+    has_nav = has_data & ~np.isnan(unit_net_value) & (np.nan_to_num(unit_net_value) != 0)
+    use_daily = has_nav & is_today & ~np.isnan(daily_rate) & (np.nan_to_num(daily_rate) != 0)
+    use_estimate = has_nav & ~use_daily & ~np.isnan(estimate_rate)
+    no_estimate = has_nav & ~use_daily & ~use_estimate
+
+    with np.errstate(invalid='ignore'):
+        base_value = shares * unit_net_value
+        daily_value = base_value * (1 + np.nan_to_num(daily_rate) / 100)
+
+        current_value = np.where(use_daily, daily_value, np.where(has_nav, base_value, cost))
+        estimate_profit = np.where(
+            use_daily, daily_value - base_value,
+            np.where(use_estimate, base_value * np.nan_to_num(estimate_rate) / 100, np.where(has_nav, np.nan, 0.0))
+        )
+        profit_loss = current_value - cost
+        profit_loss_rate = np.where(cost > 0, profit_loss / np.where(cost > 0, cost, 1) * 100, 0.0)
+
+    # 没有实时数据的持仓使用数据库中保存的收益
+    current_value = np.where(has_data, current_value, stored_value)
+    profit_loss = np.where(has_data, profit_loss, stored_profit)
+    profit_loss_rate = np.where(has_data, profit_loss_rate, stored_rate)
+    estimate_profit = np.where(has_data, estimate_profit, 0.0)
+
+    records = []
+    platforms = []
+    tags_list = []
+    for i, holding in enumerate(holdings):
+        fund_data = fund_data_list[i]
+        tags = tags_dict.get(holding.fund.id, '')
+        platform = holding.platform or '其他'
+        platforms.append(platform)
+        tags_list.append(tags or UNTAGGED)
+
+        if fund_data:
+            estimate_change_rate = None if no_estimate[i] else fund_data.get('estimate_change_rate', '-')
+            daily_change_rate = fund_data.get('daily_change_rate', '-')
+            fsrq = fund_data.get('fsrq', '')
+            one_month_rate = fund_data.get('one_month_rate', 0)
+        else:
+            estimate_change_rate = '0.00'
+            daily_change_rate = '-'
+            fsrq = ''
+            one_month_rate = 0
+
+        records.append({
+            'fund_code': holding.fund.fund_code,
+            'fund_name': holding.fund.fund_name,
+            'cost': holding.cost,
+            'shares': holding.shares,
+            'avg_cost': holding.avg_cost,
+            'current_value': float(current_value[i]),
+            'profit_loss': float(profit_loss[i]),
+            'profit_loss_rate': float(profit_loss_rate[i]),
+            'estimate_change_rate': estimate_change_rate,
+            'estimate_profit': _none_if_nan(estimate_profit[i]),
+            'daily_change_rate': daily_change_rate,
+            'fsrq': fsrq,
+            'one_month_rate': one_month_rate,
+            'tags': tags,
+            'platform': platform
+        })
+
+    # 汇总：今日估算收益只统计有估算数据的持仓
+    has_estimate = ~np.isnan(estimate_profit)
+    columns = {
+        'cost': cost,
+        'current_value': current_value,
+        'profit_loss': profit_loss,
+        'estimate_profit': np.nan_to_num(estimate_profit)
+    }
+    total = _with_rate({name: float(values.sum()) for name, values in columns.items()})
+    total['count'] = n
+    total['has_estimate'] = bool(has_estimate.any())
+
+    summary = {
+        'total': total,
+        'by_platform': {key: _with_rate(value) for key, value in _group_totals(platforms, columns).items()},
+        'by_tag': {key: _with_rate(value) for key, value in _group_totals(tags_list, columns).items()}
+    }
+    return PortfolioValuation(records, summary)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import FundHolding, FundRealtimeData, Watchlist
+from portfolio import value_portfolio
+from refresh_pipeline import refresh_writer
+
+
+def _realtime_to_fund_data(realtime_data):
+    """
+    将数据库中的实时数据转换为 value_portfolio 需要的格式
+    """
+    return {
+        'unit_net_value': realtime_data.unit_net_value,
+        'estimate_change_rate': realtime_data.estimate_change_rate,
+        'daily_change_rate': realtime_data.daily_change_rate,
+        'fsrq': realtime_data.fsrq or '',
+        'one_month_rate': realtime_data.one_month_rate or 0
+    }
+
+
+class PortfolioSnapshot:
+    """
+    持仓汇总快照
+    只使用数据库中的持仓和实时数据计算，不请求第三方接口；
+    估值写入或持仓、标签变更后标记为过期，下次读取时重新计算，未变化时直接返回缓存结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._etag = None
+        self._day = None
+        self._dirty = True
+        self.version = 0
+        self.recomputes = 0
+
+    def invalidate(self):
+        """
+        标记快照已过期
+        """
+        self._dirty = True
+
+    def get(self, db):
+        """
+        获取当前快照，过期或跨天时重新计算
+        :param db: 数据库会话
+        :return: (快照字典, ETag)
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            if self._dirty or self._snapshot is None or self._day != today:
+                # 先清除标记，计算期间发生的变更会再次标记为过期；计算失败时恢复标记，不把旧快照当作最新
+                self._dirty = False
+                try:
+                    self._compute(db, today)
+                except Exception:
+                    self._dirty = True
+                    raise
+            return self._snapshot, self._etag
+
+    def _compute(self, db, today):
+        holdings = db.query(FundHolding).all()
+        fund_ids = list({holding.fund_id for holding in holdings})
+
+        realtime_rows = db.query(FundRealtimeData).filter(FundRealtimeData.fund_id.in_(fund_ids)).all() if fund_ids else []
+        realtime_by_id = {row.fund_id: row for row in realtime_rows}
+        fund_data_dict = {
+            holding.fund.fund_code: _realtime_to_fund_data(realtime_by_id[holding.fund_id])
+            for holding in holdings if holding.fund_id in realtime_by_id
+        }
+
+        watchlist_items = db.query(Watchlist).filter(Watchlist.fund_id.in_(fund_ids)).all() if fund_ids else []
+        tags_dict = {item.fund_id: item.tags for item in watchlist_items}
+
+        summary = value_portfolio(holdings, fund_data_dict, tags_dict, today=today).summary
+        body = json.dumps(summary, sort_keys=True, ensure_ascii=False)
+        etag = hashlib.md5(body.encode('utf-8')).hexdigest()
+
+        # 内容没有变化时保留原版本号和更新时间
+        if etag != self._etag:
+            self.version += 1
+            self._etag = etag
+            self._snapshot = dict(summary, version=self.version, updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._day = today
+        self.recomputes += 1
+
+
+# 全局持仓汇总快照，刷新队列写入估值后标记过期
+portfolio_snapshot = PortfolioSnapshot()
+refresh_writer.add_listener(lambda rows: portfolio_snapshot.invalidate())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_on_flush(session, flush_context):
+    """
+    记录会话中持仓、标签或实时数据是否通过ORM变更，事务提交后才标记快照过期
+    """
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (FundHolding, Watchlist, FundRealtimeData)):
+            session.info['portfolio_snapshot_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('portfolio_snapshot_dirty', False):
+        portfolio_snapshot.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('portfolio_snapshot_dirty', None)
@@ -0,0 +1,286 @@
+import logging
+import queue
+import threading
+import time
+
+from config import REFRESH_WRITE_BATCH_SIZE, REFRESH_QUEUE_MAXSIZE, REFRESH_FLUSH_INTERVAL, REFRESH_SUBMIT_TIMEOUT
+from data_fetcher import DataFetcher
+from db_writer import bulk_upsert_realtime_data, retry_db_operation
+from fetch_engine import fetch_engine
+from metrics import refresh_batch_size, refresh_write_latency
+from models import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def build_realtime_row(fund_code, fund_data, history_data):
+    """
+    将估值数据和涨跌幅数据合并为 FundRealtimeData 的字段
+    :param fund_code: 基金代码
+    :param fund_data: DataFetcher.get_fund_valuation 返回的数据，可以为 None
+    :param history_data: DataFetcher.get_fund_history / get_fund_history_simple 返回的数据
+    :return: 字段字典（包含 fund_code）
+    """
+    return {
+        'fund_code': fund_code,
+        'net_value_date': fund_data.get('net_value') if fund_data else history_data.get('fsrq', ''),
+        'unit_net_value': float(fund_data.get('unit_net_value', 0)) if fund_data and fund_data.get('unit_net_value') else (float(history_data.get('unit_net_value', 0)) if history_data and history_data.get('unit_net_value') else None),
+        'estimate_net_value': float(fund_data.get('estimate_net_value', 0)) if fund_data and fund_data.get('estimate_net_value') else None,
+        'estimate_change_rate': float(fund_data.get('estimate_change_rate', 0)) if fund_data and fund_data.get('estimate_change_rate') else None,
+        'estimate_time': fund_data.get('estimate_time', '') if fund_data else '',
+        'one_month_rate': history_data.get('one_month_rate', 0),
+        'three_month_rate': history_data.get('three_month_rate', 0),
+        'one_year_rate': history_data.get('one_year_rate', 0),
+        'daily_change_rate': history_data.get('daily_change_rate', 0),
+        'fsrq': history_data.get('fsrq', '')
+    }
+
+
+def fetch_fund_snapshot(fund_code, valuations=None):
+    """
+    从第三方接口获取一个基金的估值和涨跌幅数据，不访问数据库，可在任意线程中调用
+    :param fund_code: 基金代码
+    :param valuations: DataFetcher.get_fund_valuation_batch 的结果，其中已有的基金（包括获取失败的）不再单独请求估值
+    :return: 字段字典，获取失败时返回 None
+    """
+    if valuations is not None and fund_code in valuations:
+        fund_data = valuations[fund_code]
+    else:
+        fund_data = DataFetcher.get_fund_valuation(fund_code)
+    history_data = DataFetcher.get_fund_history_simple(fund_code)
+    if not history_data:
+        return None
+    return build_realtime_row(fund_code, fund_data, history_data)
+
+
+@retry_db_operation(max_retries=3, base_delay=0.1)
+def _write_batch(rows):
+    """
+    使用独立的会话写入一批记录并提交
+    """
+    db = SessionLocal()
+    try:
+        bulk_upsert_realtime_data(db, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class RefreshWriter:
+    """
+    单写入线程的刷新队列
+    抓取线程把解析好的记录放入有界队列，写入线程按数量或时间凑批后写入数据库，
+    网络请求期间不持有数据库事务，所有实时数据写入都经过同一个线程。
+    """
+
+    def __init__(self, maxsize=REFRESH_QUEUE_MAXSIZE, batch_size=REFRESH_WRITE_BATCH_SIZE, flush_interval=REFRESH_FLUSH_INTERVAL):
+        """
+        :param maxsize: 队列最大长度，队列满时提交方等待
+        :param batch_size: 每批最多写入的记录数
+        :param flush_interval: 凑批的最长等待时间（秒）
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0  # 已提交但还未写入完成的记录数
+        self._listeners = []
+        self._stats = {
+            'batches': 0,
+            'rows': 0,
+            'errors': 0,
+            'dropped': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_write_ms': 0.0,
+            'max_write_ms': 0.0,
+            'total_write_ms': 0.0
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='refresh-writer', daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def add_listener(self, callback):
+        """
+        注册写入完成回调，每批写入成功后以该批记录调用 callback(rows)
+        :param callback: 回调函数
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, rows):
+        for callback in self._listeners:
+            try:
+                callback(rows)
+            except Exception as e:
+                logger.error("刷新队列写入回调执行失败: %s", e)
+
+    def submit(self, row, timeout=REFRESH_SUBMIT_TIMEOUT):
+        """
+        提交一条待写入的记录，队列满时最多等待 timeout 秒
+        :param row: FundRealtimeData 字段字典，必须包含 fund_id
+        :param timeout: 等待时间（秒）
+        :return: 是否已加入队列
+        """
+        self._ensure_started()
+        with self._lock:
+            self._pending += 1
+        try:
+            self._queue.put(row, timeout=timeout)
+            return True
+        except queue.Full:
+            logger.warning("刷新队列已满，丢弃基金 %s 的数据", row.get('fund_id'))
+            with self._lock:
+                self._stats['dropped'] += 1
+            self._done(1)
+            return False
+
+    def submit_many(self, rows, timeout=REFRESH_SUBMIT_TIMEOUT):
+        """
+        提交多条待写入的记录
+        :return: 成功加入队列的条数
+        """
+        return sum(1 for row in rows if self.submit(row, timeout=timeout))
+
+    def flush(self, timeout=None):
+        """
+        等待已提交的记录全部写入
+        :param timeout: 最长等待时间（秒），为空时一直等待
+        :return: 是否已全部写入
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def _done(self, count):
+        with self._idle:
+            self._pending -= count
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _next_batch(self):
+        """
+        阻塞等待第一条记录，然后在 flush_interval 内继续凑批，直到达到 batch_size
+        """
+        batch = [self._queue.get()]
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                _write_batch(batch)
+                failed = False
+            except Exception as e:
+                logger.error("刷新队列写入 %s 条基金数据失败: %s", len(batch), e)
+                failed = True
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            refresh_batch_size.observe(len(batch))
+            refresh_write_latency.observe(elapsed_ms / 1000, outcome='error' if failed else 'success')
+
+            with self._lock:
+                stats = self._stats
+                stats['batches'] += 1
+                if failed:
+                    stats['errors'] += 1
+                else:
+                    stats['rows'] += len(batch)
+                stats['last_batch_size'] = len(batch)
+                stats['max_batch_size'] = max(stats['max_batch_size'], len(batch))
+                stats['last_write_ms'] = elapsed_ms
+                stats['max_write_ms'] = max(stats['max_write_ms'], elapsed_ms)
+                stats['total_write_ms'] += elapsed_ms
+            if not failed:
+                self._notify(batch)
+            self._done(len(batch))
+
+    def stats(self):
+        """
+        获取队列和写入统计
+        :return: 统计字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+        batches = stats['batches']
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_maxsize': self._queue.maxsize,
+            'pending': pending,
+            'batches': batches,
+            'rows': stats['rows'],
+            'errors': stats['errors'],
+            'dropped': stats['dropped'],
+            'last_batch_size': stats['last_batch_size'],
+            'max_batch_size': stats['max_batch_size'],
+            'avg_batch_size': round((stats['rows'] / batches) if batches else 0, 2),
+            'last_write_ms': round(stats['last_write_ms'], 2),
+            'max_write_ms': round(stats['max_write_ms'], 2),
+            'avg_write_ms': round((stats['total_write_ms'] / batches) if batches else 0, 2)
+        }
+
+
+# 全局刷新写入队列
+refresh_writer = RefreshWriter()
+
+
+def refresh_funds(funds, flush_timeout=60):
+    """
+    刷新一组基金的实时数据：抓取引擎并发获取，每个基金获取完成后立即放入写入队列
+    抓取线程不接触数据库会话，写入由刷新队列的写入线程按批次完成
+    :param funds: {fund_code: fund_id}
+    :param flush_timeout: 等待写入完成的最长时间（秒）
+    :return: 统计 {'total', 'queued', 'failed', 'flushed', 'elapsed'}
+    """
+    start = time.time()
+    # 先通过多基金估值接口批量获取估值，批量获取已尝试过的基金（包括失败的）逐个抓取时不再重复请求
+    valuations = DataFetcher.get_fund_valuation_batch(list(funds))
+
+    def fetch_and_submit(fund_code):
+        data = fetch_fund_snapshot(fund_code, valuations)
+        if not data:
+            return False
+        row = {key: value for key, value in data.items() if key != 'fund_code'}
+        row['fund_id'] = funds[fund_code]
+        return refresh_writer.submit(row)
+
+    def on_error(fund_code, e):
+        logger.error("获取基金 %s 数据失败: %s", fund_code, e)
+        return False
+
+    results = fetch_engine.map(fetch_and_submit, list(funds), on_error=on_error)
+    queued = sum(1 for ok in results.values() if ok)
+    flushed = refresh_writer.flush(timeout=flush_timeout)
+
+    return {
+        'total': len(funds),
+        'queued': queued,
+        'failed': len(funds) - queued,
+        'flushed': flushed,
+        'elapsed': round(time.time() - start, 2)
+    }
@@ -0,0 +1,114 @@
+import threading
+from functools import wraps
+
+# 已注册的合并请求组，用于统计信息查询
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _Call:
+    """
+    一次正在进行的调用，后到的调用方等待它完成并共享结果
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    请求合并：相同键的并发调用只执行一次，其余调用方等待并共享同一个结果（或异常）
+    调用完成后立即移除，不做缓存，缓存由 TTLCache 负责
+    """
+
+    def __init__(self, name):
+        """
+        :param name: 名称（用于统计）
+        """
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0  # 实际执行的次数
+        self.shared = 0  # 共享其他调用结果的次数
+
+        with _registry_lock:
+            _registry[name] = self
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        执行 func(*args, **kwargs)，如果相同键的调用正在进行则等待其结果
+        :param key: 合并键
+        :param func: 实际执行的函数
+        :return: 函数返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        """
+        获取统计信息
+        :return: 统计字典
+        """
+        with self._lock:
+            return {
+                'name': self.name,
+                'in_flight': len(self._calls),
+                'calls': self.calls,
+                'shared': self.shared
+            }
+
+
+def get_flight_stats():
+    """
+    获取所有已注册合并请求组的统计信息
+    :return: {name: stats}
+    """
+    with _registry_lock:
+        flights = list(_registry.values())
+    return {flight.name: flight.stats() for flight in flights}
+
+
+def single_flight(name, key_func=None):
+    """
+    请求合并装饰器：相同参数的并发调用共享同一次执行
+    :param name: 名称（用于统计）
+    :param key_func: 根据参数计算合并键的函数，默认使用全部参数
+    """
+    def decorator(func):
+        flight = SingleFlight(name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs) if key_func else args + tuple(sorted(kwargs.items()))
+            return flight.do(key, func, *args, **kwargs)
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,185 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# A股交易时段（上午、下午）
+TRADING_SESSIONS = (((9, 30), (11, 30)), ((13, 0), (15, 0)))
+
+# 收盘时间
+MARKET_CLOSE = (15, 0)
+
+# 沪深交易所休市日（只列出周一至周五的休市日）
+# 调休上班的周末交易所照常休市，因此不存在周末交易日，周末一律视为非交易日
+# 扩展方法：每年年底交易所公布次年休市安排后，按下面的格式追加一个年份段（只列周一至周五的休市日），
+# 该年份即被视为已覆盖；没有任何休市日条目的年份视为未覆盖
+MARKET_HOLIDAYS = {
+    # 2024年
+    '2024-01-01',
+    '2024-02-09', '2024-02-12', '2024-02-13', '2024-02-14', '2024-02-15', '2024-02-16',
+    '2024-04-04', '2024-04-05',
+    '2024-05-01', '2024-05-02', '2024-05-03',
+    '2024-06-10',
+    '2024-09-16', '2024-09-17',
+    '2024-10-01', '2024-10-02', '2024-10-03', '2024-10-04', '2024-10-07',
+    # 2025年
+    '2025-01-01',
+    '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31', '2025-02-03', '2025-02-04',
+    '2025-04-04',
+    '2025-05-01', '2025-05-02', '2025-05-05',
+    '2025-06-02',
+    '2025-10-01', '2025-10-02', '2025-10-03', '2025-10-06', '2025-10-07', '2025-10-08',
+    # 2026年
+    '2026-01-01', '2026-01-02',
+    '2026-02-16', '2026-02-17', '2026-02-18', '2026-02-19', '2026-02-20', '2026-02-23',
+    '2026-04-06',
+    '2026-05-01', '2026-05-04', '2026-05-05',
+    '2026-06-19',
+    '2026-09-25',
+    '2026-10-01', '2026-10-02', '2026-10-05', '2026-10-06', '2026-10-07',
+}
+
+# 休市日表覆盖的年份
+CALENDAR_YEARS = frozenset(int(day[:4]) for day in MARKET_HOLIDAYS)
+
+# 已提示过休市日表未覆盖的年份（每个年份只记录一次错误日志）
+_warned_years = set()
+_warned_lock = threading.Lock()
+
+
+def _check_coverage(day):
+    """
+    休市日表未覆盖该年份时记录错误日志：此时只能按周一至周五判断交易日，
+    春节、国庆等长假会被误判为交易日，需要在 MARKET_HOLIDAYS 中补充该年份的休市日
+    """
+    year = day.year
+    if year in CALENDAR_YEARS or year in _warned_years:
+        return
+    with _warned_lock:
+        if year in _warned_years:
+            return
+        _warned_years.add(year)
+    logger.error("交易日历未包含 %d 年的休市日（已覆盖: %s），该年份暂按周一至周五均为交易日处理，"
+                 "按交易时段执行的定时任务暂停，请在 trading_calendar.MARKET_HOLIDAYS 中补充", year, sorted(CALENDAR_YEARS))
+
+
+def calendar_covers(day=None):
+    """
+    判断休市日表是否覆盖该日期所在的年份，未覆盖时记录错误日志
+    :param day: 日期（date、datetime 或 'YYYY-MM-DD'），默认今天
+    :return: 是否覆盖
+    """
+    day = _to_date(day)
+    _check_coverage(day)
+    return day.year in CALENDAR_YEARS
+
+
+def _to_date(day):
+    """
+    将 date / datetime / 'YYYY-MM-DD' 统一转换为 date
+    """
+    if day is None:
+        return date.today()
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, str):
+        return datetime.strptime(day[:10], '%Y-%m-%d').date()
+    return day
+
+
+def is_trading_day(day=None):
+    """
+    判断是否为A股交易日（排除周末和法定节假日休市日）
+    休市日表未覆盖的年份记录错误日志，并按周一至周五均为交易日处理
+    :param day: 日期（date、datetime 或 'YYYY-MM-DD'），默认今天
+    :return: 是否为交易日
+    """
+    day = _to_date(day)
+    _check_coverage(day)
+    return day.weekday() < 5 and day.strftime('%Y-%m-%d') not in MARKET_HOLIDAYS
+
+
+def next_trading_day(day=None):
+    """
+    获取指定日期之后的下一个交易日
+    :param day: 日期，默认今天
+    :return: date
+    """
+    day = _to_date(day) + timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def previous_trading_day(day=None):
+    """
+    获取指定日期之前的上一个交易日
+    :param day: 日期，默认今天
+    :return: date
+    """
+    day = _to_date(day) - timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def latest_trading_day(day=None):
+    """
+    获取不晚于指定日期的最近一个交易日
+    :param day: 日期，默认今天
+    :return: date
+    """
+    day = _to_date(day)
+    return day if is_trading_day(day) else previous_trading_day(day)
+
+
+def is_trading_time(now=None, margin_minutes=0):
+    """
+    判断当前是否处于交易时段
+    :param now: 当前时间，默认现在
+    :param margin_minutes: 每个交易时段前后额外放宽的分钟数（用于获取开盘前和收盘后的估值）
+    :return: 是否处于交易时段
+    """
+    now = now or datetime.now()
+    if not is_trading_day(now):
+        return False
+    margin = timedelta(minutes=margin_minutes)
+    for (start_h, start_m), (end_h, end_m) in TRADING_SESSIONS:
+        start = now.replace(hour=start_h, minute=start_m, second=0, microsecond=0)
+        end = now.replace(hour=end_h, minute=end_m, second=0, microsecond=0)
+        if start - margin <= now < end + margin:
+            return True
+    return False
+
+
+def is_after_close(now=None):
+    """
+    判断当前是否为交易日收盘之后
+    :param now: 当前时间，默认现在
+    :return: 是否为交易日收盘后
+    """
+    now = now or datetime.now()
+    close_h, close_m = MARKET_CLOSE
+    return is_trading_day(now) and (now.hour, now.minute) >= (close_h, close_m)
+
+
+def next_session_start(now=None):
+    """
+    计算当前或下一个交易时段的开始时间
+    :param now: 当前时间，默认现在
+    :return: (是否处于交易时段, 当前或下一个交易时段开始时间)
+    """
+    now = now or datetime.now()
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if is_trading_day(day):
+        for (start_h, start_m), (end_h, end_m) in TRADING_SESSIONS:
+            start = day.replace(hour=start_h, minute=start_m)
+            end = day.replace(hour=end_h, minute=end_m)
+            if start <= now < end:
+                return True, start
+            if now < start:
+                return False, start
+    (start_h, start_m), _ = TRADING_SESSIONS[0]
+    next_day = next_trading_day(day)
+    return False, datetime(next_day.year, next_day.month, next_day.day, start_h, start_m)
@@ -0,0 +1,47 @@
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+
+from config import INTRADAY_REFRESH_MARGIN
+from trading_calendar import calendar_covers, is_trading_day, is_trading_time, is_after_close
+
+logger = logging.getLogger(__name__)
+
+
+def _guard(condition, description, calendar_day=lambda now: now):
+    """
+    生成定时任务守卫装饰器：条件不满足时跳过本次执行
+    休市日表未覆盖所判断日期的年份时同样跳过，不把该年份的节假日当作交易日执行
+    :param condition: 判断函数 condition(now) -> bool
+    :param description: 跳过时的日志说明
+    :param calendar_day: 返回 condition 所判断日期的函数 calendar_day(now)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            now = datetime.now()
+            day = calendar_day(now)
+            if not calendar_covers(day):
+                logger.debug("%s 跳过：交易日历未包含 %d 年的休市日", func.__name__, day.year)
+                return None
+            if not condition(now):
+                logger.debug("%s 跳过：%s", func.__name__, description)
+                return None
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# 只在交易时段（前后放宽 INTRADAY_REFRESH_MARGIN 分钟）执行，用于盘中估值刷新
+trading_hours_only = _guard(
+    lambda now: is_trading_time(now, margin_minutes=INTRADAY_REFRESH_MARGIN),
+    '当前不在交易时段'
+)
+
+# 只在交易日收盘后执行，用于等待当日净值公布
+after_close_only = _guard(is_after_close, '今天不是交易日或尚未收盘')
+
+# 只在前一天是交易日时执行，用于凌晨同步前一交易日公布的净值
+after_trading_day = _guard(lambda now: is_trading_day(now - timedelta(days=1)), '前一天不是交易日',
+                           calendar_day=lambda now: now - timedelta(days=1))
+
@@ -0,0 +1,190 @@
+import queue
+import threading
+
+from config import SSE_SUBSCRIBER_QUEUE_SIZE
+from models import Fund, SessionLocal
+from refresh_pipeline import refresh_writer
+
+# 推送给订阅方的字段
+VALUATION_FIELDS = ('estimate_net_value', 'estimate_change_rate', 'daily_change_rate')
+
+
+class Subscription:
+    """
+    一个推送通道的订阅：订阅的基金代码集合（为空表示全部）和待发送的变化队列
+    """
+
+    def __init__(self, codes=None, maxsize=SSE_SUBSCRIBER_QUEUE_SIZE):
+        self.codes = set(codes) if codes else None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def wants(self, fund_code):
+        return self.codes is None or fund_code in self.codes
+
+
+class ValuationBroker:
+    """
+    估值变化推送中心
+    监听刷新队列的写入结果，与上次推送的值比较，只把发生变化的估值字段按基金代码分发给订阅方。
+    所有客户端共享同一个后台刷新，客户端连接本身不会触发第三方请求。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._last = {}  # fund_code -> {字段: 值}
+        self._codes_by_id = {}  # fund_id -> fund_code
+        self.sequence = 0
+        self.published = 0
+
+    def subscribe(self, codes=None):
+        """
+        新建订阅
+        :param codes: 基金代码列表，为空时订阅全部基金
+        :return: Subscription
+        """
+        subscription = Subscription(codes)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscribed_codes(self):
+        """
+        获取当前被订阅的基金代码
+        :return: (是否有订阅全部基金的订阅方, 基金代码集合)
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        codes = set()
+        for subscription in subscribers:
+            if subscription.codes is None:
+                return True, set()
+            codes |= subscription.codes
+        return False, codes
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def _fund_codes(self, fund_ids):
+        """
+        将 fund_id 转换为基金代码，未知的 fund_id 查询数据库后缓存
+        """
+        missing = [fund_id for fund_id in fund_ids if fund_id not in self._codes_by_id]
+        if missing:
+            db = SessionLocal()
+            try:
+                for fund_id, fund_code in db.query(Fund.id, Fund.fund_code).filter(Fund.id.in_(missing)):
+                    self._codes_by_id[fund_id] = fund_code
+            finally:
+                db.close()
+        return self._codes_by_id
+
+    def on_rows(self, rows):
+        """
+        刷新队列写入回调：计算估值字段的变化并分发
+        :param rows: 已写入的 FundRealtimeData 字段字典列表
+        """
+        if not self.has_subscribers():
+            return
+        codes_by_id = self._fund_codes({row['fund_id'] for row in rows})
+
+        changes = {}
+        with self._lock:
+            for row in rows:
+                fund_code = codes_by_id.get(row['fund_id'])
+                if not fund_code:
+                    continue
+                last = self._last.setdefault(fund_code, {})
+                delta = {
+                    field: row[field] for field in VALUATION_FIELDS
+                    if field in row and last.get(field) != row[field]
+                }
+                if delta:
+                    last.update(delta)
+                    changes.setdefault(fund_code, {}).update(delta)
+            if not changes:
+                return
+            self.sequence += 1
+            sequence = self.sequence
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            payload = {code: delta for code, delta in changes.items() if subscription.wants(code)}
+            if not payload:
+                continue
+            try:
+                subscription.queue.put_nowait((sequence, payload))
+                self.published += 1
+            except queue.Full:
+                # 客户端消费过慢时丢弃本次变化，客户端可根据 id 不连续重新获取快照
+                subscription.dropped += 1
+
+    def seed(self, snapshot):
+        """
+        用数据库中的当前值初始化比较基准，避免新订阅后的第一次写入推送未变化的字段
+        已有比较基准的字段不覆盖（可能比数据库读取的更新）
+        :param snapshot: {fund_code: {字段: 值}}
+        """
+        with self._lock:
+            for fund_code, values in snapshot.items():
+                last = self._last.setdefault(fund_code, {})
+                for field, value in values.items():
+                    last.setdefault(field, value)
+
+    def stats(self):
+        """
+        获取推送统计
+        :return: 统计字典
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+            return {
+                'subscribers': len(subscribers),
+                'sequence': self.sequence,
+                'published': self.published,
+                'tracked_funds': len(self._last),
+                'queued': sum(subscription.queue.qsize() for subscription in subscribers),
+                'dropped': sum(subscription.dropped for subscription in subscribers)
+            }
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    格式化一条 Server-Sent Events 消息
+    :param data: 已序列化的数据
+    :param event: 事件类型
+    :param event_id: 事件ID
+    :return: 消息文本
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+def iter_events(subscription, heartbeat):
+    """
+    逐条产出订阅的变化，超过 heartbeat 秒没有变化时产出 None（用于发送心跳）
+    :param subscription: 订阅
+    :param heartbeat: 心跳间隔（秒）
+    :return: 生成器，产出 (事件ID, {fund_code: 变化字段}) 或 None
+    """
+    while True:
+        try:
+            yield subscription.queue.get(timeout=heartbeat)
+        except queue.Empty:
+            yield None
+
+
+# 全局估值推送中心，刷新队列每批写入成功后计算变化
+valuation_broker = ValuationBroker()
+refresh_writer.add_listener(valuation_broker.on_rows)
@@ -30,6 +30,17 @@ CREATE TABLE IF NOT EXISTS fund_realtime_data (
 
 CREATE INDEX IF NOT EXISTS ix_fund_realtime_data_fund_id ON fund_realtime_data(fund_id);
 
+-- 基金历史净值表
+CREATE TABLE IF NOT EXISTS fund_nav_history (
+    fund_id INTEGER NOT NULL,
+    date VARCHAR(10) NOT NULL,
+    unit_nav REAL,
+    cumulative_nav REAL,
+    change_rate REAL,
+    PRIMARY KEY (fund_id, date),
+    FOREIGN KEY (fund_id) REFERENCES fund(id)
+);
+
 -- 基金持仓表
 CREATE TABLE IF NOT EXISTS fund_holding (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
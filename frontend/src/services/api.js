@@ -32,6 +32,33 @@ function isCacheValid(cacheItem) {
   return cacheItem.data && Date.now() - cacheItem.timestamp < cache.expiry;
 }
 
+// 将紧凑格式（按列存储、日期差分编码）的历史净值还原为对象数组
+function expandHistory(historyData) {
+  if (!historyData || historyData.net_values_format !== "columnar") {
+    return historyData;
+  }
+  const columns = historyData.net_values;
+  let dates = columns.date;
+  if (!dates) {
+    const day = new Date(`${columns.start_date}T00:00:00Z`);
+    dates = columns.date_delta.map((delta) => {
+      day.setUTCDate(day.getUTCDate() + delta);
+      return day.toISOString().slice(0, 10);
+    });
+  }
+  const netValues = dates.map((date, i) => ({
+    date,
+    unit_net_value: columns.unit_net_value[i],
+    cumulative_net_value: columns.cumulative_net_value[i],
+    change_rate: columns.change_rate[i],
+  }));
+  const { net_values_format, ...rest } = historyData;
+  return { ...rest, net_values: netValues };
+}
+
+// 历史净值使用紧凑格式传输
+const COMPACT_HISTORY_PARAMS = { params: { format: "compact", dates: "delta" } };
+
 export const fundApi = {
   search: (keyword, signal) =>
     api.get(`/fund/search?keyword=${encodeURIComponent(keyword)}`, { signal }),
@@ -47,7 +74,8 @@ export const fundApi = {
       return { data: cache.fundHistory.data[fundCode] };
     }
     // 缓存无效，请求新数据
-    const response = await api.get(`/fund/${fundCode}/history`);
+    const response = await api.get(`/fund/${fundCode}/history`, COMPACT_HISTORY_PARAMS);
+    response.data = expandHistory(response.data);
     // 更新缓存
     cache.fundHistory.data[fundCode] = response.data;
     cache.fundHistory.timestamp[fundCode] = now;
@@ -70,7 +98,8 @@ export const fundApi = {
       };
     }
     // 缓存无效，请求新数据
-    const response = await api.get(`/fund/${fundCode}/complete`);
+    const response = await api.get(`/fund/${fundCode}/complete`, COMPACT_HISTORY_PARAMS);
+    response.data.history_data = expandHistory(response.data.history_data);
     // 更新缓存
     if (response.data.history_data) {
       cache.fundHistory.data[fundCode] = response.data.history_data;